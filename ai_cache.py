@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Persistent cache of AI responses, keyed on provider, model settings and the normalized prompt
+AI_CACHE_ENABLED = os.getenv("AI_CACHE_ENABLED", "true").lower() == "true"
+AI_CACHE_FILE = os.getenv("AI_CACHE_FILE", "ai_cache.sqlite3")
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", str(7 * 24 * 3600)))     # Seconds before an entry expires
+AI_CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "2000"))  # Least recently used entries are evicted beyond this
+
+_connection = None
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'expired': 0, 'stores': 0, 'evictions': 0}
+
+def _get_connection():
+    """Open the cache database on first use (caller holds the lock)"""
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(AI_CACHE_FILE, check_same_thread=False)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        _connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        _connection.commit()
+    return _connection
+
+def normalize_prompt(prompt):
+    """Collapse whitespace so prompts that only differ in formatting share an entry"""
+    return " ".join(prompt.split())
+
+def make_cache_key(provider, settings, prompt):
+    """Build a stable cache key from the provider, its model settings and the normalized prompt"""
+    material = json.dumps({
+        "provider": provider,
+        "settings": settings,
+        "prompt": normalize_prompt(prompt),
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+def get_cached_response(key):
+    """Return the cached response for a key, or None on a miss or expired entry"""
+    now = time.time()
+    with _lock:
+        connection = _get_connection()
+        row = connection.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            _stats['misses'] += 1
+            return None
+
+        response, created = row
+        if now - created > AI_CACHE_TTL:
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            connection.commit()
+            _stats['expired'] += 1
+            _stats['misses'] += 1
+            return None
+
+        connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        connection.commit()
+        _stats['hits'] += 1
+        return response
+
+def store_response(key, response):
+    """Store a response and evict the least recently used entries beyond the size cap"""
+    now = time.time()
+    with _lock:
+        connection = _get_connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO responses (key, response, created, last_access) VALUES (?, ?, ?, ?)",
+            (key, response, now, now))
+        _stats['stores'] += 1
+
+        count = connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > AI_CACHE_MAX_ENTRIES:
+            evicted = connection.execute("""
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY last_access ASC LIMIT ?
+                )
+            """, (count - AI_CACHE_MAX_ENTRIES,)).rowcount
+            _stats['evictions'] += evicted
+        connection.commit()
+
+def get_cache_stats():
+    """Hit/miss counters and current size of the cache"""
+    with _lock:
+        stats = dict(_stats, enabled=AI_CACHE_ENABLED)
+        if AI_CACHE_ENABLED and _connection is not None:
+            stats['entries'] = _connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else None
+    return stats
@@ -0,0 +1,214 @@
+import os
+import time
+import threading
+from dotenv import load_dotenv
+from http_utils import http_request
+from slack_utils import log_to_slack
+
+load_dotenv()
+
+# Routing across several AI backends (Ollama hosts, OpenAI as overflow)
+AI_ROUTER_MAX_OUTSTANDING = int(os.getenv("AI_ROUTER_MAX_OUTSTANDING", "2"))       # Per Ollama host, ~OLLAMA_NUM_PARALLEL
+AI_ROUTER_FAILURE_THRESHOLD = int(os.getenv("AI_ROUTER_FAILURE_THRESHOLD", "3"))  # Consecutive failures that open the circuit
+AI_ROUTER_COOLDOWN = float(os.getenv("AI_ROUTER_COOLDOWN", "30"))                 # Seconds before an open circuit is retried
+AI_ROUTER_HEALTH_INTERVAL = float(os.getenv("AI_ROUTER_HEALTH_INTERVAL", "30"))   # Seconds between health checks, 0 = off
+AI_ROUTER_SLOW_FACTOR = float(os.getenv("AI_ROUTER_SLOW_FACTOR", "3"))            # Demote hosts this much slower than the fastest
+LATENCY_EWMA_WEIGHT = 0.3  # Weight of the newest sample in the moving latency average
+
+class Backend:
+    """
+    One AI endpoint. `call(prompt, json_format)` returns the reply text (or an "[ERROR ...]"
+    string for answers the backend refused) and raises on timeouts and connection errors.
+    """
+
+    def __init__(self, name, call, max_outstanding=None, health_url=None):
+        self.name = name
+        self.call = call
+        self.max_outstanding = max_outstanding  # None = unlimited
+        self.health_url = health_url
+        self.outstanding = 0
+        self.ewma_latency = None
+        self.consecutive_failures = 0
+        self.open_until = 0.0     # Circuit open (backend skipped) until this time
+        self.half_open = False    # One trial request in flight after the cooldown
+        self.trial = None         # Ticket of that trial request
+        self.healthy = True
+        self.requests = 0
+        self.failures = 0
+        self.error_replies = 0
+        self.total_latency = 0.0
+        self.last_error = None
+
+    def available(self, now):
+        """Closed circuit, or cooldown over and no trial request running yet"""
+        if not self.healthy:
+            return False
+        return self.open_until <= now and not self.half_open
+
+    def saturated(self):
+        return self.max_outstanding is not None and self.outstanding >= self.max_outstanding
+
+    def stats(self, now):
+        state = "open" if self.open_until > now else "half-open" if self.half_open else "closed"
+        return {
+            'backend': self.name,
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'failures': self.failures,
+            'error_replies': self.error_replies,
+            'avg_latency': round(self.total_latency / self.requests, 3) if self.requests else None,
+            'ewma_latency': round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+            'circuit': state,
+            'healthy': self.healthy,
+            'last_error': self.last_error,
+        }
+
+class AIRouter:
+    """
+    Send each prompt to the least loaded healthy backend and fail over to the next one.
+
+    Order of preference: primaries below their outstanding limit (fewest outstanding requests,
+    then lowest latency, hosts much slower than the fastest last), then the overflow backend,
+    then saturated primaries. Timeouts and connection errors count towards the circuit breaker.
+    """
+
+    def __init__(self, primaries, overflow=None, is_error=lambda reply: False):
+        self.primaries = list(primaries)
+        self.overflow = overflow
+        self.is_error = is_error
+        self._lock = threading.Lock()
+        self._health_thread = None
+
+    def _backends(self):
+        return self.primaries + ([self.overflow] if self.overflow else [])
+
+    def _ranked(self):
+        """Backends to try, best first (caller holds the lock)"""
+        now = time.monotonic()
+        primaries = [backend for backend in self.primaries if backend.available(now)]
+        known = [backend.ewma_latency for backend in primaries if backend.ewma_latency is not None]
+        fastest = min(known) if known else None
+
+        def slow(backend):
+            return (fastest is not None and backend.ewma_latency is not None
+                    and backend.ewma_latency > fastest * AI_ROUTER_SLOW_FACTOR)
+
+        def key(backend):
+            return (slow(backend), backend.outstanding, backend.ewma_latency or 0)
+
+        ranked = sorted((b for b in primaries if not b.saturated()), key=key)
+        if self.overflow and self.overflow.available(now):
+            ranked.append(self.overflow)
+        ranked.extend(sorted((b for b in primaries if b.saturated()), key=key))
+        if not ranked:
+            # Everything is open: try the backend whose cooldown ends first rather than failing outright
+            waiting = [b for b in self._backends() if b.healthy and not b.half_open] or self._backends()
+            ranked = sorted(waiting, key=lambda b: b.open_until)[:1]
+        return ranked
+
+    def _acquire(self, backend):
+        """
+        Count a request as outstanding and return its ticket for _release, or None when refused.
+        A backend with a tripped circuit gets a single trial request.
+        """
+        with self._lock:
+            if backend.half_open:
+                return None  # Another thread is already probing it
+            ticket = object()
+            if backend.consecutive_failures >= AI_ROUTER_FAILURE_THRESHOLD:
+                backend.half_open = True  # This request decides whether the circuit closes
+                backend.trial = ticket
+            backend.outstanding += 1
+            backend.requests += 1
+            return ticket
+
+    def _release(self, backend, ticket, latency, error=None, error_reply=False):
+        with self._lock:
+            backend.outstanding -= 1
+            if backend.trial is ticket:
+                # Only the trial ends the half-open state; requests sent before the circuit opened do not
+                backend.half_open = False
+                backend.trial = None
+            backend.total_latency += latency
+            if error is not None:
+                backend.failures += 1
+                backend.consecutive_failures += 1
+                backend.last_error = error[:200]
+                if backend.consecutive_failures >= AI_ROUTER_FAILURE_THRESHOLD:
+                    backend.open_until = time.monotonic() + AI_ROUTER_COOLDOWN
+                return
+            backend.consecutive_failures = 0
+            backend.open_until = 0.0
+            if error_reply:
+                backend.error_replies += 1
+                return  # The backend is up, but its answer tells us nothing about its speed
+            if backend.ewma_latency is None:
+                backend.ewma_latency = latency
+            else:
+                backend.ewma_latency += LATENCY_EWMA_WEIGHT * (latency - backend.ewma_latency)
+
+    def ask(self, prompt, json_format=False):
+        """Return (reply, backend_name); the reply is the last error if every backend failed"""
+        self._ensure_health_checks()
+        with self._lock:
+            ranked = self._ranked()
+        last_reply = "[ERROR: No AI backend available]"
+        last_name = None
+        for backend in ranked:
+            ticket = self._acquire(backend)
+            if ticket is None:
+                continue
+            start = time.monotonic()
+            try:
+                reply = backend.call(prompt, json_format)
+            except Exception as e:
+                self._release(backend, ticket, time.monotonic() - start, error=f"{type(e).__name__}: {e}")
+                log_to_slack(f"🔀 {backend.name} failed ({type(e).__name__}) - trying the next backend")
+                last_reply = f"[ERROR from {backend.name}: {e}]"
+                last_name = backend.name
+                continue
+            error_reply = self.is_error(reply)
+            self._release(backend, ticket, time.monotonic() - start, error_reply=error_reply)
+            if not error_reply:
+                return reply, backend.name
+            last_reply, last_name = reply, backend.name
+        return last_reply, last_name
+
+    def check_health(self):
+        """Probe every backend with a health URL; a failed probe opens its circuit"""
+        for backend in self._backends():
+            if not backend.health_url:
+                continue
+            try:
+                response = http_request("ollama", "GET", backend.health_url, timeout=(2, 5), retries=0)
+                healthy = response.status_code == 200
+            except Exception:
+                healthy = False
+            with self._lock:
+                if healthy and not backend.healthy:
+                    log_to_slack(f"💚 {backend.name} is healthy again")
+                elif not healthy and backend.healthy:
+                    log_to_slack(f"💔 {backend.name} failed its health check - taking it out of rotation")
+                backend.healthy = healthy
+                if healthy and backend.open_until > time.monotonic():
+                    backend.open_until = time.monotonic()  # Let the next request probe it right away
+
+    def _health_loop(self):
+        while True:
+            time.sleep(AI_ROUTER_HEALTH_INTERVAL)
+            self.check_health()
+
+    def _ensure_health_checks(self):
+        """Start the background health checker on first use"""
+        if self._health_thread is None and AI_ROUTER_HEALTH_INTERVAL > 0:
+            with self._lock:
+                if self._health_thread is None:
+                    self._health_thread = threading.Thread(target=self._health_loop, name="ai-router-health",
+                                                           daemon=True)
+                    self._health_thread.start()
+
+    def stats(self):
+        """Per-backend load, latency, failures and circuit state"""
+        now = time.monotonic()
+        with self._lock:
+            return [backend.stats(now) for backend in self._backends()]
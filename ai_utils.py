@@ -1,10 +1,22 @@
 import os
 import re
+import json
 import time
+import threading
 import requests
 from dotenv import load_dotenv
-from trello_utils import comment_on_card, update_card_description, set_card_labels
+from http_utils import http_request
+from ai_cache import AI_CACHE_ENABLED, make_cache_key, get_cached_response, store_response
+from metadata_classifier import (FIELDS as METADATA_FIELDS, SOURCE_FIELD as METADATA_SOURCE_FIELD, infer_context,
+                                 learn_from_card, format_context_block, parse_context_block, with_source,
+                                 extract_context_from_description)
+from summary_store import latest_comments
+from trello_writer import queue_comment, queue_description_update, queue_labels
 from slack_utils import log_to_slack
+from ai_router import AIRouter, Backend, AI_ROUTER_MAX_OUTSTANDING
+from prompt_budget import estimate_tokens, fit_sections, pick_num_ctx, MIN_SECTION_TOKENS
+from metrics import observe_stage
+from tracing import span
 
 load_dotenv()
 
@@ -16,12 +28,34 @@ OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
 
 # Ollama-specific optimizations
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+# Several Ollama boxes (comma separated) are load balanced by ai_router, OpenAI can take the overflow
+OLLAMA_HOSTS = [host.strip().rstrip("/") for host in os.getenv("OLLAMA_HOSTS", OLLAMA_HOST).split(",") if host.strip()]
+AI_ROUTER_OVERFLOW = os.getenv("AI_ROUTER_OVERFLOW", "false").lower() == "true"
 OLLAMA_TEMPERATURE = float(os.getenv("OLLAMA_TEMPERATURE", "0.3"))
 OLLAMA_TOP_P = float(os.getenv("OLLAMA_TOP_P", "0.9"))
 OLLAMA_TOP_K = int(os.getenv("OLLAMA_TOP_K", "40"))
 OLLAMA_REPEAT_PENALTY = float(os.getenv("OLLAMA_REPEAT_PENALTY", "1.1"))
 OLLAMA_MAX_TOKENS = int(os.getenv("OLLAMA_MAX_TOKENS", "2048"))
 
+# Streaming mode reads tokens as they are generated and drops the <think> section on the fly
+OLLAMA_STREAM = os.getenv("OLLAMA_STREAM", "true").lower() == "true"
+OLLAMA_FIRST_TOKEN_TIMEOUT = float(os.getenv("OLLAMA_FIRST_TOKEN_TIMEOUT", "30"))  # Includes model load time
+OLLAMA_TOTAL_TIMEOUT = float(os.getenv("OLLAMA_TOTAL_TIMEOUT", "180"))
+
+# Session mode: keep the model loaded between sparse webhooks and warm it up at startup
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # "10m", "24h", seconds, "-1" = forever, "" = Ollama default
+OLLAMA_PREWARM = os.getenv("OLLAMA_PREWARM", "true").lower() == "true"
+OLLAMA_COLD_LOAD_MS = 500  # A call whose load_duration exceeds this had to load the model
+
+# Prompt budgeting: card text is trimmed to fit the context window, num_ctx follows the real prompt size
+OLLAMA_DYNAMIC_NUM_CTX = os.getenv("OLLAMA_DYNAMIC_NUM_CTX", "true").lower() == "true"
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", "0"))  # Tokens of card text per prompt, 0 = derive from the model
+PROMPT_TEMPLATE_TOKENS = 400  # Instructions, metadata and title around the card text
+OPENAI_CONTEXT_TOKENS = 16384
+
+# Ask for metadata and advice in one JSON-formatted generation for cards without metadata
+COMBINED_PROMPT_MODE = os.getenv("COMBINED_PROMPT_MODE", "false").lower() == "true"
+
 PROJECT_CONTEXT = """
 You are assisting with a game development project built in Unreal Engine.
 Provide concise, technical, and actionable advice. Focus on practical implementation steps.
@@ -42,100 +76,337 @@ Provide concise, technical, and actionable advice. Focus on practical implementa
 Assume Trello tasks may relate to AI, UI, animation, loot, multiplayer, or level design within this framework.
 """
 
-def ask_ollama(prompt):
+def build_ollama_payload(prompt, stream=False, json_format=False):
     """
-    Optimized Ollama function with deepseek-r1 specific parameters
+    Build the /api/generate payload with model-specific optimizations
     """
-    start_time = time.time()
-    
-    try:
-        # Model-specific optimizations
-        if OLLAMA_MODEL.startswith("deepseek-r1"):
-            # deepseek-r1 specific optimizations (works for deepseek-r1, deepseek-r1:7b, deepseek-r1:3b, etc.)
-            payload = {
-                "model": OLLAMA_MODEL,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": OLLAMA_TEMPERATURE,
-                    "top_p": OLLAMA_TOP_P,
-                    "top_k": OLLAMA_TOP_K,
-                    "repeat_penalty": OLLAMA_REPEAT_PENALTY,
-                    "num_predict": OLLAMA_MAX_TOKENS,
-                    "num_ctx": 8192,  # Context window size
-                    "num_gpu": 1,     # Use GPU if available
-                    "num_thread": 8,  # Optimize threading
-                    "rope_freq_base": 10000,  # Better for coding tasks
-                    "rope_freq_scale": 0.5,
-                }
+    # Model-specific optimizations
+    if OLLAMA_MODEL.startswith("deepseek-r1"):
+        # deepseek-r1 specific optimizations (works for deepseek-r1, deepseek-r1:7b, deepseek-r1:3b, etc.)
+        payload = {
+            "model": OLLAMA_MODEL,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {
+                "temperature": OLLAMA_TEMPERATURE,
+                "top_p": OLLAMA_TOP_P,
+                "top_k": OLLAMA_TOP_K,
+                "repeat_penalty": OLLAMA_REPEAT_PENALTY,
+                "num_predict": OLLAMA_MAX_TOKENS,
+                "num_ctx": 8192,  # Context window size
+                "num_gpu": 1,     # Use GPU if available
+                "num_thread": 8,  # Optimize threading
+                "rope_freq_base": 10000,  # Better for coding tasks
+                "rope_freq_scale": 0.5,
             }
-        elif OLLAMA_MODEL.startswith("llama3.2"):
-            # llama3.2 specific optimizations
-            payload = {
-                "model": OLLAMA_MODEL,
-                "prompt": f"{PROJECT_CONTEXT}\n\n{prompt}",
-                "stream": False,
-                "options": {
-                    "temperature": OLLAMA_TEMPERATURE,
-                    "top_p": OLLAMA_TOP_P,
-                    "top_k": OLLAMA_TOP_K,
-                    "repeat_penalty": OLLAMA_REPEAT_PENALTY,
-                    "num_predict": OLLAMA_MAX_TOKENS,
-                    "num_ctx": 16384,  # Larger context window for llama3.2
-                    "num_gpu": 1,      # Use GPU if available
-                    "num_thread": 12,  # More threads for llama3.2
-                    "rope_freq_base": 500000,  # llama3.2 specific RoPE settings
-                    "rope_freq_scale": 1.0,
-                    "mirostat": 2,     # llama3.2 entropy sampling
-                    "mirostat_tau": 5.0,
-                    "mirostat_eta": 0.1,
-                }
+        }
+    elif OLLAMA_MODEL.startswith("llama3.2"):
+        # llama3.2 specific optimizations
+        payload = {
+            "model": OLLAMA_MODEL,
+            "prompt": f"{PROJECT_CONTEXT}\n\n{prompt}",
+            "stream": stream,
+            "options": {
+                "temperature": OLLAMA_TEMPERATURE,
+                "top_p": OLLAMA_TOP_P,
+                "top_k": OLLAMA_TOP_K,
+                "repeat_penalty": OLLAMA_REPEAT_PENALTY,
+                "num_predict": OLLAMA_MAX_TOKENS,
+                "num_ctx": 16384,  # Larger context window for llama3.2
+                "num_gpu": 1,      # Use GPU if available
+                "num_thread": 12,  # More threads for llama3.2
+                "rope_freq_base": 500000,  # llama3.2 specific RoPE settings
+                "rope_freq_scale": 1.0,
+                "mirostat": 2,     # llama3.2 entropy sampling
+                "mirostat_tau": 5.0,
+                "mirostat_eta": 0.1,
             }
-        else:
-            # Default optimizations for other models
-            payload = {
-                "model": OLLAMA_MODEL,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": OLLAMA_TEMPERATURE,
-                    "top_p": OLLAMA_TOP_P,
-                    "top_k": OLLAMA_TOP_K,
-                    "repeat_penalty": OLLAMA_REPEAT_PENALTY,
-                    "num_predict": OLLAMA_MAX_TOKENS,
-                    "num_ctx": 4096,   # Standard context window
-                    "num_gpu": 1,      # Use GPU if available
-                    "num_thread": 4,   # Standard threading
-                }
+        }
+    else:
+        # Default optimizations for other models
+        payload = {
+            "model": OLLAMA_MODEL,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {
+                "temperature": OLLAMA_TEMPERATURE,
+                "top_p": OLLAMA_TOP_P,
+                "top_k": OLLAMA_TOP_K,
+                "repeat_penalty": OLLAMA_REPEAT_PENALTY,
+                "num_predict": OLLAMA_MAX_TOKENS,
+                "num_ctx": 4096,   # Standard context window
+                "num_gpu": 1,      # Use GPU if available
+                "num_thread": 4,   # Standard threading
             }
+        }
+    
+    # Add system prompt for other models (deepseek-r1, etc.)
+    if not OLLAMA_MODEL.startswith("llama"):
+        payload["system"] = PROJECT_CONTEXT
+    
+    # Constrain the output to valid JSON
+    if json_format:
+        payload["format"] = "json"
+    
+    if OLLAMA_KEEP_ALIVE:
+        keep_alive = OLLAMA_KEEP_ALIVE.strip()
+        payload["keep_alive"] = int(keep_alive) if keep_alive.lstrip("-").isdigit() else keep_alive
+    
+    return payload
+
+class ThinkStripper:
+    """
+    Incrementally removes <think>...</think> sections from streamed model output.
+    Tags split across chunk boundaries are held back until they can be decided.
+    """
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self.in_think = False
+        self.pending = ""
+        self.thinking_chars = 0
+
+    def feed(self, chunk):
+        """Consume a chunk of raw output and return the visible part of it"""
+        text = self.pending + chunk
+        self.pending = ""
+        visible = []
+        while text:
+            tag = self.CLOSE_TAG if self.in_think else self.OPEN_TAG
+            index = text.find(tag)
+            if index >= 0:
+                if self.in_think:
+                    self.thinking_chars += index
+                else:
+                    visible.append(text[:index])
+                text = text[index + len(tag):]
+                self.in_think = not self.in_think
+                continue
+            
+            # Hold back a trailing partial tag (e.g. "</thi") until the next chunk
+            keep = 0
+            for length in range(min(len(tag) - 1, len(text)), 0, -1):
+                if tag.startswith(text[-length:]):
+                    keep = length
+                    break
+            body, self.pending = text[:len(text) - keep], text[len(text) - keep:]
+            if self.in_think:
+                self.thinking_chars += len(body)
+            else:
+                visible.append(body)
+            break
+        return "".join(visible)
+
+    def finish(self):
+        """Return whatever visible text is still held back at the end of the stream"""
+        rest = "" if self.in_think else self.pending
+        self.pending = ""
+        return rest
+
+# Timing of the most recent Ollama call per thread (time-to-first-token, totals and Ollama's own counters);
+# per thread because workers and router hosts generate concurrently
+_last_ollama_timing = threading.local()
+
+# Running totals to compare calls that had to load the model (cold) with calls that found it resident
+_ollama_stats_lock = threading.Lock()
+_ollama_stats = {
+    'calls': 0,
+    'cold_calls': 0,
+    'ttft_cold_total': 0.0,
+    'ttft_warm_total': 0.0,
+    'ttft_warm_calls': 0,
+    'ttft_cold_calls': 0,
+    'prompt_tokens_evaluated': 0,
+    'prewarm': None,
+}
+
+def _record_ollama_timing(timing):
+    """Publish the timing of a finished call and add it to the cold/warm totals"""
+    _last_ollama_timing.value = timing
+    cold = (timing.get("load_duration_ms") or 0) > OLLAMA_COLD_LOAD_MS
+    ttft = timing.get("time_to_first_token")
+    with _ollama_stats_lock:
+        _ollama_stats['calls'] += 1
+        _ollama_stats['cold_calls'] += cold
+        _ollama_stats['prompt_tokens_evaluated'] += timing.get("prompt_eval_count") or 0
+        if ttft is not None:
+            kind = 'cold' if cold else 'warm'
+            _ollama_stats[f'ttft_{kind}_total'] += ttft
+            _ollama_stats[f'ttft_{kind}_calls'] += 1
+
+def _final_counters(final):
+    """Ollama's own counters from the last response object"""
+    return {
+        "prompt_eval_count": final.get("prompt_eval_count"),
+        "eval_count": final.get("eval_count"),
+        "load_duration_ms": round(final.get("load_duration", 0) / 1e6, 1),
+        "prompt_eval_ms": round(final.get("prompt_eval_duration", 0) / 1e6, 1),
+    }
+
+def get_last_ollama_timing():
+    """Timing of the most recent Ollama call made on this thread"""
+    return getattr(_last_ollama_timing, 'value', {})
+
+def get_ollama_stats():
+    """Time-to-first-token of cold vs. warm calls, and how many prompt tokens Ollama had to evaluate"""
+    with _ollama_stats_lock:
+        stats = dict(_ollama_stats)
+    for kind in ('cold', 'warm'):
+        calls = stats.pop(f'ttft_{kind}_calls')
+        total = stats.pop(f'ttft_{kind}_total')
+        stats[f'avg_ttft_{kind}'] = round(total / calls, 3) if calls else None
+    stats['avg_prompt_tokens_evaluated'] = (round(stats['prompt_tokens_evaluated'] / stats['calls'], 1)
+                                            if stats['calls'] else None)
+    stats['keep_alive'] = OLLAMA_KEEP_ALIVE or None
+    return stats
+
+def _ollama_generate(payload, start_time, host, retries=None):
+    """Non-streaming generation: wait for the whole response, then strip <think> sections"""
+    response = http_request(
+        "ollama", "POST", f"{host}/api/generate",
+        json=payload,
+        retries=retries,
+        idempotent=True,        # Generation has no side effects, safe to retry on connection errors
+        retry_timeouts=False,   # ...but a timed out generation would just time out again
+    )
+    
+    if response.status_code != 200:
+        return f"[ERROR from Ollama API: {response.status_code} - {response.text}]"
+    
+    result = response.json()
+    response_text = result.get("response", "").strip()
+    _record_ollama_timing(dict(model=payload["model"], time_to_first_token=None,
+                               total_time=round(time.time() - start_time, 3), **_final_counters(result)))
+    
+    # Remove thinking tags from response
+    return re.sub(r'<think>.*?</think>', '', response_text, flags=re.DOTALL).strip()
+
+def _ollama_stream(payload, start_time, host, retries=None):
+    """
+    Streaming generation: read NDJSON chunks as they arrive and drop the <think> section
+    on the fly. Enforces OLLAMA_FIRST_TOKEN_TIMEOUT (also the stall timeout between chunks)
+    and OLLAMA_TOTAL_TIMEOUT for the whole generation.
+    """
+    deadline = start_time + OLLAMA_TOTAL_TIMEOUT
+    response = http_request(
+        "ollama", "POST", f"{host}/api/generate",
+        json=payload,
+        stream=True,
+        timeout=(5, OLLAMA_FIRST_TOKEN_TIMEOUT),
+        retries=retries,
+        idempotent=True,
+        retry_timeouts=False,
+    )
+    
+    with response:
+        if response.status_code != 200:
+            return f"[ERROR from Ollama API: {response.status_code} - {response.text}]"
         
-        # Add system prompt for other models (deepseek-r1, etc.)
-        if not OLLAMA_MODEL.startswith("llama"):
-            payload["system"] = PROJECT_CONTEXT
-        
-        log_to_slack(f"🤖 Ollama Host: {OLLAMA_HOST}")
-        response = requests.post(
-            f"{OLLAMA_HOST}/api/generate", 
-            json=payload,
-            timeout=60  # Increased timeout for complex responses
-        )
+        stripper = ThinkStripper()
+        parts = []
+        first_token_at = None
+        first_visible_at = None
+        final = {}
         
-        if response.status_code == 200:
-            result = response.json()
-            response_text = result.get("response", "").strip()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                return f"[ERROR from Ollama: {chunk['error']}]"
             
-            # Remove thinking tags from response
-            response_text = re.sub(r'<think>.*?</think>', '', response_text, flags=re.DOTALL).strip()
+            token = chunk.get("response", "")
+            if token:
+                now = time.time()
+                if first_token_at is None:
+                    first_token_at = now
+                visible = stripper.feed(token)
+                if visible:
+                    if first_visible_at is None and visible.strip():
+                        first_visible_at = now
+                    parts.append(visible)
             
-            # Log performance metrics
-            elapsed_time = time.time() - start_time
-            if elapsed_time > 5:  # Log slow responses
-                log_to_slack(f"⏱️ Slow Ollama response ({elapsed_time:.1f}s) for model {OLLAMA_MODEL}")
-            
-            return response_text
+            if chunk.get("done"):
+                final = chunk
+                break
+            if time.time() > deadline:
+                # Raised like the transport timeouts, so the router counts a host that streams too slowly
+                raise requests.exceptions.ReadTimeout(
+                    f"Ollama generation exceeded total timeout of {OLLAMA_TOTAL_TIMEOUT:.0f}s")
+        
+        parts.append(stripper.finish())
+    
+    timing = {
+        "model": payload["model"],
+        "time_to_first_token": round(first_token_at - start_time, 3) if first_token_at else None,
+        "time_to_first_visible_token": round(first_visible_at - start_time, 3) if first_visible_at else None,
+        "total_time": round(time.time() - start_time, 3),
+        "thinking_chars_dropped": stripper.thinking_chars,
+        **_final_counters(final),
+    }
+    _record_ollama_timing(timing)
+    log_to_slack(
+        f"⚡ Ollama {payload['model']}: first token {timing['time_to_first_token']}s, "
+        f"first answer token {timing['time_to_first_visible_token']}s, "
+        f"total {timing['total_time']}s, {stripper.thinking_chars} thinking chars skipped, "
+        f"{timing['prompt_eval_count']} prompt tokens evaluated, model load {timing['load_duration_ms']}ms"
+    )
+    
+    if stripper.in_think:
+        return "[ERROR from Ollama: generation ended inside a <think> block - raise OLLAMA_MAX_TOKENS]"
+    return "".join(parts).strip()
+
+def _ollama_call(prompt, json_format=False, host=None, retries=None):
+    """
+    Ask one Ollama host; timeouts and connection errors are raised (the router fails over on them).
+    The router passes retries=0: it decides itself whether to retry or use another backend.
+    """
+    host = host or OLLAMA_HOST
+    start_time = time.time()
+    payload = build_ollama_payload(prompt, stream=OLLAMA_STREAM, json_format=json_format)
+    _apply_num_ctx(payload, host)
+    
+    log_to_slack(f"🤖 Ollama Host: {host}")
+    with span("ollama generate", host=host, model=OLLAMA_MODEL, num_ctx=payload["options"].get("num_ctx")):
+        if OLLAMA_STREAM:
+            response_text = _ollama_stream(payload, start_time, host, retries)
         else:
-            return f"[ERROR from Ollama API: {response.status_code} - {response.text}]"
-            
+            response_text = _ollama_generate(payload, start_time, host, retries)
+    
+    # Log performance metrics
+    elapsed_time = time.time() - start_time
+    if elapsed_time > 5:  # Log slow responses
+        log_to_slack(f"⏱️ Slow Ollama response ({elapsed_time:.1f}s) for model {OLLAMA_MODEL} on {host}")
+    
+    return response_text
+
+_num_ctx_by_host = {}
+_num_ctx_lock = threading.Lock()
+
+def _apply_num_ctx(payload, host):
+    """
+    Size num_ctx to the prompt plus the answer instead of always using the model's largest window.
+    Per host it only ever grows, because Ollama reloads the model when num_ctx changes.
+    """
+    if not OLLAMA_DYNAMIC_NUM_CTX:
+        return
+    options = payload["options"]
+    needed = (estimate_tokens(payload.get("system", "")) + estimate_tokens(payload["prompt"])
+              + options["num_predict"] + 64)  # Chat template tokens
+    with _num_ctx_lock:
+        num_ctx = pick_num_ctx(needed, options["num_ctx"], current=_num_ctx_by_host.get(host))
+        _num_ctx_by_host[host] = num_ctx
+    if needed > num_ctx:
+        log_to_slack(f"⚠️ Prompt needs ~{needed} tokens but {OLLAMA_MODEL} is limited to num_ctx {num_ctx}")
+    options["num_ctx"] = num_ctx
+
+def ask_ollama(prompt, json_format=False, host=None):
+    """
+    Optimized Ollama function with deepseek-r1 specific parameters
+    """
+    try:
+        return _ollama_call(prompt, json_format=json_format, host=host)
     except requests.exceptions.Timeout:
         return "[ERROR: Ollama request timed out - model may be processing a complex request]"
     except requests.exceptions.ConnectionError:
@@ -143,64 +414,203 @@ def ask_ollama(prompt):
     except Exception as e:
         return f"[ERROR from Ollama: {e}]"
 
-def ask_openai(prompt):
+def prewarm_ollama():
+    """
+    Load the model and evaluate the PROJECT_CONTEXT prefix on every Ollama host before the first
+    webhook arrives. Ollama keeps the evaluated prefix for the next prompt that starts with it,
+    and the model stays resident for OLLAMA_KEEP_ALIVE.
+    """
+    if AI_PROVIDER.lower() != "ollama":
+        return None
+    results = {}
+    for host in OLLAMA_HOSTS:
+        payload = build_ollama_payload("")
+        _apply_num_ctx(payload, host)  # Load with the window real prompts will ask for
+        payload["options"]["num_predict"] = 1  # Runtime option only - does not force a model reload
+        start_time = time.time()
+        try:
+            response = http_request(
+                "ollama", "POST", f"{host}/api/generate",
+                json=payload,
+                timeout=(5, OLLAMA_TOTAL_TIMEOUT),
+                idempotent=True,
+                retry_timeouts=False,
+            )
+            response.raise_for_status()
+            result = dict(total_time=round(time.time() - start_time, 3), **_final_counters(response.json()))
+        except Exception as e:
+            log_to_slack(f"⚠️ Ollama prewarm failed on {host}: {e}")
+            continue
+        results[host] = result
+        log_to_slack(f"🔥 Ollama {OLLAMA_MODEL} prewarmed on {host} in {result['total_time']}s "
+                     f"(model load {result['load_duration_ms']}ms, {result['prompt_eval_count']} prefix tokens evaluated)")
+    with _ollama_stats_lock:
+        _ollama_stats['prewarm'] = results
+    return results
+
+def build_openai_payload(prompt, json_format=False):
+    """Build the chat completions payload"""
+    payload = {
+        "model": OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": "You are a helpful AI assistant for game development."},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 1000,
+        "temperature": 0.7
+    }
+    if json_format:
+        payload["response_format"] = {"type": "json_object"}
+    return payload
+
+def _openai_call(prompt, json_format=False, retries=None):
+    """Ask OpenAI; timeouts and connection errors are raised (the router fails over on them)"""
+    if not OPENAI_API_KEY:
+        return "[ERROR: OpenAI API key not configured]"
+    
+    response = http_request(
+        "openai", "POST", "https://api.openai.com/v1/chat/completions",
+        headers={
+            "Authorization": f"Bearer {OPENAI_API_KEY}",
+            "Content-Type": "application/json"
+        },
+        json=build_openai_payload(prompt, json_format=json_format),
+        retries=retries,
+        idempotent=True,
+        retry_timeouts=False,
+    )
+    
+    if response.status_code == 200:
+        return response.json()["choices"][0]["message"]["content"].strip()
+    else:
+        return f"[ERROR from OpenAI API: {response.status_code} - {response.text}]"
+
+def ask_openai(prompt, json_format=False):
     try:
-        if not OPENAI_API_KEY:
-            return "[ERROR: OpenAI API key not configured]"
-        
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {OPENAI_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": OPENAI_MODEL,
-                "messages": [
-                    {"role": "system", "content": "You are a helpful AI assistant for game development."},
-                    {"role": "user", "content": prompt}
-                ],
-                "max_tokens": 1000,
-                "temperature": 0.7
-            }
-        )
-        
-        if response.status_code == 200:
-            return response.json()["choices"][0]["message"]["content"].strip()
-        else:
-            return f"[ERROR from OpenAI API: {response.status_code} - {response.text}]"
-            
+        return _openai_call(prompt, json_format=json_format)
     except Exception as e:
         return f"[ERROR from OpenAI: {e}]"
 
-def ask_ai(prompt):
-    """Unified function to ask either Ollama or OpenAI based on configuration"""
-    if AI_PROVIDER.lower() == "openai":
-        return ask_openai(prompt)
+def is_ai_error(reply):
+    """Check whether an AI reply is one of our error markers instead of real content"""
+    return "ERROR:" in reply or "ERROR from" in reply
+
+def _model_settings(provider, json_format=False):
+    """Everything besides the prompt that influences a provider's answer (part of the cache key)"""
+    if provider == "openai":
+        payload = build_openai_payload("", json_format=json_format)
+        payload["messages"] = payload["messages"][:-1]  # Drop the (empty) user message
     else:
-        return ask_ollama(prompt)
+        payload = build_ollama_payload("", json_format=json_format)  # Keeps the prompt template (PROJECT_CONTEXT for llama)
+        payload.pop("stream")
+        payload.pop("keep_alive", None)  # Residency, not output
+        payload["options"].pop("num_ctx")  # Sized per prompt, the window does not change the answer
+    return payload
+
+def prompt_token_budget():
+    """Tokens left for card text once the system prompt, the answer and the template are accounted for"""
+    if PROMPT_MAX_TOKENS:
+        return PROMPT_MAX_TOKENS
+    if AI_PROVIDER.lower() == "openai":
+        return OPENAI_CONTEXT_TOKENS - build_openai_payload("")["max_tokens"] - PROMPT_TEMPLATE_TOKENS
+    max_ctx = build_ollama_payload("")["options"]["num_ctx"]
+    return max_ctx - estimate_tokens(PROJECT_CONTEXT) - OLLAMA_MAX_TOKENS - PROMPT_TEMPLATE_TOKENS
+
+def fit_card_text(card_name, **sections):
+    """Trim oversized card text (pasted logs, long specs) so the prompt fits the model's context window"""
+    budget = prompt_token_budget()
+    if budget < MIN_SECTION_TOKENS * len(sections):
+        log_to_slack(f"⚠️ Only {budget} prompt tokens left for the text of '{card_name}' once the system prompt and "
+                     f"answer are counted - keeping {MIN_SECTION_TOKENS} per section, raise the model's num_ctx")
+    fitted, trimmed = fit_sections(sections, budget)
+    if trimmed:
+        log_to_slack(f"✂️ Trimmed {', '.join(trimmed)} of '{card_name}' to fit the prompt budget")
+    return fitted
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_router():
+    """The AI router when several backends are configured (Ollama hosts and/or OpenAI overflow), else None"""
+    global _router
+    if AI_PROVIDER.lower() != "ollama" or (len(OLLAMA_HOSTS) < 2 and not AI_ROUTER_OVERFLOW):
+        return None
+    with _router_lock:
+        if _router is None:
+            # No HTTP retries below the router, a dead host should fail over right away
+            primaries = [
+                Backend(f"ollama@{host}",
+                        lambda prompt, json_format, host=host: _ollama_call(prompt, json_format, host, retries=0),
+                        max_outstanding=AI_ROUTER_MAX_OUTSTANDING, health_url=f"{host}/api/version")
+                for host in OLLAMA_HOSTS
+            ]
+            overflow = (Backend("openai", lambda prompt, json_format: _openai_call(prompt, json_format, retries=0))
+                        if AI_ROUTER_OVERFLOW and OPENAI_API_KEY else None)
+            _router = AIRouter(primaries, overflow=overflow, is_error=is_ai_error)
+        return _router
+
+def get_router_stats():
+    """Per-backend router metrics, None when the router is not in use"""
+    router = get_router()
+    return router.stats() if router else None
+
+def ask_ai(prompt, json_format=False, stage="ask_ai", validate=None):
+    """
+    Unified function to ask either Ollama or OpenAI based on configuration.
+    The call is recorded as `stage` in the metrics and traces, with the provider and model that answered.
+    With `validate`, only replies for which validate(reply) is truthy are cached or served from the cache.
+    """
+    start_time = time.perf_counter()
+    with span(f"ask_ai {stage}", prompt_chars=len(prompt)) as ai_span:
+        reply, provider, model, outcome = _ask_ai(prompt, json_format, validate)
+        ai_span.set(provider=provider, model=model, outcome=outcome)
+    observe_stage(stage, time.perf_counter() - start_time, provider, model, outcome)
+    return reply
 
-def extract_context_from_description(desc):
-    match = re.search(r'\[Context\](.*?)(\n\n|\Z)', desc, re.DOTALL)
-    if match:
-        context_block = match.group(1).strip()
-        cleaned = desc.replace(match.group(0), '').strip()
+def _ask_ai(prompt, json_format, validate=None):
+    """Ask the configured provider (cache, router); returns (reply, provider, model, outcome)"""
+    provider = AI_PROVIDER.lower()
+    model = OPENAI_MODEL if provider == "openai" else OLLAMA_MODEL
+    
+    cache_key = None
+    if AI_CACHE_ENABLED:
+        cache_key = make_cache_key(provider, _model_settings(provider, json_format), prompt)
+        cached = get_cached_response(cache_key)
+        if cached is not None and (validate is None or validate(cached)):
+            log_to_slack("💾 AI response served from cache")
+            return cached, provider, model, "cached"
+    
+    router = get_router()
+    if provider == "openai":
+        reply = ask_openai(prompt, json_format=json_format)
+    elif router:
+        reply, backend = router.ask(prompt, json_format=json_format)
+        if backend == "openai":
+            cache_key = None  # Overflow answers are not what the cache key (Ollama settings) describes
+            provider, model = "openai", OPENAI_MODEL
     else:
-        context_block = None
-        cleaned = desc
-    return context_block, cleaned
+        reply = ask_ollama(prompt, json_format=json_format)
+    
+    error = is_ai_error(reply)
+    # Never cache errors or replies the caller cannot use, the next attempt may well succeed
+    if cache_key and not error and (validate is None or validate(reply)):
+        store_response(cache_key, reply)
+    return reply, provider, model, "error" if error else "ok"
 
 def extract_tags_from_context(context_block):
     lines = context_block.splitlines()
     tags = []
     for line in lines:
         if ":" in line:
-            label = line.split(":", 1)[1].strip()
+            field, label = line.split(":", 1)
+            if field.strip() == METADATA_SOURCE_FIELD:
+                continue  # Who wrote the block, not a tag
+            label = label.strip()
             if label.lower() != "none":
                 tags.extend(label.split("/"))
     return [tag.strip() for tag in tags]
 
-def generate_card_metadata(card_name, desc, comment=None):
+def generate_card_metadata(card_name, desc, comment=None, use_local=True):
     prompt = f"""You're reviewing a Trello card without metadata.
 
 Infer the following:
@@ -218,7 +628,94 @@ Card Title: {card_name}
 Description: {desc}
 {f"Comment: {comment}" if comment else ""}
 """
-    return ask_ai(prompt)
+    # Cheap local inference first, the LLM only handles cards the classifier is unsure about
+    local_start = time.perf_counter()
+    local_context = infer_context(card_name, desc, comment) if use_local else None
+    if local_context:
+        observe_stage("generate_card_metadata", time.perf_counter() - local_start, "local", "classifier")
+        log_to_slack(f"⚡ Metadata for '{card_name}' inferred locally")
+        return local_context
+    return ask_ai(prompt, stage="generate_card_metadata")
+
+def parse_combined_reply(reply):
+    """
+    Parse the JSON reply of generate_metadata_and_advice.
+    Tolerates code fences and text around the JSON object; returns (context_block, advice) or None.
+    """
+    if not reply or is_ai_error(reply):
+        return None
+    start, end = reply.find("{"), reply.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    try:
+        data = json.loads(reply[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    
+    context = data.get("context")
+    advice = data.get("advice")
+    if isinstance(advice, list):
+        advice = "\n".join(str(step) for step in advice)
+    if not isinstance(advice, str) or not advice.strip():
+        return None
+    
+    if isinstance(context, dict):
+        labels = {field: str(context.get(field) or "None").strip() for field in METADATA_FIELDS}
+        if all(value == "None" for value in labels.values()):
+            return None
+        context_block = format_context_block(labels)
+    elif isinstance(context, str) and context.strip():
+        # Model answered with a pre-formatted block instead of an object
+        context_block = format_context_block(parse_context_block(context.replace("[Context]", "")))
+    else:
+        return None
+    return context_block, advice.strip()
+
+def generate_metadata_and_advice(card_name, desc, comment=None):
+    """
+    Infer the [Context] metadata and the developer advice with a single structured generation,
+    so PROJECT_CONTEXT is only processed once. Returns (context_block, advice) or None if the
+    reply could not be parsed.
+    """
+    prompt = f"""You're reviewing a Trello card without metadata. Do two things:
+
+1. Infer its metadata:
+- GameSystem (World Map, Settlement Mode, Dungeon)
+- Mode (Battle, Siege, Skirmish, Dungeon)
+- Subsystem (Combat AI, UI, Animation, Loot, etc.)
+
+2. Explain what the developer should do next in the context of Unreal Engine development. Keep it helpful, technical, and relevant.
+
+Respond with a single JSON object only, exactly in this format:
+{{"context": {{"GameSystem": "...", "Mode": "...", "Subsystem": "..."}}, "advice": "..."}}
+
+📌 Task: {card_name}
+📝 Description: {desc}
+💬 Comment: {comment or ""}
+"""
+    return parse_combined_reply(ask_ai(prompt, json_format=True, stage="metadata_and_advice",
+                                       validate=parse_combined_reply))
+
+def summarize_for_morning(card):
+    """Short morning stand-up summary of an in-progress card for the daily Slack digest"""
+    meta, desc_clean = extract_context_from_description(card.get("desc", ""))
+    comments = [text for text in latest_comments(card) if "[🤖 AI Reply]" not in text]
+    fitted = fit_card_text(card['name'], desc=desc_clean, **{f"comment {i}": text for i, text in enumerate(comments, 1)})
+    desc_clean = fitted["desc"]
+    comments = [fitted[f"comment {i}"] for i in range(1, len(comments) + 1)]
+    prompt = f"""Summarize this in-progress Trello card for the team's morning stand-up.
+Write 2-3 short sentences: what the task is about and the most important next step.
+No headings, no preamble.
+
+{f"🧩 Metadata: {meta}" if meta else ""}
+📌 Task: {card['name']}
+📝 Description: {desc_clean or "(no description)"}
+{"💬 Latest comments:" if comments else ""}
+{chr(10).join(f"- {text}" for text in comments)}
+"""
+    return ask_ai(prompt, stage="daily_summary")
 
 def process_card_update(card, action):
     card_id = card["id"]
@@ -227,32 +724,61 @@ def process_card_update(card, action):
     comment = action.get("data", {}).get("text", "")
 
     meta, desc_clean = extract_context_from_description(desc)
-    if not meta:
-        inferred_context = generate_card_metadata(name, desc_clean, comment)
-        updated_desc = f"[Context]\n{inferred_context}\n\n{desc_clean}"
-        update_card_description(card_id, updated_desc)
-        log_to_slack(f"🧠 Added metadata to '{name}'")
-        meta = inferred_context
-
-        tags = extract_tags_from_context(inferred_context)
-        set_card_labels(card_id, tags)
-        log_to_slack(f"🏷️ Labels added to '{name}': {tags}")
+    # Prompts get trimmed copies; the description written back to Trello stays complete
+    prompt_text = fit_card_text(name, desc=desc_clean, comment=comment)
+    prompt_desc, prompt_comment = prompt_text["desc"], prompt_text["comment"]
+    reply = None
+    if meta:
+        # Cards with metadata are training data for the local classifier
+        learn_from_card(card_id, name, desc_clean, meta)
+    else:
+        local_start = time.perf_counter()
+        inferred_context = infer_context(name, desc_clean, comment)
+        source = "classifier" if inferred_context else "llm"
+        if inferred_context:
+            observe_stage("generate_card_metadata", time.perf_counter() - local_start, "local", "classifier")
+            log_to_slack(f"⚡ Metadata for '{name}' inferred locally")
+        elif COMBINED_PROMPT_MODE:
+            # One generation for metadata and advice instead of two
+            combined = generate_metadata_and_advice(name, prompt_desc, prompt_comment)
+            if combined:
+                inferred_context, reply = combined
+            else:
+                log_to_slack(f"⚠️ Combined AI reply for '{name}' could not be parsed - falling back to two calls")
+        if not inferred_context:
+            inferred_context = generate_card_metadata(name, prompt_desc, prompt_comment, use_local=False)
+        if is_ai_error(inferred_context):
+            # An error reply is no metadata - leave the description and labels as they are
+            log_to_slack(f"❌ AI Error for card metadata '{name}': {inferred_context}")
+            meta = None
+        else:
+            # Record who wrote the block, so the classifier never trains on its own guesses
+            inferred_context = with_source(inferred_context, source)
+            updated_desc = f"[Context]\n{inferred_context}\n\n{desc_clean}"
+            queue_description_update(card_id, updated_desc)
+            log_to_slack(f"🧠 Added metadata to '{name}'")
+            meta = inferred_context
+
+            tags = extract_tags_from_context(inferred_context)
+            queue_labels(card_id, tags)
+            log_to_slack(f"🏷️ Labels added to '{name}': {tags}")
         
     log_to_slack(f"✅ Processing Trello card: {name} - {desc_clean}")
 
     prompt = f"""🧩 Metadata:
-{meta}
+{meta or "(unknown)"}
 
 📌 Task: {name}
-📝 Description: {desc_clean}
-💬 Comment: {comment}
+📝 Description: {prompt_desc}
+💬 Comment: {prompt_comment}
 
 Explain what the developer should do next in the context of Unreal Engine development. Keep it helpful, technical, and relevant.
 """
-    reply = ask_ai(prompt)
+    if reply is None:
+        reply = ask_ai(prompt, stage="advice")
     
     # Check if the AI response contains an error
-    if "ERROR:" in reply or "ERROR from" in reply:
+    if is_ai_error(reply):
         error_msg = f"❌ AI Error for card '{name}': {reply}"
         log_to_slack(error_msg)
         print(error_msg)  # Also log to console for debugging
@@ -260,4 +786,4 @@ Explain what the developer should do next in the context of Unreal Engine develo
     
     signed_reply = f"[🤖 AI Reply]\n{reply}"
     log_to_slack(f"🤖 AI Reply: {reply}")
-    comment_on_card(card_id, signed_reply)
\ No newline at end of file
+    queue_comment(card_id, signed_reply)
\ No newline at end of file
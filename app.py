@@ -1,139 +1,386 @@
-from flask import Flask, request
+from flask import Flask, request, Response
 from dotenv import load_dotenv
 import os
 import threading
 import queue
 import time
+from collections import deque
 from datetime import datetime
 
 from trello_utils import fetch_card_data
-from ai_utils import process_card_update
-from slack_utils import log_to_slack
+from ai_utils import process_card_update, prewarm_ollama, get_ollama_stats, get_router_stats, OLLAMA_PREWARM
+from slack_utils import log_to_slack, get_slack_log_stats
+from ai_cache import get_cache_stats
+from board_snapshot import apply_webhook_action, get_snapshot_stats
+from trello_writer import after_card_writes, flush_trello_writes, get_write_stats
+from label_index import get_label_stats
+from metadata_classifier import get_classifier_stats
+from queue_utils import CoalescingQueue, PersistentQueue
+from change_filter import check_webhook_relevance, forget_webhook, remember_card_state, get_filter_stats
+from ingress import check_backpressure, record_ingress, get_ingress_stats
+from tracing import new_trace_id, trace, record_span
+from metrics import observe_stage, render_metrics, QUEUE_DEPTH, QUEUE_IN_FLIGHT, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
 load_dotenv()
 
 app = Flask(__name__)
 
-# Request queue for processing webhooks sequentially
-webhook_queue = queue.Queue()
-processing_thread = None
+# Number of worker threads processing webhooks in parallel.
+# Different cards run concurrently, events for the same card are always processed in order.
+WEBHOOK_WORKERS = max(1, int(os.getenv("WEBHOOK_WORKERS", "2")))
+
+# Bursts of updateCard events for the same card are merged: an update waits until the card
+# was quiet for COALESCE_WINDOW seconds (at most COALESCE_MAX_DELAY) and only the latest is processed
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", "3"))
+COALESCE_MAX_DELAY = float(os.getenv("COALESCE_MAX_DELAY", "15"))
+
+# Queue backend: "sqlite" survives restarts and crashes (at-least-once delivery), "memory" does not
+QUEUE_BACKEND = os.getenv("QUEUE_BACKEND", "sqlite").lower()
+QUEUE_DB_FILE = os.getenv("QUEUE_DB_FILE", "webhook_queue.sqlite3")
+QUEUE_SYNC = os.getenv("QUEUE_SYNC", "NORMAL").upper()  # NORMAL = batched fsync at WAL checkpoints, FULL = fsync per commit
+QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+QUEUE_RETRY_DELAY = float(os.getenv("QUEUE_RETRY_DELAY", "30"))  # Seconds, multiplied by the attempt number
+QUEUE_SHUTDOWN_TIMEOUT = float(os.getenv("QUEUE_SHUTDOWN_TIMEOUT", "30"))  # Seconds to let in-flight work finish
+
+# Priority classes per action type: an event waits behind events of classes with a smaller offset,
+# but never longer than the difference in offsets (seconds), so updates cannot starve
+def parse_priority_offsets(spec):
+    """"commentCard:0,updateCard:30" -> {'commentCard': 0.0, 'updateCard': 30.0}"""
+    offsets = {}
+    for entry in spec.split(","):
+        if ":" in entry:
+            action_type, offset = entry.split(":", 1)
+            offsets[action_type.strip()] = float(offset)
+    return offsets
+
+QUEUE_PRIORITY_OFFSETS = parse_priority_offsets(os.getenv("QUEUE_PRIORITY_OFFSETS", "commentCard:0,updateCard:30"))
+
+# Request queue for processing webhooks, opened on first use so importing this module creates no files
+webhook_queue = None
+_webhook_queue_lock = threading.Lock()
+
+def get_webhook_queue():
+    """The webhook request queue of the configured backend"""
+    global webhook_queue
+    if webhook_queue is None:
+        with _webhook_queue_lock:
+            if webhook_queue is None:
+                if QUEUE_BACKEND == "sqlite":
+                    webhook_queue = PersistentQueue(QUEUE_DB_FILE, window=COALESCE_WINDOW, max_delay=COALESCE_MAX_DELAY,
+                                                    max_attempts=QUEUE_MAX_ATTEMPTS, retry_delay=QUEUE_RETRY_DELAY,
+                                                    synchronous=QUEUE_SYNC, class_offsets=QUEUE_PRIORITY_OFFSETS)
+                else:
+                    webhook_queue = CoalescingQueue(window=COALESCE_WINDOW, max_delay=COALESCE_MAX_DELAY,
+                                                    max_attempts=QUEUE_MAX_ATTEMPTS, retry_delay=QUEUE_RETRY_DELAY,
+                                                    class_offsets=QUEUE_PRIORITY_OFFSETS)
+    return webhook_queue
+
+processing_threads = []
 queue_running = True
 
-def webhook_processor():
-    """Background thread to process webhook requests sequentially"""
-    global queue_running
+# Cards currently owned by a worker, mapped to the (entry_id, webhook_data) that arrived for them meanwhile
+active_cards = {}
+active_cards_lock = threading.Lock()
+
+# Per-worker statistics exposed on /queue/status
+worker_stats = {}
+worker_stats_lock = threading.Lock()
+
+def get_card_id(action):
+    """Return the Trello card ID a webhook action refers to (or None)"""
+    return action.get('data', {}).get('card', {}).get('id')
+
+def process_webhook(webhook_data):
+    """Process a single queued webhook request, returns True on success"""
+    payload, action, action_type = webhook_data[:3]
+    
+    try:
+        card_id = action['data']['card']['id']
+        card_name = action.get('data', {}).get('card', {}).get('name', 'Unknown')
+        card_desc = action.get('data', {}).get('card', {}).get('desc', '')
+        
+        log_to_slack(f"🔄 Processing queued webhook: {action_type} for card '{card_name}' (ID: {card_id})")
+        
+        # Fetch card data
+        card = fetch_card_data(card_id)
+        
+        # Enhance card data with webhook description if available
+        if card_desc and not card.get('desc'):
+            card['desc'] = card_desc
+            log_to_slack(f"📝 Enhanced card with webhook description for '{card_name}'")
+        
+        # Process the card update
+        process_card_update(card, action)
+        remember_card_state(card_id, name=card.get('name'), desc=card.get('desc'))
+        
+        log_to_slack(f"✅ Completed queued webhook: {action_type} for card '{card['name']}'")
+        return True
+        
+    except Exception as e:
+        log_to_slack(f"❌ Queued webhook error: {str(e)}")
+        return False
+
+def run_webhook(worker_id, entry_id, webhook_data):
+    """Process a webhook on behalf of a worker, record its statistics and acknowledge it"""
+    card_id = get_card_id(webhook_data[1])
+    with worker_stats_lock:
+        stats = worker_stats[worker_id]
+        stats['current_card'] = card_id
+        stats['busy_since'] = time.time()
     
+    started = time.time()
+    succeeded = False
+    # Traced webhooks carry {'trace_id', 'queued_at'} as a fourth element
+    trace_context = webhook_data[3] if len(webhook_data) > 3 else None
+    trace_id = trace_context['trace_id'] if trace_context else None
+    if trace_id:
+        record_span(trace_id, "queue", trace_context['queued_at'], started, action_type=webhook_data[2])
+    try:
+        with trace("process_webhook", trace_id, card_id=card_id, action_type=webhook_data[2]) as root_span:
+            succeeded = process_webhook(webhook_data)
+            root_span.set(succeeded=succeeded)
+    finally:
+        elapsed = time.time() - started
+        observe_stage("process_webhook", elapsed, outcome="ok" if succeeded else "error")
+        with worker_stats_lock:
+            stats['processed' if succeeded else 'failed'] += 1
+            stats['busy_seconds'] += elapsed
+            stats['last_duration'] = round(elapsed, 3)
+            stats['current_card'] = None
+            stats['busy_since'] = None
+        # Acknowledge the entry once its Trello writes are sent, so a crash before the write-behind
+        # flush replays it - failed ones (processing or writes) are retried by the queue
+        if succeeded and card_id is not None:
+            work_queue = get_webhook_queue()
+            after_card_writes(card_id, lambda written: work_queue.task_done(entry_id, failed=not written))
+        else:
+            get_webhook_queue().task_done(entry_id, failed=not succeeded)
+
+def webhook_processor(worker_id):
+    """Background worker thread that processes webhook requests from the shared queue"""
     while queue_running:
         try:
             # Get next webhook request from queue (blocking with timeout)
-            webhook_data = webhook_queue.get(timeout=1)
+            entry_id, webhook_data = get_webhook_queue().get(timeout=1)
             
-            if webhook_data is None:  # Shutdown signal
-                break
-                
-            payload, action, action_type = webhook_data
+            card_id = get_card_id(webhook_data[1])
+            if card_id is not None:
+                with active_cards_lock:
+                    if card_id in active_cards:
+                        # Another worker is busy with this card - hand the event over to keep per-card order
+                        pending = active_cards[card_id]
+                        if pending and pending[-1][1][2] == 'updateCard':
+                            # The waiting update is superseded, the newer event re-fetches the card anyway
+                            superseded_id = pending[-1][0]
+                            pending[-1] = (entry_id, webhook_data)
+                            get_webhook_queue().task_done(superseded_id)
+                            get_webhook_queue().record_merged()
+                        else:
+                            pending.append((entry_id, webhook_data))
+                        with worker_stats_lock:
+                            worker_stats[worker_id]['handed_off'] += 1
+                        continue
+                    active_cards[card_id] = deque()
             
-            try:
-                card_id = action['data']['card']['id']
-                card_name = action.get('data', {}).get('card', {}).get('name', 'Unknown')
-                card_desc = action.get('data', {}).get('card', {}).get('desc', '')
-                
-                log_to_slack(f"🔄 Processing queued webhook: {action_type} for card '{card_name}' (ID: {card_id})")
-                
-                # Fetch card data
-                card = fetch_card_data(card_id)
-                
-                # Enhance card data with webhook description if available
-                if card_desc and not card.get('desc'):
-                    card['desc'] = card_desc
-                    log_to_slack(f"📝 Enhanced card with webhook description for '{card_name}'")
-                
-                # Process the card update
-                process_card_update(card, action)
-                
-                log_to_slack(f"✅ Completed queued webhook: {action_type} for card '{card['name']}'")
-                
-            except Exception as e:
-                log_to_slack(f"❌ Queued webhook error: {str(e)}")
-            finally:
-                # Mark task as done
-                webhook_queue.task_done()
-                
-                # Check if this was the last item in queue
-                if webhook_queue.empty():
-                    log_to_slack("📭 Queue is now empty - all webhook requests processed")
+            # Process the event and then everything that queued up for the same card meanwhile.
+            # On shutdown the rest stays unacknowledged and is replayed by a persistent queue.
+            while webhook_data is not None:
+                run_webhook(worker_id, entry_id, webhook_data)
+                webhook_data = None
+                if card_id is not None:
+                    with active_cards_lock:
+                        pending = active_cards[card_id]
+                        if pending and queue_running:
+                            entry_id, webhook_data = pending.popleft()
+                        else:
+                            del active_cards[card_id]
+            
+            # Check if this was the last item in queue
+            if get_webhook_queue().depth() == 0:
+                log_to_slack("📭 Queue is now empty - all webhook requests processed")
                 
         except queue.Empty:
             # No webhook requests in queue, continue waiting
             # Note: This runs every second when queue is empty, so we don't log here to avoid spam
             continue
         except Exception as e:
-            log_to_slack(f"❌ Webhook processor error: {str(e)}")
+            log_to_slack(f"❌ Webhook processor error (worker {worker_id}): {str(e)}")
             time.sleep(1)  # Brief pause on error
 
 def start_webhook_processor():
-    """Start the background webhook processing thread"""
-    global processing_thread
-    processing_thread = threading.Thread(target=webhook_processor, daemon=True)
-    processing_thread.start()
-    log_to_slack("🚀 Webhook queue processor started")
+    """Start the background webhook worker threads"""
+    global queue_running
+    queue_running = True
+    for worker_id in range(WEBHOOK_WORKERS):
+        with worker_stats_lock:
+            worker_stats[worker_id] = {
+                'processed': 0,
+                'failed': 0,
+                'handed_off': 0,
+                'busy_seconds': 0.0,
+                'last_duration': None,
+                'current_card': None,
+                'busy_since': None,
+            }
+        thread = threading.Thread(target=webhook_processor, args=(worker_id,),
+                                  name=f"webhook-worker-{worker_id}", daemon=True)
+        thread.start()
+        processing_threads.append(thread)
+    replayed = getattr(get_webhook_queue(), 'replayed', 0)
+    if replayed:
+        log_to_slack(f"♻️ Replaying {replayed} webhook request(s) that were in flight before the last shutdown")
+    if OLLAMA_PREWARM:
+        # Load the model in the background so the first webhook does not pay for it
+        threading.Thread(target=prewarm_ollama, name="ollama-prewarm", daemon=True).start()
+    log_to_slack(f"🚀 Webhook queue processor started with {WEBHOOK_WORKERS} worker(s), {QUEUE_BACKEND} queue backend")
 
 def stop_webhook_processor():
-    """Stop the background webhook processing thread"""
-    global queue_running, processing_thread
-    queue_running = False
-    webhook_queue.put(None)  # Send shutdown signal
-    if processing_thread:
-        processing_thread.join(timeout=5)
+    """Stop the background webhook worker threads, letting in-flight requests finish"""
+    global queue_running, webhook_queue
+    queue_running = False  # Workers finish their current request and exit within a second
+    deadline = time.time() + QUEUE_SHUTDOWN_TIMEOUT
+    for thread in processing_threads:
+        thread.join(timeout=max(0, deadline - time.time()))
+    still_running = sum(thread.is_alive() for thread in processing_threads)
+    processing_threads.clear()
+    
+    # Before closing the queue: sent writes acknowledge their webhooks
+    flushed = flush_trello_writes()
+    if not flushed:
+        log_to_slack("⚠️ Some Trello writes were still pending at shutdown - their requests will be replayed on restart")
+    if still_running:
+        log_to_slack(f"⚠️ {still_running} worker(s) still busy after {QUEUE_SHUTDOWN_TIMEOUT:.0f}s - their requests will be replayed on restart")
+    elif flushed and isinstance(webhook_queue, PersistentQueue):
+        webhook_queue.close()
+        webhook_queue = None  # Reopened by the next start
     log_to_slack("🛑 Webhook queue processor stopped")
 
-@app.route('/webhook', methods=['HEAD', 'POST'])
-def handle_webhook():
-    if request.method == 'HEAD':
-        # Trello webhook validation ping
-        return '', 200
+def get_worker_stats():
+    """Snapshot of per-worker statistics for the status endpoint"""
+    now = time.time()
+    with worker_stats_lock:
+        snapshot = []
+        for worker_id, stats in sorted(worker_stats.items()):
+            entry = dict(stats)
+            busy_since = entry.pop('busy_since')
+            entry['worker'] = worker_id
+            entry['busy_seconds'] = round(entry['busy_seconds'], 3)
+            entry['busy_for'] = round(now - busy_since, 3) if busy_since else None
+            snapshot.append(entry)
+    return snapshot
 
-    payload = request.json
-    action = payload.get('action', {})
+def accept_webhook(payload):
+    """
+    Validate, filter and enqueue a webhook payload without doing any of the work.
+    Shared by the Flask route and the ASGI ingress; returns (http_status, outcome).
+    """
+    action = payload.get('action') if isinstance(payload, dict) else None
+    if not isinstance(action, dict):
+        return 400, 'invalid'
     action_type = action.get('type')
 
+    # Every event keeps the board snapshot current, including ones we skip below
+    apply_webhook_action(action)
+
     if action_type not in ['commentCard', 'updateCard']:
         log_to_slack(f"❌ Webhook action_type not commentCard or updateCard")
-        return '', 200  # Ignore other event types
+        return 200, 'ignored'  # Ignore other event types
 
     # Prevent responding to its own AI-generated comment
     if action_type == "commentCard":
         comment_text = action.get("data", {}).get("text", "")
         if "[🤖 AI Reply]" in comment_text:
             log_to_slack("🛑 Skipped AI-generated comment to avoid loop.")
-            return '', 200
+            return 200, 'ignored'
+
+    # Drop updates that cannot change the AI output (list moves, our own [Context] write, ...)
+    relevant, reason = check_webhook_relevance(action)
+    if not relevant:
+        card_name = action.get('data', {}).get('card', {}).get('name', 'Unknown')
+        log_to_slack(f"⏭️ Skipped {action_type} for card '{card_name}': {reason}")
+        return 200, 'skipped'
+
+    # Shed load among the events that would be processed; the filter forgets a refused one,
+    # so it is not taken for a duplicate when Trello redelivers it
+    verdict = check_backpressure(action_type, get_webhook_queue().depth())
+    if verdict is not None:
+        forget_webhook(action)
+        outcome, status = verdict
+        return status, outcome
 
-    # Add webhook request to queue for sequential processing
+    # Add webhook request to queue for processing by the worker pool
     try:
-        webhook_queue.put((payload, action, action_type))
-        queue_size = webhook_queue.qsize()
+        # Updates are held briefly so a burst of edits to one card becomes a single AI run,
+        # comments (someone is waiting for the answer) go ahead of queued updates
+        item = (payload, action, action_type)
+        trace_id = new_trace_id()
+        if trace_id:
+            item += ({'trace_id': trace_id, 'queued_at': time.time()},)
+        get_webhook_queue().put(item, key=get_card_id(action),
+                          hold=(action_type == 'updateCard'), priority_class=action_type)
+        queue_size = get_webhook_queue().qsize()
         
         card_name = action.get('data', {}).get('card', {}).get('name', 'Unknown')
-        if queue_size > 1:
+        if action_type == 'updateCard' and COALESCE_WINDOW > 0:
+            log_to_slack(f"📋 Webhook queued (position: {queue_size}, waiting {COALESCE_WINDOW:.0f}s for further edits) - {action_type} for card '{card_name}'")
+        elif queue_size > 1:
             log_to_slack(f"📋 Webhook queued (position: {queue_size}) - {action_type} for card '{card_name}'")
         else:
             log_to_slack(f"📋 Webhook queued for immediate processing - {action_type} for card '{card_name}'")
             
     except Exception as e:
         log_to_slack(f"❌ Failed to queue webhook: {str(e)}")
-        return '', 500
+        return 500, 'error'
 
-    return '', 200
+    return 200, 'queued'
+
+@app.route('/webhook', methods=['HEAD', 'POST'])
+def handle_webhook():
+    if request.method == 'HEAD':
+        # Trello webhook validation ping
+        return '', 200
+
+    started = time.perf_counter()
+    status, outcome = accept_webhook(request.get_json(silent=True))
+    record_ingress('flask', outcome, time.perf_counter() - started)
+    return '', status
 
 @app.route('/queue/status', methods=['GET'])
 def queue_status():
     """Endpoint to check queue status"""
     return {
-        'queue_size': webhook_queue.qsize(),
+        'queue_size': get_webhook_queue().qsize(),
         'processor_running': queue_running,
+        'workers': WEBHOOK_WORKERS,
+        'active_cards': len(active_cards),
+        'queue': get_webhook_queue().stats(),
+        'worker_stats': get_worker_stats(),
+        'ingress': get_ingress_stats(),
+        'slack_log': get_slack_log_stats(),
+        'ai_cache': get_cache_stats(),
+        'board_snapshot': get_snapshot_stats(),
+        'trello_writes': get_write_stats(),
+        'labels': get_label_stats(),
+        'ollama': get_ollama_stats(),
+        'ai_router': get_router_stats(),
+        'change_filter': get_filter_stats(),
+        'metadata_classifier': get_classifier_stats(),
         'timestamp': datetime.now().isoformat()
     }
 
+def metrics_text():
+    """Prometheus metrics, with the queue gauges read at scrape time"""
+    stats = get_webhook_queue().stats()
+    for priority_class, class_stats in stats['classes'].items():
+        QUEUE_DEPTH.set(class_stats['pending'], priority_class=priority_class)
+    QUEUE_IN_FLIGHT.set(stats['in_flight'])
+    return render_metrics()
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics_text(), content_type=METRICS_CONTENT_TYPE)
+
 if __name__ == '__main__':
     port = int(os.getenv("PORT", 5000))
     
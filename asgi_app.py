@@ -0,0 +1,106 @@
+"""
+Async webhook ingress: the same /webhook, /queue/status and /metrics endpoints as app.py,
+served by an ASGI server instead of Flask's development server.
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+A webhook is parsed, filtered and enqueued and the response goes out right away; the worker
+pool from app.py does the actual processing. Writes to the SQLite queue run on a dedicated
+thread so the event loop never waits on the disk.
+"""
+
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from app import (accept_webhook, queue_status, metrics_text, start_webhook_processor, stop_webhook_processor,
+                 QUEUE_BACKEND)
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from ingress import record_ingress, INGRESS_MAX_BODY
+from slack_utils import log_to_slack
+
+# One thread keeps SQLite writes in arrival order; the in-memory queue is fast enough to use inline
+_enqueue_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingress") \
+    if QUEUE_BACKEND == "sqlite" else None
+
+async def _send(send, status, body=b"", content_type=b"application/json"):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def _read_body(receive, limit):
+    """Request body, or None when it exceeds limit bytes"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return b""
+        chunk = message.get('body', b"")
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b"".join(chunks)
+
+async def _handle_webhook(receive, send):
+    started = time.perf_counter()
+    body = await _read_body(receive, INGRESS_MAX_BODY)
+    if body is None:
+        status, outcome = 413, 'too_large'
+    else:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = None
+        if _enqueue_executor is not None:
+            loop = asyncio.get_running_loop()
+            status, outcome = await loop.run_in_executor(_enqueue_executor, accept_webhook, payload)
+        else:
+            status, outcome = accept_webhook(payload)
+    await _send(send, status)
+    record_ingress('asgi', outcome, time.perf_counter() - started)
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            start_webhook_processor()
+            log_to_slack("⚡ Async webhook ingress ready")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # Waits for in-flight requests, keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, stop_webhook_processor)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    """ASGI entry point"""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    path = scope['path'].rstrip('/')
+    method = scope['method']
+    if path == '/webhook' and method == 'HEAD':
+        # Trello webhook validation ping
+        await _send(send, 200)
+    elif path == '/webhook' and method == 'POST':
+        await _handle_webhook(receive, send)
+    elif path == '/queue/status' and method == 'GET':
+        status = await asyncio.get_running_loop().run_in_executor(None, queue_status)
+        await _send(send, 200, json.dumps(status, default=str).encode("utf-8"))
+    elif path == '/metrics' and method == 'GET':
+        text = await asyncio.get_running_loop().run_in_executor(None, metrics_text)
+        await _send(send, 200, text.encode("utf-8"), METRICS_CONTENT_TYPE.encode())
+    elif path in ('/webhook', '/queue/status', '/metrics'):
+        await _send(send, 405)
+    else:
+        await _send(send, 404)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark the local metadata classifier against the LLM path on the mock_data cards.
+
+Every card in mock_data with a [Context] block is used as a labelled example. The local
+classifier is evaluated leave-one-out (trained on all other cards), the LLM path asks the
+configured AI provider via generate_card_metadata. Run with --skip-llm when no model is available.
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+
+import ai_utils
+import metadata_classifier
+from ai_utils import extract_context_from_description, generate_card_metadata
+from metadata_classifier import FIELDS, classify_card, parse_context_block, reset_training
+
+def load_labelled_cards(pattern="mock_data/*.json"):
+    """Load mock cards that have a [Context] block, single-card files win over list entries"""
+    cards = {}
+    for path in sorted(glob.glob(pattern), key=lambda p: "list" not in p):
+        with open(path, "r") as f:
+            data = json.load(f)
+        for card in data if isinstance(data, list) else [data]:
+            context, desc_clean = extract_context_from_description(card.get("desc", ""))
+            if context:
+                cards[card["id"]] = {
+                    "name": card["name"],
+                    "desc": desc_clean,
+                    "labels": parse_context_block(context),
+                }
+    return list(cards.values())
+
+def score(predicted, expected):
+    """Number of fields predicted correctly (case-insensitive)"""
+    return sum(predicted.get(field, "").strip().lower() == expected[field].lower() for field in FIELDS)
+
+def benchmark_local(cards, repeats):
+    """Leave-one-out accuracy and per-card latency of the local classifier"""
+    correct = 0
+    confident = 0
+    latencies = []
+    for index, card in enumerate(cards):
+        training = [{"text": f"{c['name']}\n{c['desc']}", "labels": c["labels"]}
+                    for i, c in enumerate(cards) if i != index]
+        reset_training(training)
+        classify_card(card["name"], card["desc"])  # Build the model outside the timed loop
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            labels, confidence = classify_card(card["name"], card["desc"])
+        latencies.append((time.perf_counter() - start) / repeats)
+
+        correct += score(labels, card["labels"])
+        confident += confidence >= metadata_classifier.METADATA_CLASSIFIER_MIN_CONFIDENCE
+        print(f"  local  {card['name'][:50]:<50} {labels} (confidence {confidence:.2f})")
+    return correct, confident, latencies
+
+def benchmark_llm(cards):
+    """Accuracy and latency of generate_card_metadata with the classifier and cache disabled"""
+    metadata_classifier.METADATA_CLASSIFIER_ENABLED = False
+    ai_utils.AI_CACHE_ENABLED = False
+    correct = 0
+    latencies = []
+    for card in cards:
+        start = time.perf_counter()
+        reply = generate_card_metadata(card["name"], card["desc"])
+        latencies.append(time.perf_counter() - start)
+        labels = parse_context_block(reply)
+        correct += score(labels, card["labels"])
+        print(f"  llm    {card['name'][:50]:<50} {labels} ({latencies[-1]:.1f}s)")
+    return correct, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare local metadata inference with the LLM path")
+    parser.add_argument("--skip-llm", action="store_true", help="only benchmark the local classifier")
+    parser.add_argument("--repeats", type=int, default=200, help="timed classifications per card")
+    args = parser.parse_args()
+
+    cards = load_labelled_cards()
+    if not cards:
+        print("❌ No labelled cards found in mock_data")
+        return 1
+    total_fields = len(cards) * len(FIELDS)
+    print(f"🧪 Benchmarking metadata inference on {len(cards)} labelled cards\n")
+
+    correct, confident, latencies = benchmark_local(cards, args.repeats)
+    print(f"\n⚡ Local classifier: {correct}/{total_fields} fields correct "
+          f"({correct / total_fields:.0%}), {confident}/{len(cards)} confident, "
+          f"{sum(latencies) / len(latencies) * 1000:.3f} ms per card\n")
+
+    if args.skip_llm:
+        return 0
+
+    llm_correct, llm_latencies = benchmark_llm(cards)
+    print(f"\n🤖 LLM ({ai_utils.AI_PROVIDER}): {llm_correct}/{total_fields} fields correct "
+          f"({llm_correct / total_fields:.0%}), {sum(llm_latencies) / len(llm_latencies):.2f} s per card")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark split_large_message against the previous two-pass splitter on multi-megabyte inputs.
+
+The generated messages mix paragraphs, markdown lists, normal code blocks and one oversized
+code block without any sentence boundaries. Both splitters are checked for chunks over the
+limit (including the [Part i/n] header) and for chunks that open a code fence without closing it.
+"""
+
+import sys
+import time
+import random
+import argparse
+
+from message_utils import split_large_message, PART_HEADER_RESERVE
+
+def legacy_split(message, max_length=7000):
+    """The paragraph-then-sentence splitter split_large_message replaced"""
+    if len(message) <= max_length:
+        return [message]
+    paragraphs = message.split('\n\n')
+    chunks = []
+    current_chunk = ""
+    for paragraph in paragraphs:
+        if len(current_chunk) + len(paragraph) + 2 <= max_length:
+            current_chunk += (paragraph + '\n\n')
+        else:
+            if current_chunk:
+                chunks.append(current_chunk.strip())
+            current_chunk = paragraph + '\n\n'
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    if any(len(chunk) > max_length for chunk in chunks):
+        new_chunks = []
+        for chunk in chunks:
+            if len(chunk) <= max_length:
+                new_chunks.append(chunk)
+            else:
+                sentences = chunk.split('. ')
+                current_sentence_chunk = ""
+                for sentence in sentences:
+                    if len(current_sentence_chunk) + len(sentence) + 2 <= max_length:
+                        current_sentence_chunk += sentence + '. '
+                    else:
+                        if current_sentence_chunk:
+                            new_chunks.append(current_sentence_chunk.strip())
+                        current_sentence_chunk = sentence + '. '
+                if current_sentence_chunk:
+                    new_chunks.append(current_sentence_chunk.strip())
+        chunks = new_chunks
+    return chunks
+
+WORDS = "actor component blueprint formation siege tick replicate widget montage loot navmesh".split()
+
+def make_message(size, seed=1):
+    """Roughly `size` characters of AI-reply-like markdown"""
+    rng = random.Random(seed)
+    blocks = []
+    total = 0
+    while total < size:
+        kind = rng.random()
+        if kind < 0.5:
+            sentences = [" ".join(rng.choices(WORDS, k=rng.randint(6, 20))).capitalize() + "."
+                         for _ in range(rng.randint(2, 8))]
+            block = " ".join(sentences)
+        elif kind < 0.75:
+            block = "\n".join(f"{i}. " + " ".join(rng.choices(WORDS, k=rng.randint(4, 12)))
+                              for i in range(1, rng.randint(3, 10)))
+        elif kind < 0.98:
+            lines = [f"    {rng.choice(WORDS)}->{rng.choice(WORDS)}({rng.randint(0, 99)});"
+                     for _ in range(rng.randint(5, 40))]
+            block = "```cpp\n" + "\n".join(lines) + "\n```"
+        else:
+            # A generated file dump: far longer than one comment, no '. ' anywhere
+            lines = [f"Row_{i},{rng.choice(WORDS)},{rng.randint(0, 9999)}" for i in range(2000)]
+            block = "```csv\n" + "\n".join(lines) + "\n```"
+        blocks.append(block)
+        total += len(block) + 2
+    return "\n\n".join(blocks)
+
+def check(chunks, max_length):
+    """Chunks over the limit once the part header is added, and chunks with an unclosed fence"""
+    too_long = sum(len(f"[Part {i}/{len(chunks)}]\n{chunk}") > max_length for i, chunk in enumerate(chunks, 1))
+    open_fences = sum(sum(line.lstrip().startswith("```") for line in chunk.split("\n")) % 2
+                      for chunk in chunks)
+    return too_long, open_fences
+
+def run(name, split, message, max_length, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        chunks = split(message)
+    elapsed = (time.perf_counter() - start) / repeats
+    too_long, open_fences = check(chunks, max_length)
+    print(f"  {name:<8} {elapsed * 1000:9.1f} ms  {len(message) / elapsed / 1e6:7.1f} MB/s  "
+          f"{len(chunks):5} chunks  longest {max(map(len, chunks)):5}  "
+          f"over limit {too_long:4}  unclosed fences {open_fences:4}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Trello comment splitter")
+    parser.add_argument("--sizes", default="1,4,16", help="message sizes in MB, comma separated")
+    parser.add_argument("--max-length", type=int, default=7000, help="comment size limit")
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per splitter and size")
+    args = parser.parse_args()
+
+    for size_mb in (float(size) for size in args.sizes.split(",")):
+        message = make_message(int(size_mb * 1_000_000))
+        print(f"🧪 {len(message) / 1e6:.1f} MB message, limit {args.max_length} characters")
+        run("legacy", lambda m: legacy_split(m, args.max_length), message, args.max_length, args.repeats)
+        run("new", lambda m: split_large_message(m, args.max_length, reserve=PART_HEADER_RESERVE),
+            message, args.max_length, args.repeats)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
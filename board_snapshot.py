@@ -0,0 +1,177 @@
+import os
+import time
+import threading
+from dotenv import load_dotenv
+from http_utils import http_request, TRELLO_API_URL
+from slack_utils import log_to_slack
+from label_index import load_labels
+
+load_dotenv()
+
+TRELLO_KEY = os.getenv("TRELLO_KEY")
+TRELLO_TOKEN = os.getenv("TRELLO_TOKEN")
+TRELLO_BOARD_ID = os.getenv("TRELLO_BOARD_ID")
+
+# In-memory index of the board, loaded in one request and kept current by webhook payloads
+BOARD_SNAPSHOT_ENABLED = os.getenv("BOARD_SNAPSHOT_ENABLED", "true").lower() == "true" and bool(TRELLO_BOARD_ID)
+BOARD_SNAPSHOT_TTL = float(os.getenv("BOARD_SNAPSHOT_TTL", "300"))           # Seconds before a full reload
+BOARD_SNAPSHOT_COMMENTS = int(os.getenv("BOARD_SNAPSHOT_COMMENTS", "200"))  # Newest board comments to load
+CARD_FIELDS = "name,desc,url,idList,idLabels,dateLastActivity"
+CARD_COMMENT_LIMIT = 5  # Comments kept per card
+
+_cards = {}   # card_id -> card dict (fields above plus 'comments', newest first)
+_lists = {}   # list_id -> name
+_labels = {}  # label_id -> name
+_loaded_at = 0.0
+_lock = threading.Lock()
+_load_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'loads': 0, 'load_errors': 0, 'webhook_updates': 0}
+
+def load_board_snapshot():
+    """
+    Load cards, lists, labels and recent comments of the board with a single request,
+    using nested resources and field projection.
+    """
+    global _loaded_at
+    url = f"{TRELLO_API_URL}/boards/{TRELLO_BOARD_ID}"
+    params = {
+        "key": TRELLO_KEY,
+        "token": TRELLO_TOKEN,
+        "fields": "name",
+        "cards": "open",
+        "card_fields": CARD_FIELDS,
+        "lists": "open",
+        "list_fields": "name",
+        "labels": "all",
+        "label_fields": "name",
+        "actions": "commentCard",
+        "actions_limit": BOARD_SNAPSHOT_COMMENTS,
+        "action_fields": "data,date",
+        "action_memberCreator": "false",
+    }
+    response = http_request("trello", "GET", url, params=params)
+    response.raise_for_status()
+    board = response.json()
+
+    cards = {}
+    for card in board.get("cards", []):
+        card["comments"] = []
+        cards[card["id"]] = card
+    for action in board.get("actions", []):  # Newest first
+        data = action.get("data", {})
+        card = cards.get(data.get("card", {}).get("id"))
+        if card is not None and len(card["comments"]) < CARD_COMMENT_LIMIT:
+            card["comments"].append(data.get("text", ""))
+
+    with _lock:
+        _cards.clear()
+        _cards.update(cards)
+        _lists.clear()
+        _lists.update({lst["id"]: lst["name"] for lst in board.get("lists", [])})
+        _labels.clear()
+        _labels.update({label["id"]: label["name"] for label in board.get("labels", []) if label.get("name")})
+        _loaded_at = time.time()
+        _stats['loads'] += 1
+    load_labels(board.get("labels", []))  # Saves the label index its own refresh
+    return len(cards)
+
+def _ensure_fresh():
+    """Reload the snapshot when it is older than BOARD_SNAPSHOT_TTL (one thread reloads, others wait)"""
+    global _loaded_at
+    if time.time() - _loaded_at < BOARD_SNAPSHOT_TTL:
+        return
+    with _load_lock:
+        if time.time() - _loaded_at < BOARD_SNAPSHOT_TTL:
+            return
+        try:
+            count = load_board_snapshot()
+            log_to_slack(f"🗂️ Board snapshot loaded: {count} cards")
+        except Exception as e:
+            # Serve single-card fetches until the next attempt instead of retrying on every call
+            with _lock:
+                _loaded_at = time.time()
+                _stats['load_errors'] += 1
+            log_to_slack(f"⚠️ Board snapshot load failed: {e}")
+
+def get_card(card_id):
+    """Return a copy of an indexed card, or None if it is not in the snapshot"""
+    _ensure_fresh()
+    with _lock:
+        card = _cards.get(card_id)
+        if card is None:
+            _stats['misses'] += 1
+            return None
+        _stats['hits'] += 1
+        return dict(card, comments=list(card.get("comments", [])))
+
+def put_card(card):
+    """Add or merge a card fetched individually (or changed by us) into the index"""
+    with _lock:
+        existing = _cards.setdefault(card["id"], {"comments": []})
+        existing.update(card)
+
+def update_cached_card(card_id, **fields):
+    """Apply a change we made through the API, e.g. update_cached_card(card_id, desc=new_desc)"""
+    with _lock:
+        card = _cards.get(card_id)
+        if card is not None:
+            card.update(fields)
+
+def apply_webhook_action(action):
+    """Keep the index current from a webhook payload, without any Trello round trip"""
+    action_type = action.get("type")
+    data = action.get("data", {})
+    payload_card = data.get("card", {})
+    card_id = payload_card.get("id")
+    if not card_id:
+        return
+
+    with _lock:
+        card = _cards.get(card_id)
+        if action_type == "deleteCard" or (action_type == "updateCard" and payload_card.get("closed")):
+            _cards.pop(card_id, None)
+        elif action_type == "createCard":
+            _cards[card_id] = dict(payload_card, desc=payload_card.get("desc", ""), comments=[])
+        elif card is None:
+            return  # Unknown card - fetched in full on first use
+        elif action_type == "updateCard":
+            # The payload holds every changed field (listed in data.old) plus id and name
+            for field in list(data.get("old", {})) + ["name"]:
+                if field in payload_card:
+                    card[field] = payload_card[field]
+        elif action_type == "commentCard":
+            card["comments"] = ([data.get("text", "")] + card.get("comments", []))[:CARD_COMMENT_LIMIT]
+        elif action_type in ("addLabelToCard", "removeLabelFromCard") and "idLabels" in card:
+            label_id = data.get("label", {}).get("id")
+            label_ids = [existing for existing in card["idLabels"] if existing != label_id]
+            if action_type == "addLabelToCard":
+                label_ids.append(label_id)
+            card["idLabels"] = label_ids
+        else:
+            return
+        _stats['webhook_updates'] += 1
+
+def get_cached_label_ids(card_id):
+    """Label IDs currently on an indexed card, or None if unknown"""
+    with _lock:
+        card = _cards.get(card_id)
+        if card is None or "idLabels" not in card:
+            return None
+        return list(card["idLabels"])
+
+def get_list_name(list_id):
+    """Name of a list on the board (None if unknown)"""
+    with _lock:
+        return _lists.get(list_id)
+
+def get_snapshot_stats():
+    """Snapshot size, age and hit/miss counters"""
+    with _lock:
+        return dict(
+            _stats,
+            enabled=BOARD_SNAPSHOT_ENABLED,
+            cards=len(_cards),
+            lists=len(_lists),
+            labels=len(_labels),
+            age_seconds=round(time.time() - _loaded_at, 1) if _loaded_at else None,
+        )
@@ -0,0 +1,123 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from metadata_classifier import extract_context_from_description
+
+load_dotenv()
+
+# Drop webhooks that cannot change the AI output before they reach the queue
+CHANGE_FILTER_ENABLED = os.getenv("CHANGE_FILTER_ENABLED", "true").lower() == "true"
+# updateCard is only processed when one of these card fields changed
+CHANGE_FILTER_FIELDS = [f.strip() for f in os.getenv("CHANGE_FILTER_FIELDS", "name,desc").split(",") if f.strip()]
+CHANGE_FILTER_MAX_CARDS = int(os.getenv("CHANGE_FILTER_MAX_CARDS", "5000"))  # Fingerprints kept (LRU)
+CHANGE_FILTER_MAX_ACTIONS = 1000  # Recently seen Trello action IDs, to drop redelivered webhooks
+
+# card_id -> {'name': hash, 'desc': hash} of the last state we processed or accepted
+_card_states = OrderedDict()
+_seen_actions = OrderedDict()
+_lock = threading.Lock()
+_stats = {'accepted': 0, 'dropped': {}}
+
+def _hash(text):
+    return hashlib.sha1((text or "").strip().encode("utf-8")).hexdigest()
+
+def _clean_desc(desc):
+    """Description without the bot-generated [Context] block"""
+    return extract_context_from_description(desc or "")[1]
+
+def card_fingerprint(name=None, desc=None):
+    """Fingerprint of the fields that influence the AI output; None means "not known here" """
+    fingerprint = {}
+    if name is not None:
+        fingerprint['name'] = _hash(name)
+    if desc is not None:
+        fingerprint['desc'] = _hash(_clean_desc(desc))
+    return fingerprint
+
+def remember_card_state(card_id, name=None, desc=None):
+    """Record the state of a card we accepted or processed"""
+    fingerprint = card_fingerprint(name, desc)
+    with _lock:
+        state = _card_states.pop(card_id, {})
+        state.update(fingerprint)
+        _card_states[card_id] = state
+        while len(_card_states) > CHANGE_FILTER_MAX_CARDS:
+            _card_states.popitem(last=False)
+
+def _drop(reason):
+    """Count a dropped webhook (caller holds the lock)"""
+    _stats['dropped'][reason] = _stats['dropped'].get(reason, 0) + 1
+    return False, reason
+
+def check_webhook_relevance(action):
+    """
+    Decide whether a webhook action can change the AI output.
+    Returns (True, None) to process it or (False, reason) to drop it.
+    """
+    if not CHANGE_FILTER_ENABLED:
+        return True, None
+
+    data = action.get('data', {})
+    card = data.get('card', {})
+    card_id = card.get('id')
+    action_id = action.get('id')
+
+    with _lock:
+        # Trello redelivers webhooks it considers failed, the action ID stays the same
+        if action_id:
+            if action_id in _seen_actions:
+                return _drop('duplicate_action')
+            _seen_actions[action_id] = True
+            while len(_seen_actions) > CHANGE_FILTER_MAX_ACTIONS:
+                _seen_actions.popitem(last=False)
+
+        if action.get('type') == 'updateCard':
+            old = data.get('old', {})
+            changed = [field for field in old if field in CHANGE_FILTER_FIELDS]
+            if not changed:
+                # List moves, due dates, positions, covers...
+                return _drop('irrelevant_fields')
+
+            if changed == ['desc'] and _clean_desc(old['desc']) == _clean_desc(card.get('desc', '')):
+                # Only the [Context] block changed - usually our own update_card_description call
+                return _drop('context_only')
+
+            fingerprint = card_fingerprint(
+                name=card.get('name') if 'name' in changed else None,
+                desc=card.get('desc') if 'desc' in changed else None,
+            )
+            known = _card_states.get(card_id, {})
+            if fingerprint and all(known.get(field) == value for field, value in fingerprint.items()):
+                return _drop('unchanged')
+        # Comments are only dropped when redelivered: someone repeating a question wants an answer again
+
+        _stats['accepted'] += 1
+
+    if card_id:
+        remember_card_state(card_id, name=card.get('name'), desc=card.get('desc'))
+    return True, None
+
+def forget_webhook(action):
+    """
+    Undo check_webhook_relevance for an action that was accepted but then not queued (e.g. shed
+    under load), so a redelivery or the same edit again is not dropped as already seen
+    """
+    card_id = action.get('data', {}).get('card', {}).get('id')
+    with _lock:
+        _seen_actions.pop(action.get('id'), None)
+        _card_states.pop(card_id, None)
+        _stats['accepted'] -= 1
+
+def get_filter_stats():
+    """Accepted and dropped (per reason) webhook counters"""
+    with _lock:
+        dropped = dict(_stats['dropped'])
+        return {
+            'enabled': CHANGE_FILTER_ENABLED,
+            'accepted': _stats['accepted'],
+            'dropped': dropped,
+            'dropped_total': sum(dropped.values()),
+            'tracked_cards': len(_card_states),
+        }
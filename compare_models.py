@@ -1,6 +1,28 @@
-import requests
-import datetime
+#!/usr/bin/env python3
+"""
+Benchmark Ollama models on a corpus of Trello-style prompts.
+
+Every prompt of the corpus (the mock_data cards, the default prompt and any --prompt files)
+is sent --repeats times to every model, --concurrency requests at a time. Per request the
+latency, time-to-first-token and Ollama's own token counters are recorded; per model the
+latency percentiles, tokens/sec and memory use (from /api/ps) are summarized. Results are
+written to model_logs/ as markdown (first reply per prompt), JSON and CSV.
+
+Use --fake to run against an in-process fake Ollama server (no models needed).
+"""
+
 import os
+import csv
+import sys
+import glob
+import json
+import time
+import argparse
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from http_utils import http_request
+from ai_utils import extract_context_from_description
 
 # ✅ List of models to test
 MODELS = ["llama3", "mistral", "codellama", "phi3"]
@@ -18,53 +40,232 @@ When the boss dies in a Dungeon, a locked chest should spawn nearby with randomi
 What should be implemented next?
 """
 
-def ask_model(model, prompt):
+PERCENTILES = [50, 90, 95, 99]
+CSV_FIELDS = ["model", "prompt", "repeat", "ok", "error", "latency", "ttft", "eval_count",
+              "eval_duration_ms", "tokens_per_second", "prompt_eval_count", "load_duration_ms"]
+
+def card_prompt(card):
+    """The card in the same shape as DEFAULT_PROMPT"""
+    meta, desc_clean = extract_context_from_description(card.get("desc", ""))
+    context = f"[Context]\n{meta}\n\n" if meta else ""
+    return f"{context}Task:\n{card['name']}\n{desc_clean}\n\nWhat should be implemented next?"
+
+def load_corpus(prompt_paths=(), include_cards=True):
+    """[(name, prompt)] from the default prompt, the mock_data cards and prompt files or directories"""
+    corpus = [("default", DEFAULT_PROMPT.strip())]
+    if include_cards:
+        seen = set()
+        for path in sorted(glob.glob("mock_data/*.json")):
+            with open(path, "r") as f:
+                data = json.load(f)
+            for card in data if isinstance(data, list) else [data]:
+                if card["id"] not in seen:
+                    seen.add(card["id"])
+                    corpus.append((f"card:{card['name'][:40]}", card_prompt(card)))
+    for path in prompt_paths:
+        files = sorted(glob.glob(os.path.join(path, "*"))) if os.path.isdir(path) else [path]
+        for file_path in files:
+            with open(file_path, "r") as f:
+                corpus.append((f"file:{os.path.basename(file_path)}", f.read().strip()))
+    return corpus
+
+def ask_model(host, model, prompt, stream=True, num_predict=None):
+    """One timed generation; returns a result record (never raises)"""
+    payload = {"model": model, "prompt": prompt, "stream": stream}
+    if num_predict:
+        payload["options"] = {"num_predict": num_predict}
+    record = {"model": model, "ok": False, "error": None, "reply": "", "ttft": None}
+    start = time.perf_counter()
     try:
-        response = requests.post("http://localhost:11434/api/generate", json={
-            "model": model,
-            "prompt": prompt,
-            "stream": False
-        })
-        result = response.json().get("response", "").strip()
-        return result
+        response = http_request("ollama", "POST", f"{host}/api/generate", json=payload, stream=stream,
+                                retries=0, retry_timeouts=False)
+        with response:
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+            if stream:
+                parts = []
+                final = {}
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise RuntimeError(chunk["error"])
+                    if chunk.get("response") and record["ttft"] is None:
+                        record["ttft"] = time.perf_counter() - start
+                    parts.append(chunk.get("response", ""))
+                    if chunk.get("done"):
+                        final = chunk
+                        break
+                reply = "".join(parts)
+            else:
+                final = response.json()
+                reply = final.get("response", "")
     except Exception as e:
-        return f"[ERROR: {e}]"
+        record["error"] = str(e)
+        record["latency"] = time.perf_counter() - start
+        return record
 
-def save_to_markdown(prompt, responses):
-    now = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M")
-    filename = f"model_comparison_{now}.md"
-    os.makedirs("model_logs", exist_ok=True)
-    path = os.path.join("model_logs", filename)
+    record["latency"] = time.perf_counter() - start
+    eval_duration = final.get("eval_duration") or 0
+    record.update(
+        ok=True,
+        reply=reply.strip(),
+        eval_count=final.get("eval_count"),
+        eval_duration_ms=round(eval_duration / 1e6, 1),
+        tokens_per_second=round(final["eval_count"] / (eval_duration / 1e9), 1)
+        if final.get("eval_count") and eval_duration else None,
+        prompt_eval_count=final.get("prompt_eval_count"),
+        load_duration_ms=round((final.get("load_duration") or 0) / 1e6, 1),
+    )
+    return record
 
+def model_memory(host, model):
+    """Resident size of a loaded model from /api/ps, in MB ({} if unavailable)"""
+    try:
+        response = http_request("ollama", "GET", f"{host}/api/ps", retries=0)
+        for entry in response.json().get("models", []):
+            if entry.get("name", "").split(":")[0] == model.split(":")[0]:
+                return {"size_mb": round(entry.get("size", 0) / 1e6, 1),
+                        "vram_mb": round(entry.get("size_vram", 0) / 1e6, 1)}
+    except Exception:
+        pass
+    return {}
+
+def percentile(values, p):
+    """Linear-interpolated percentile of a list of numbers (None if empty)"""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+def seconds(value):
+    return f"{value}s" if value is not None else "n/a"
+
+def summarize(model, records, wall_time, memory):
+    """Aggregate statistics of one model's records"""
+    ok = [r for r in records if r["ok"]]
+    latencies = [r["latency"] for r in ok]
+    ttfts = [r["ttft"] for r in ok if r["ttft"] is not None]
+    eval_tokens = sum(r.get("eval_count") or 0 for r in ok)
+    eval_seconds = sum(r.get("eval_duration_ms") or 0 for r in ok) / 1000
+    summary = {
+        "model": model,
+        "requests": len(records),
+        "errors": len(records) - len(ok),
+        "wall_time": round(wall_time, 3),
+        "throughput_rps": round(len(ok) / wall_time, 2) if wall_time else None,
+        "latency_mean": round(sum(latencies) / len(latencies), 3) if latencies else None,
+        "ttft_p50": round(percentile(ttfts, 50), 3) if ttfts else None,
+        "ttft_p95": round(percentile(ttfts, 95), 3) if ttfts else None,
+        "tokens_per_second": round(eval_tokens / eval_seconds, 1) if eval_seconds else None,
+        "cold_load_ms": max((r.get("load_duration_ms") or 0 for r in ok), default=None),
+    }
+    for p in PERCENTILES:
+        value = percentile(latencies, p)
+        summary[f"latency_p{p}"] = round(value, 3) if value is not None else None
+    summary.update(memory)
+    return summary
+
+def benchmark_model(host, model, corpus, repeats, concurrency, stream, num_predict):
+    """Run the corpus `repeats` times against one model; returns (records, summary)"""
+    jobs = [(name, prompt, repeat) for repeat in range(1, repeats + 1) for name, prompt in corpus]
+
+    def run(job):
+        name, prompt, repeat = job
+        return dict(ask_model(host, model, prompt, stream, num_predict), prompt=name, repeat=repeat)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        records = list(pool.map(run, jobs))
+    wall_time = time.perf_counter() - start
+    return records, summarize(model, records, wall_time, model_memory(host, model))
+
+def save_to_markdown(path, corpus, records, summaries):
+    """Summary table plus the first reply of every model to every prompt"""
+    now = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M")
     with open(path, "w") as f:
         f.write(f"# 🤖 Model Comparison – {now}\n\n")
-        f.write("### 📥 Prompt\n")
-        f.write(f"```\n{prompt.strip()}\n```\n\n")
+        f.write("| Model | Requests | Errors | p50 (s) | p95 (s) | p99 (s) | TTFT p50 (s) | Tokens/s | VRAM (MB) |\n")
+        f.write("|---|---|---|---|---|---|---|---|---|\n")
+        for s in summaries:
+            f.write(f"| `{s['model']}` | {s['requests']} | {s['errors']} | {s['latency_p50']} | {s['latency_p95']} | "
+                    f"{s['latency_p99']} | {s['ttft_p50']} | {s['tokens_per_second']} | {s.get('vram_mb', '')} |\n")
+        f.write("\n")
+        for name, prompt in corpus:
+            f.write(f"---\n## 📥 Prompt `{name}`\n```\n{prompt}\n```\n\n")
+            for record in records:
+                if record["prompt"] == name and record["repeat"] == 1:
+                    f.write(f"### 🤖 Model: `{record['model']}`\n```\n")
+                    f.write(record["reply"] if record["ok"] else f"[ERROR: {record['error']}]")
+                    f.write("\n```\n\n")
 
-        for model, reply in responses.items():
-            f.write(f"---\n### 🤖 Model: `{model}`\n")
-            f.write("```\n")
-            f.write(reply)
-            f.write("\n```\n\n")
+def save_results(output_dir, corpus, records, summaries, settings):
+    """Write .md, .json and .csv with a shared timestamped name; returns the base path"""
+    now = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M")
+    os.makedirs(output_dir, exist_ok=True)
+    base = os.path.join(output_dir, f"model_comparison_{now}")
 
-    print(f"\n📄 Markdown saved to: `{path}`")
+    save_to_markdown(f"{base}.md", corpus, records, summaries)
+    with open(f"{base}.json", "w") as f:
+        json.dump({"settings": settings, "summary": summaries, "requests": records}, f, indent=2)
+    with open(f"{base}.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for record in records:
+            writer.writerow({field: record.get(field) for field in CSV_FIELDS})
+    return base
 
 def main():
-    print("🧪 Comparing Ollama model responses...\n")
-    prompt = input("Enter prompt (or press Enter to use default):\n").strip()
-    if not prompt:
-        prompt = DEFAULT_PROMPT
+    parser = argparse.ArgumentParser(description="Benchmark Ollama models on Trello-style prompts")
+    parser.add_argument("--models", default=",".join(MODELS), help="comma separated model names")
+    parser.add_argument("--prompt", action="append", default=[], metavar="PATH",
+                        help="extra prompt file or directory of prompt files (repeatable)")
+    parser.add_argument("--no-cards", action="store_true", help="leave the mock_data cards out of the corpus")
+    parser.add_argument("--repeats", type=int, default=3, help="runs of the corpus per model")
+    parser.add_argument("--concurrency", type=int, default=1, help="parallel requests per model")
+    parser.add_argument("--num-predict", type=int, default=None, help="cap generated tokens per request")
+    parser.add_argument("--no-stream", action="store_true", help="non-streaming requests (no TTFT)")
+    parser.add_argument("--host", default=os.getenv("OLLAMA_HOST", "http://localhost:11434"))
+    parser.add_argument("--fake", action="store_true", help="run against an in-process fake Ollama server")
+    parser.add_argument("--output-dir", default="model_logs")
+    args = parser.parse_args()
+
+    fake = None
+    host = args.host.rstrip("/")
+    if args.fake:
+        from fake_services import FakeOllama
+        fake = FakeOllama(tokens_per_second=150, first_token_delay=0.05, load_delay=0.5, jitter_ratio=0.2)
+        host = fake.start()
 
-    responses = {}
+    models = [model.strip() for model in args.models.split(",") if model.strip()]
+    corpus = load_corpus(args.prompt, include_cards=not args.no_cards)
+    print(f"🧪 Benchmarking {len(models)} model(s) on {len(corpus)} prompt(s) x {args.repeats} "
+          f"at concurrency {args.concurrency} against {host}\n")
 
-    for model in MODELS:
-        print(f"\n--- 🤖 Model: {model} ---")
-        output = ask_model(model, prompt)
-        print(output)
-        print("-" * 50)
-        responses[model] = output
+    records, summaries = [], []
+    try:
+        for model in models:
+            model_records, summary = benchmark_model(host, model, corpus, args.repeats, args.concurrency,
+                                                     not args.no_stream, args.num_predict)
+            records.extend(model_records)
+            summaries.append(summary)
+            print(f"--- 🤖 {model}: {summary['requests'] - summary['errors']}/{summary['requests']} ok, "
+                  f"p50 {seconds(summary['latency_p50'])}, p95 {seconds(summary['latency_p95'])}, "
+                  f"p99 {seconds(summary['latency_p99'])}, TTFT p50 {seconds(summary['ttft_p50'])}, "
+                  f"{summary['tokens_per_second']} tokens/s")
+    finally:
+        if fake:
+            fake.stop()
 
-    save_to_markdown(prompt, responses)
+    settings = {"host": host, "models": models, "repeats": args.repeats, "concurrency": args.concurrency,
+                "stream": not args.no_stream, "num_predict": args.num_predict, "fake": args.fake}
+    base = save_results(args.output_dir, corpus, records, summaries, settings)
+    print(f"\n📄 Results saved to: `{base}.md`, `.json` and `.csv`")
+    return 1 if any(s["errors"] == s["requests"] for s in summaries) else 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
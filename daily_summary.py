@@ -1,31 +1,117 @@
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from trello_utils import fetch_cards_from_list
-from ai_utils import summarize_for_morning
+from ai_utils import summarize_for_morning, is_ai_error
 from slack_utils import post_to_main, log_to_slack
+from summary_store import card_content_hash, load_summary_store, save_summary_store, make_entry
 
 load_dotenv()
 
 IN_PROGRESS_LIST_ID = os.getenv("IN_PROGRESS_LIST_ID")
 SLACK_CHANNEL = os.getenv("SLACK_CHANNEL")
 
+# Number of cards summarized concurrently (keep it near OLLAMA_NUM_PARALLEL on the Ollama host)
+DAILY_SUMMARY_WORKERS = max(1, int(os.getenv("DAILY_SUMMARY_WORKERS", "4")))
+# Post every card summary as soon as it is ready, before the digest
+DAILY_SUMMARY_STREAM = os.getenv("DAILY_SUMMARY_STREAM", "true").lower() == "true"
+SLACK_DIGEST_MAX_CHARS = 3500  # Longer digests are split over several messages
+
+# Only what is needed to summarize a card and decide whether yesterday's summary is stale
+SUMMARY_CARD_FIELDS = "name,desc,url,dateLastActivity"
+
+def summarize_card(card):
+    """Summarize one card, returns (summary, ok)"""
+    try:
+        summary = summarize_for_morning(card)
+    except Exception as e:
+        return f"⚠️ Summary failed: {e}", False
+    if is_ai_error(summary):
+        return f"⚠️ Summary failed: {summary}", False
+    return summary, True
+
+def summarize_cards(cards):
+    """
+    Summarize cards with a bounded worker pool. Summaries are streamed to Slack as they
+    finish; returns {card_id: (summary, ok)}.
+    """
+    results = {}
+    with ThreadPoolExecutor(max_workers=DAILY_SUMMARY_WORKERS, thread_name_prefix="summary") as pool:
+        futures = {pool.submit(summarize_card, card): card for card in cards}
+        for future in as_completed(futures):
+            card = futures[future]
+            summary, ok = future.result()
+            results[card['id']] = (summary, ok)
+            if DAILY_SUMMARY_STREAM and ok:
+                post_to_main(f"📌 *{card['name']}*\n{summary}\n{card['url']}")
+    return results
+
+def build_digest(cards, results):
+    """One line per card in list order, split into Slack-sized messages"""
+    lines = []
+    for card in cards:
+        summary, ok = results[card['id']]
+        first_line = summary.strip().split("\n", 1)[0]
+        if len(first_line) > 200:
+            first_line = first_line[:197] + "..."
+        lines.append(f"• <{card['url']}|{card['name']}> – {first_line}")
+
+    messages = []
+    current = f"🌅 *Morning digest* – {len(cards)} card(s) in progress"
+    for line in lines:
+        if len(current) + len(line) + 1 > SLACK_DIGEST_MAX_CHARS:
+            messages.append(current)
+            current = line
+        else:
+            current += "\n" + line
+    messages.append(current)
+    return messages
+
 def main():
     try:
         log_to_slack("🌅 Starting daily summary script")
+        start_time = time.time()
 
         # Fetch all in-progress cards
-        cards = fetch_cards_from_list(IN_PROGRESS_LIST_ID)
+        cards = fetch_cards_from_list(IN_PROGRESS_LIST_ID, fields=SUMMARY_CARD_FIELDS, comments_limit=3)
         if not cards:
             post_to_main("✅ No active cards in progress this morning.")
             log_to_slack("📭 No cards to summarize.")
             return
 
+        # Reuse yesterday's summary for every card whose content did not change
+        store = load_summary_store()
+        results = {}
+        stale_cards = []
+        for card in cards:
+            entry = store.get(card['id'])
+            if entry and entry['hash'] == card_content_hash(card):
+                results[card['id']] = (entry['summary'], True)
+                if DAILY_SUMMARY_STREAM:
+                    post_to_main(f"📌 *{card['name']}*\n{entry['summary']}\n{card['url']}")
+            else:
+                stale_cards.append(card)
+
+        results.update(summarize_cards(stale_cards))
+        for message in build_digest(cards, results):
+            post_to_main(message)
+
+        # Keep only cards still in progress, and never store failed summaries
+        stale_ids = {card['id'] for card in stale_cards}
+        new_store = {}
         for card in cards:
-            summary = summarize_for_morning(card)
-            msg = f"📌 *{card['name']}*\n{summary}\n{card['url']}"
-            post_to_main(msg)
+            summary, ok = results[card['id']]
+            if ok:
+                new_store[card['id']] = make_entry(card, summary) if card['id'] in stale_ids else store[card['id']]
+        save_summary_store(new_store)
 
-        log_to_slack(f"✅ Sent {len(cards)} card summaries to Slack")
+        failed = sum(not ok for _, ok in results.values())
+        reused_count = len(cards) - len(stale_cards)
+        log_to_slack(f"✅ Sent {len(cards)} card summaries to Slack in {time.time() - start_time:.1f}s "
+                     f"({DAILY_SUMMARY_WORKERS} workers, {failed} failed)")
+        log_to_slack(f"♻️ Reused {reused_count} unchanged summaries - saved {reused_count} LLM call(s), "
+                     f"{len(stale_cards)} card(s) re-summarized")
 
     except Exception as e:
         log_to_slack(f"❌ Error in daily summary: {str(e)}")
@@ -0,0 +1,340 @@
+"""
+In-process fake servers for benchmarks and load tests, so they run without GPUs or accounts.
+
+FakeOllama speaks enough of the Ollama API (/api/generate streaming and non-streaming,
+/api/ps, /api/version, /api/tags) for the AI code paths, with configurable timing.
+FakeTrello covers the REST endpoints the bot uses (TRELLO_API_URL) and FakeSlack the
+chat.postMessage call (SLACK_API_URL).
+"""
+
+import sys
+import json
+import time
+import random
+import threading
+from collections import Counter
+from urllib.parse import urlsplit, parse_qsl
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("implement the component and expose it to blueprints so designers can tune the values "
+         "in the editor then add a replicated property and test it in a listen server session").split()
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Pooled clients drop idle keep-alive connections; that is not worth a traceback
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+class _FakeServer:
+    """Threaded HTTP server on a free local port, started and stopped with the owning object"""
+
+    def __init__(self, handler_class):
+        self.server = _QuietHTTPServer(("127.0.0.1", 0), handler_class)
+        self.server.fake = self
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name=type(self).__name__, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def read_params(self):
+        """Query string and form or JSON body merged into one dict"""
+        parts = urlsplit(self.path)
+        params = dict(parse_qsl(parts.query, keep_blank_values=True))
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if body:
+            if "json" in (self.headers.get("Content-Type") or ""):
+                params.update(json.loads(body))
+            else:
+                params.update(parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+        return parts.path, params
+
+    def send_json(self, data, status=200, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+class _OllamaHandler(_JSONHandler):
+    def do_GET(self):
+        fake = self.server.fake
+        if self.path.startswith("/api/version"):
+            self.send_json({"version": "0.0.0-fake"})
+        elif self.path.startswith("/api/tags"):
+            self.send_json({"models": [{"name": model} for model in sorted(fake.loaded)]})
+        elif self.path.startswith("/api/ps"):
+            self.send_json({"models": [{"name": model, "model": model, "size": fake.model_size,
+                                        "size_vram": fake.model_size} for model in sorted(fake.loaded)]})
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        if not self.path.startswith("/api/generate"):
+            self.send_json({"error": "not found"}, status=404)
+            return
+        fake = self.server.fake
+        request = self.read_json()
+        fake.count_request(request)
+        model = request.get("model", "fake")
+        start = time.perf_counter()
+
+        load_seconds = 0.0
+        with fake.lock:
+            if model not in fake.loaded:
+                fake.loaded.add(model)
+                load_seconds = fake.load_delay
+        time.sleep(load_seconds + fake.jitter(fake.first_token_delay))
+
+        prompt = f"{request.get('system', '')} {request.get('prompt', '')}"
+        prompt_tokens = max(1, len(prompt.split()))
+        num_predict = request.get("options", {}).get("num_predict") or fake.response_tokens
+        tokens = [WORDS[i % len(WORDS)] + " " for i in range(min(fake.response_tokens, num_predict))]
+        if request.get("format") == "json":
+            tokens = ['{"context": {"GameSystem": "Dungeon", "Mode": "Dungeon", "Subsystem": "Loot"}, ',
+                      '"advice": "' + "".join(tokens).strip() + '"}']
+        token_delay = 1.0 / fake.tokens_per_second
+
+        def final_chunk():
+            total = time.perf_counter() - start
+            return {
+                "model": model, "done": True,
+                "prompt_eval_count": prompt_tokens, "eval_count": len(tokens),
+                "load_duration": int(load_seconds * 1e9),
+                "prompt_eval_duration": int(fake.first_token_delay * 1e9),
+                "eval_duration": int(len(tokens) * token_delay * 1e9),
+                "total_duration": int(total * 1e9),
+            }
+
+        if request.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for index, token in enumerate(tokens):
+                if index:
+                    time.sleep(token_delay)
+                self._write_chunk({"model": model, "response": token, "done": False})
+            self._write_chunk(final_chunk())
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            time.sleep(token_delay * max(0, len(tokens) - 1))
+            self.send_json(dict(final_chunk(), response="".join(tokens)))
+
+    def _write_chunk(self, data):
+        line = (json.dumps(data) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+class FakeOllama(_FakeServer):
+    """
+    Fake Ollama server. Generates `response_tokens` tokens at `tokens_per_second` after
+    `first_token_delay` seconds (plus `load_delay` on the first request per model), with
+    +/- `jitter_ratio` random variation. Every request payload is kept in `requests`.
+    """
+
+    def __init__(self, tokens_per_second=200.0, first_token_delay=0.05, response_tokens=40,
+                 load_delay=0.0, jitter_ratio=0.0, model_size=4_000_000_000, seed=None):
+        super().__init__(_OllamaHandler)
+        self.tokens_per_second = tokens_per_second
+        self.first_token_delay = first_token_delay
+        self.response_tokens = response_tokens
+        self.load_delay = load_delay
+        self.jitter_ratio = jitter_ratio
+        self.model_size = model_size
+        self.loaded = set()
+        self.requests = []
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+
+    def jitter(self, seconds):
+        with self.lock:
+            return seconds * (1 + self.random.uniform(-self.jitter_ratio, self.jitter_ratio))
+
+    def count_request(self, request):
+        with self.lock:
+            self.requests.append(request)
+
+class _TrelloHandler(_JSONHandler):
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def _handle(self, method):
+        fake = self.server.fake
+        path, params = self.read_params()
+        time.sleep(fake.jitter(fake.latency))
+        if fake.error_rate and fake.random_value() < fake.error_rate:
+            self.send_json({"message": "fake server error"}, status=500)
+            return
+        parts = [part for part in path.split("/") if part][1:]  # Drop the API version
+        with fake.lock:
+            fake.calls[f"{method} /{parts[0] if parts else ''}"] += 1
+            result = fake.dispatch(method, parts, params, self.headers)
+        status, data, headers = result if len(result) == 3 else (*result, None)
+        if status == 304:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            self.send_json(data, status=status, headers=headers)
+
+class FakeTrello(_FakeServer):
+    """
+    Fake Trello REST API (mount it as TRELLO_API_URL = url + "/1"). Cards are created on first
+    access when `auto_create_cards` is set; every comment's arrival time is kept per card in
+    `comment_times` so load tests can measure when the AI reply landed.
+    """
+
+    def __init__(self, latency=0.02, jitter_ratio=0.0, error_rate=0.0, auto_create_cards=True, seed=None):
+        super().__init__(_TrelloHandler)
+        self.latency = latency
+        self.jitter_ratio = jitter_ratio
+        self.error_rate = error_rate
+        self.auto_create_cards = auto_create_cards
+        self.cards = {}
+        self.labels = {}
+        self.lists = {"list1": "In Progress"}
+        self.comment_times = {}  # card_id -> [time.perf_counter() of each comment]
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self._next_id = 1
+
+    def jitter(self, seconds):
+        with self.lock:
+            return seconds * (1 + self.random.uniform(-self.jitter_ratio, self.jitter_ratio))
+
+    def random_value(self):
+        with self.lock:
+            return self.random.random()
+
+    def _new_id(self):
+        self._next_id += 1
+        return f"{self._next_id:024x}"
+
+    def add_card(self, card_id, name, desc="", list_id="list1"):
+        with self.lock:
+            return self._add_card(card_id, name, desc, list_id)
+
+    def _add_card(self, card_id, name, desc="", list_id="list1"):
+        card = {"id": card_id, "name": name, "desc": desc, "url": f"https://trello.invalid/c/{card_id}",
+                "idList": list_id, "idLabels": [], "comments": []}
+        self.cards[card_id] = card
+        return card
+
+    def _card(self, card_id):
+        card = self.cards.get(card_id)
+        if card is None and self.auto_create_cards:
+            card = self._add_card(card_id, f"Load test card {card_id}",
+                                  "When the boss dies in a Dungeon, a locked chest should spawn nearby.")
+        return card
+
+    @staticmethod
+    def _public(card):
+        return {key: value for key, value in card.items() if key != "comments"}
+
+    def dispatch(self, method, parts, params, headers):
+        """Answer one request (caller holds the lock); returns (status, data[, headers])"""
+        resource = parts[0] if parts else ""
+        sub = parts[2] if len(parts) > 2 else None
+        length = len(parts)
+        if resource == "cards" and length >= 2:
+            card = self._card(parts[1])
+            if card is None:
+                return 404, {"message": "card not found"}
+            if method == "GET" and length == 2:
+                return 200, self._public(card)
+            if method == "PUT" and length == 2:
+                if "desc" in params:
+                    card["desc"] = params["desc"]
+                if "idLabels" in params:
+                    card["idLabels"] = [label for label in params["idLabels"].split(",") if label]
+                return 200, self._public(card)
+            if method == "POST" and sub == "actions":
+                card["comments"].append(params.get("text", ""))
+                self.comment_times.setdefault(card["id"], []).append(time.perf_counter())
+                return 200, {"id": self._new_id(), "type": "commentCard", "data": {"text": params.get("text", "")}}
+            if method == "POST" and sub == "idLabels":
+                if params.get("value") not in card["idLabels"]:
+                    card["idLabels"].append(params.get("value"))
+                return 200, card["idLabels"]
+        if resource == "boards" and method == "GET":
+            labels = [{"id": label_id, "name": name} for label_id, name in self.labels.items()]
+            if sub == "labels":
+                etag = f'"{len(labels)}"'
+                if headers.get("If-None-Match") == etag:
+                    return 304, None
+                return 200, labels, {"ETag": etag}
+            if sub == "lists":
+                return 200, [{"id": list_id, "name": name} for list_id, name in self.lists.items()]
+            return 200, {"id": parts[1] if length > 1 else "board", "name": "Fake board",
+                         "cards": [self._public(card) for card in self.cards.values()],
+                         "lists": [{"id": list_id, "name": name} for list_id, name in self.lists.items()],
+                         "labels": labels, "actions": []}
+        if resource == "labels" and method == "POST":
+            label_id = self._new_id()
+            self.labels[label_id] = params.get("name", "")
+            return 200, {"id": label_id, "name": params.get("name", "")}
+        if resource == "lists" and sub == "cards" and method == "GET":
+            return 200, [self._public(card) for card in self.cards.values() if card["idList"] == parts[1]]
+        return 404, {"message": f"not faked: {method} /{'/'.join(parts)}"}
+
+class _SlackHandler(_JSONHandler):
+    def do_POST(self):
+        fake = self.server.fake
+        path, params = self.read_params()
+        time.sleep(fake.latency)
+        if not path.endswith("/chat.postMessage"):
+            self.send_json({"ok": False, "error": "unknown_method"})
+            return
+        with fake.lock:
+            fake.messages.append((params.get("channel"), params.get("text", "")))
+            ts = f"{time.time():.6f}"
+        self.send_json({"ok": True, "channel": params.get("channel"), "ts": ts})
+
+class FakeSlack(_FakeServer):
+    """Fake Slack Web API (SLACK_API_URL = url + "/api/"); posted messages are kept in `messages`"""
+
+    def __init__(self, latency=0.01):
+        super().__init__(_SlackHandler)
+        self.latency = latency
+        self.messages = []
+        self.lock = threading.Lock()
@@ -0,0 +1,150 @@
+import os
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from tracing import span
+
+load_dotenv()
+
+# Connection pool sizing - one keep-alive pool per host, shared by all threads of a service
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))  # Number of hosts to keep pools for
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))         # Keep-alive connections per host
+
+# Retry with jittered exponential backoff
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))  # Seconds
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "10"))     # Seconds
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+
+# Base URL of the Trello REST API (point it at a stand-in server for load tests)
+TRELLO_API_URL = os.getenv("TRELLO_API_URL", "https://api.trello.com/1").rstrip("/")
+
+# Default (connect, read) timeout per service
+SERVICE_TIMEOUTS = {
+    "trello": (HTTP_CONNECT_TIMEOUT, float(os.getenv("TRELLO_TIMEOUT", "30"))),
+    "ollama": (HTTP_CONNECT_TIMEOUT, float(os.getenv("OLLAMA_TIMEOUT", "60"))),
+    "openai": (HTTP_CONNECT_TIMEOUT, float(os.getenv("OPENAI_TIMEOUT", "60"))),
+}
+DEFAULT_TIMEOUT = (HTTP_CONNECT_TIMEOUT, 30)
+
+# Client-side request pacing per service (requests per second, shared by all threads).
+# Trello allows 100 requests per 10 seconds per token.
+SERVICE_RATE_LIMITS = {
+    "trello": float(os.getenv("TRELLO_RATE_LIMIT", "9")),
+}
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_next_slot = {}     # service -> monotonic time of the next free request slot
+_paused_until = {}  # service -> monotonic time a 429 told us to wait until
+_pacing_lock = threading.Lock()
+
+def get_session(service):
+    """Return the shared pooled session for a service ("trello", "ollama", "openai", ...)"""
+    session = _sessions.get(service)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(service)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS,
+                                      pool_maxsize=HTTP_POOL_MAXSIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _sessions[service] = session
+    return session
+
+def backoff_delay(attempt, retry_after=None):
+    """Seconds to wait before the next attempt (full jitter, honours Retry-After)"""
+    if retry_after:
+        try:
+            return min(float(retry_after), 60)
+        except ValueError:
+            pass  # HTTP-date format, fall back to our own backoff
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+def _pace(service):
+    """Wait for the next request slot of a rate limited service"""
+    rate = SERVICE_RATE_LIMITS.get(service)
+    if not rate:
+        return
+    while True:
+        with _pacing_lock:
+            now = time.monotonic()
+            slot = max(now, _next_slot.get(service, now))
+            _next_slot[service] = slot + 1.0 / rate
+        if slot > now:
+            time.sleep(slot - now)
+        with _pacing_lock:
+            # A 429 seen while we slept pushes this request behind the pause as well
+            if _paused_until.get(service, 0) <= slot:
+                return
+
+def _pause(service, seconds):
+    """Push back every thread's next request after the service answered 429"""
+    if service not in SERVICE_RATE_LIMITS:
+        return
+    with _pacing_lock:
+        resume = time.monotonic() + seconds
+        _paused_until[service] = max(_paused_until.get(service, 0), resume)
+        _next_slot[service] = max(_next_slot.get(service, resume), resume)
+
+def http_request(service, method, url, timeout=None, retries=None, idempotent=None,
+                 retry_timeouts=True, **kwargs):
+    """
+    Send a request through the pooled keep-alive session of a service.
+
+    Every call gets a timeout (the service default unless given). Connect timeouts and
+    429 responses are retried for every method because the server never acted on them;
+    other connection errors, read timeouts and 5xx responses are only retried when the
+    request is idempotent. Pass retry_timeouts=False for slow calls such as LLM generations
+    where a read timeout means the work itself is too slow. Services in SERVICE_RATE_LIMITS
+    are paced across threads, and a 429 holds back every thread of that service.
+    Returns the last response, or raises the last exception.
+    """
+    method = method.upper()
+    if timeout is None:
+        timeout = SERVICE_TIMEOUTS.get(service, DEFAULT_TIMEOUT)
+    if retries is None:
+        retries = HTTP_MAX_RETRIES
+    if idempotent is None:
+        idempotent = method in IDEMPOTENT_METHODS
+
+    session = get_session(service)
+    for attempt in range(retries + 1):
+        _pace(service)
+        try:
+            with span(f"{service} {method}", url=url.split("?", 1)[0], attempt=attempt) as request_span:
+                response = session.request(method, url, timeout=timeout, **kwargs)
+                request_span.set(status=response.status_code)
+        except requests.exceptions.ConnectTimeout:
+            if attempt == retries:
+                raise
+            retry_after = None
+        except requests.exceptions.Timeout:
+            if attempt == retries or not idempotent or not retry_timeouts:
+                raise
+            retry_after = None
+        except requests.exceptions.ConnectionError:
+            if attempt == retries or not idempotent:
+                raise
+            retry_after = None
+        else:
+            retryable = response.status_code == 429 or (
+                idempotent and response.status_code in RETRY_STATUS_CODES)
+            if not retryable or attempt == retries:
+                return response
+            retry_after = response.headers.get("Retry-After")
+            response.close()
+            if response.status_code == 429:
+                delay = backoff_delay(attempt, retry_after)
+                _pause(service, delay)  # The slot wait in _pace does the sleeping
+                continue
+        time.sleep(backoff_delay(attempt, retry_after))
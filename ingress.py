@@ -0,0 +1,123 @@
+import os
+import time
+import threading
+from bisect import bisect_left
+from dotenv import load_dotenv
+from slack_utils import log_to_slack
+from metrics import WEBHOOKS_TOTAL, INGRESS_SECONDS
+
+load_dotenv()
+
+# Backpressure on the webhook endpoint, by queue depth (pending + in-flight requests)
+INGRESS_HIGH_WATER = int(os.getenv("INGRESS_HIGH_WATER", "200"))   # Above this, updateCard events are shed
+INGRESS_HARD_LIMIT = int(os.getenv("INGRESS_HARD_LIMIT", "1000"))  # Above this, commentCard events get a 503
+INGRESS_MAX_BODY = int(os.getenv("INGRESS_MAX_BODY", str(1024 * 1024)))  # Bytes, larger webhook bodies get a 413
+
+LATENCY_BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000]
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of latencies in milliseconds"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last one counts everything above the largest bucket
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, ms):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, ms)] += 1
+            self.count += 1
+            self.total_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile (the maximum for the overflow bucket)"""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = self.count * p / 100
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank and count:
+                    return self.buckets[index] if index < len(self.buckets) else round(self.max_ms, 3)
+            return round(self.max_ms, 3)
+
+    def snapshot(self):
+        with self._lock:
+            count = self.count
+            buckets = {f"le_{bound}ms": n for bound, n in zip(self.buckets, self.counts)}
+            buckets["inf"] = self.counts[-1]
+            avg = round(self.total_ms / count, 3) if count else None
+            max_ms = round(self.max_ms, 3)
+        return {
+            'count': count,
+            'avg_ms': avg,
+            'p50_ms': self.percentile(50),
+            'p99_ms': self.percentile(99),
+            'max_ms': max_ms,
+            'buckets': buckets,
+        }
+
+_histograms = {}  # server ("flask", "asgi") -> LatencyHistogram
+_outcomes = {}    # outcome ("queued", "skipped", "shed", ...) -> count
+_stats_lock = threading.Lock()
+
+# Shedding is logged when it starts and when it ends, not once per dropped event
+_shedding = {'active': False, 'since': None, 'shed': 0, 'refused': 0}
+_shedding_lock = threading.Lock()
+
+def check_backpressure(action_type, depth):
+    """
+    Decide whether to take an event at the current queue depth.
+    Returns None to accept it, ('shed', 200) to drop an update (Trello must not retry it, the next
+    edit brings the card back) or ('refused', 503) to make Trello redeliver a comment later.
+    """
+    verdict = None
+    if action_type == 'updateCard' and depth >= INGRESS_HIGH_WATER:
+        verdict = ('shed', 200)
+    elif depth >= INGRESS_HARD_LIMIT:
+        verdict = ('refused', 503)
+
+    with _shedding_lock:
+        if verdict is not None:
+            _shedding[verdict[0]] += 1
+            if not _shedding['active']:
+                _shedding.update(active=True, since=time.time())
+                log_to_slack(f"🚧 Webhook queue at {depth} requests - shedding updateCard events "
+                             f"(commentCard is refused above {INGRESS_HARD_LIMIT})")
+        elif _shedding['active'] and depth < INGRESS_HIGH_WATER:
+            log_to_slack(f"🟢 Webhook queue back to {depth} requests - stopped shedding after "
+                         f"{time.time() - _shedding['since']:.0f}s ({_shedding['shed']} shed, "
+                         f"{_shedding['refused']} refused)")
+            _shedding.update(active=False, since=None, shed=0, refused=0)
+    return verdict
+
+def record_ingress(server, outcome, seconds):
+    """Count one webhook request and its handling time"""
+    with _stats_lock:
+        histogram = _histograms.get(server)
+        if histogram is None:
+            histogram = _histograms[server] = LatencyHistogram()
+        _outcomes[outcome] = _outcomes.get(outcome, 0) + 1
+    histogram.observe(seconds * 1000)
+    WEBHOOKS_TOTAL.inc(server=server, outcome=outcome)
+    INGRESS_SECONDS.observe(seconds, server=server)
+
+def get_ingress_stats():
+    """Request outcomes, shedding state and latency histograms per server"""
+    with _stats_lock:
+        histograms = dict(_histograms)
+        outcomes = dict(_outcomes)
+    with _shedding_lock:
+        shedding = _shedding['active']
+    return {
+        'outcomes': outcomes,
+        'shedding': shedding,
+        'high_water': INGRESS_HIGH_WATER,
+        'hard_limit': INGRESS_HARD_LIMIT,
+        'latency': {server: histogram.snapshot() for server, histogram in histograms.items()},
+    }
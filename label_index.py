@@ -0,0 +1,209 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from dotenv import load_dotenv
+from http_utils import http_request, TRELLO_API_URL
+from slack_utils import log_to_slack
+
+load_dotenv()
+
+TRELLO_KEY = os.getenv("TRELLO_KEY")
+TRELLO_TOKEN = os.getenv("TRELLO_TOKEN")
+TRELLO_BOARD_ID = os.getenv("TRELLO_BOARD_ID")
+
+# Board labels by normalized name, refreshed from Trello and mirrored to LABEL_MAP_FILE
+LABEL_MAP_FILE = os.getenv("LABEL_MAP_FILE", "label_map.json")
+LABEL_INDEX_TTL = float(os.getenv("LABEL_INDEX_TTL", "600"))  # Seconds between refreshes
+LABEL_AUTO_CREATE = os.getenv("LABEL_AUTO_CREATE", "false").lower() == "true"  # Create labels the board lacks (unreviewed AI tags)
+LABEL_MISS_REFRESH_AGE = 30  # An unknown tag re-reads labels at most this often (seconds)
+
+_SEPARATORS = re.compile(r"\s*[/,&|+]\s*")
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_create_lock = threading.Lock()
+_labels_by_key = {}   # normalized name -> label id
+_names_by_key = {}    # normalized name -> name as on the board
+_content_hash = None
+_etag = None
+_refreshed_at = 0.0
+_loaded = False
+_stats = {'refreshes': 0, 'unchanged': 0, 'created': 0, 'unmatched': 0}
+
+def normalize_label(name):
+    """Case-, whitespace- and punctuation-insensitive key ("Combat-AI " -> "combatai")"""
+    return _NON_ALNUM.sub("", (name or "").lower())
+
+def _set_labels(label_map):
+    """Replace the index with {name: id}; returns False if nothing changed (caller holds the lock)"""
+    global _content_hash
+    content_hash = hashlib.sha256(json.dumps(label_map, sort_keys=True).encode("utf-8")).hexdigest()
+    if content_hash == _content_hash:
+        return False
+    _content_hash = content_hash
+    _labels_by_key.clear()
+    _names_by_key.clear()
+    for name, label_id in label_map.items():
+        key = normalize_label(name)
+        if key and key not in _labels_by_key:
+            _labels_by_key[key] = label_id
+            _names_by_key[key] = name
+    return True
+
+def _save_label_map():
+    """Mirror the index to label_map.json as a warm start for the next process (caller holds the lock)"""
+    label_map = {_names_by_key[key]: label_id for key, label_id in _labels_by_key.items()}
+    tmp_path = f"{LABEL_MAP_FILE}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(label_map, f, indent=2)
+    os.replace(tmp_path, LABEL_MAP_FILE)
+
+def _ensure_loaded():
+    """Read label_map.json on first use (caller holds the lock)"""
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    try:
+        with open(LABEL_MAP_FILE, "r") as f:
+            _set_labels(json.load(f))
+    except FileNotFoundError:
+        pass
+
+def load_labels(labels):
+    """Feed board labels fetched elsewhere (e.g. with the board snapshot) into the index"""
+    global _refreshed_at
+    with _lock:
+        _ensure_loaded()
+        if _set_labels({label["name"]: label["id"] for label in labels if label.get("name")}):
+            _save_label_map()
+        _refreshed_at = time.time()
+
+def refresh_label_index(max_age=LABEL_INDEX_TTL):
+    """
+    Re-read the board labels when the index is older than max_age seconds (0 forces a refresh).
+    A 304 to our If-None-Match, or an unchanged label list, leaves the index as it is.
+    Returns True if the labels changed.
+    """
+    global _etag, _refreshed_at
+    if not TRELLO_BOARD_ID:
+        return False
+    with _refresh_lock:
+        if time.time() - _refreshed_at < max_age:
+            return False
+        url = f"{TRELLO_API_URL}/boards/{TRELLO_BOARD_ID}/labels"
+        params = {
+            "key": TRELLO_KEY,
+            "token": TRELLO_TOKEN,
+            "fields": "name",
+            "limit": 1000
+        }
+        headers = {"If-None-Match": _etag} if _etag else {}
+        response = http_request("trello", "GET", url, params=params, headers=headers)
+        with _lock:
+            _ensure_loaded()
+            _refreshed_at = time.time()
+            _stats['refreshes'] += 1
+            if response.status_code == 304:
+                _stats['unchanged'] += 1
+                return False
+            response.raise_for_status()
+            _etag = response.headers.get("ETag")
+            changed = _set_labels({label["name"]: label["id"] for label in response.json() if label["name"]})
+            if changed:
+                _save_label_map()
+            else:
+                _stats['unchanged'] += 1
+            return changed
+
+def match_labels(tags):
+    """
+    Return (label_ids, unmatched) for AI-produced tags using the current index. A tag matches
+    as a whole or part by part ("UI / Economy"); unmatched holds the parts with no label.
+    Every lookup is a dict hit on the normalized name.
+    """
+    label_ids = []
+    unmatched = []
+    with _lock:
+        _ensure_loaded()
+        for tag in tags:
+            label_id = _labels_by_key.get(normalize_label(tag))
+            parts = [tag] if label_id else [part for part in _SEPARATORS.split(tag) if normalize_label(part)]
+            for part in parts:
+                label_id = _labels_by_key.get(normalize_label(part))
+                if label_id is None:
+                    unmatched.append(part.strip())
+                elif label_id not in label_ids:
+                    label_ids.append(label_id)
+    return label_ids, unmatched
+
+def create_labels(names):
+    """Create every missing label in one pass; returns {name: id} of the labels created"""
+    created = {}
+    url = f"{TRELLO_API_URL}/labels"
+    with _create_lock:
+        # Another thread may have created some of them meanwhile
+        _, missing = match_labels(names)
+        unique = {}
+        for name in missing:
+            unique.setdefault(normalize_label(name), name)
+        for name in unique.values():
+            response = http_request("trello", "POST", url, params={
+                "key": TRELLO_KEY,
+                "token": TRELLO_TOKEN,
+                "name": name,
+                "color": "null",
+                "idBoard": TRELLO_BOARD_ID
+            })
+            if response.status_code == 200:
+                created[name] = response.json()["id"]
+            else:
+                log_to_slack(f"⚠️ Failed to create label '{name}': {response.status_code}")
+        if created:
+            with _lock:
+                for name, label_id in created.items():
+                    _labels_by_key[normalize_label(name)] = label_id
+                    _names_by_key[normalize_label(name)] = name
+                _stats['created'] += len(created)
+                _save_label_map()
+    if created:
+        log_to_slack(f"🏷️ Created {len(created)} new label(s): {', '.join(created)}")
+    return created
+
+def _safe_refresh(max_age):
+    try:
+        refresh_label_index(max_age)
+    except Exception as e:
+        log_to_slack(f"⚠️ Label refresh failed, using cached labels: {e}")
+
+def resolve_label_ids(tags):
+    """
+    Label ids for AI-produced tags. Unknown tags trigger one (conditional) refresh,
+    then are created in a batch when LABEL_AUTO_CREATE is on.
+    """
+    _safe_refresh(LABEL_INDEX_TTL)
+    label_ids, unmatched = match_labels(tags)
+    if unmatched and TRELLO_BOARD_ID:
+        # Someone may have added the label on the board since the last refresh
+        _safe_refresh(LABEL_MISS_REFRESH_AGE)
+        more_ids, unmatched = match_labels(unmatched)
+        label_ids.extend(label_id for label_id in more_ids if label_id not in label_ids)
+        if unmatched and LABEL_AUTO_CREATE:
+            create_labels(unmatched)
+            more_ids, unmatched = match_labels(unmatched)
+            label_ids.extend(label_id for label_id in more_ids if label_id not in label_ids)
+    if unmatched:
+        with _lock:
+            _stats['unmatched'] += len(unmatched)
+        log_to_slack(f"⚠️ No label for: {', '.join(unmatched)}")
+    return label_ids
+
+def get_label_stats():
+    """Label index size and refresh counters"""
+    with _lock:
+        return dict(_stats, labels=len(_labels_by_key),
+                    age_seconds=round(time.time() - _refreshed_at, 1) if _refreshed_at else None)
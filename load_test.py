@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Offline load test of the webhook pipeline.
+
+Starts local stand-ins for Trello, Ollama and Slack (fake_services.py), runs the webhook server
+in-process against them and replays a synthetic stream of updateCard/commentCard webhooks at a
+fixed rate. A webhook counts as done when its AI reply is posted to the fake Trello card.
+
+Reports end-to-end throughput, p50/p95/p99 latency per action type, webhook response time and
+queue depth over time; the full results are written to load_logs/ as JSON.
+
+    python load_test.py --rate 5 --duration 30
+    python load_test.py --rate 20 --duration 60 --tokens-per-second 80 --workers 4 --server asgi
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_services import FakeOllama, FakeTrello, FakeSlack
+
+DESCRIPTIONS = [
+    "When the boss dies in a Dungeon, a locked chest should spawn nearby with randomized loot based on dungeon tier.",
+    "Units in Formation ignore the hold position command after a siege battle starts.",
+    "Character rotation is not smooth on clients in multiplayer skirmishes.",
+    "Add a trade UI to the settlement market showing price history for each resource.",
+    "Archers in a castle siege should prefer targets on ladders over units at the gate.",
+]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay synthetic Trello webhooks against fake services")
+    parser.add_argument("--rate", type=float, default=5, help="webhooks per second")
+    parser.add_argument("--duration", type=float, default=20, help="seconds to send webhooks for")
+    parser.add_argument("--comment-share", type=float, default=0.3, help="share of commentCard events")
+    parser.add_argument("--poisson", action="store_true", help="exponential inter-arrival times instead of a fixed rate")
+    parser.add_argument("--drain-timeout", type=float, default=120, help="seconds to wait for outstanding replies")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="seconds between queue depth samples")
+    parser.add_argument("--server", choices=["flask", "asgi"], default="flask")
+    parser.add_argument("--workers", type=int, default=None, help="WEBHOOK_WORKERS (default: configured)")
+    parser.add_argument("--queue-backend", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--coalesce-window", type=float, default=None, help="COALESCE_WINDOW (default: configured)")
+    parser.add_argument("--trello-rate", type=float, default=None, help="TRELLO_RATE_LIMIT (default: configured)")
+    parser.add_argument("--trello-latency", type=float, default=0.05, help="fake Trello response time (s)")
+    parser.add_argument("--slack-latency", type=float, default=0.02, help="fake Slack response time (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=150, help="fake Ollama generation speed")
+    parser.add_argument("--first-token-delay", type=float, default=0.2, help="fake Ollama prompt processing time (s)")
+    parser.add_argument("--response-tokens", type=int, default=60, help="tokens per fake Ollama reply")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output-dir", default="load_logs")
+    return parser.parse_args()
+
+def configure_environment(args, trello, ollama, slack, work_dir):
+    """Point the bot at the fakes; must run before anything imports app"""
+    os.environ.update({
+        "MOCK_TRELLO": "false",
+        "TRELLO_API_URL": trello.url + "/1",
+        "TRELLO_KEY": "fake-key",
+        "TRELLO_TOKEN": "fake-token",
+        "TRELLO_BOARD_ID": "fakeboard",
+        "SLACK_API_URL": slack.url + "/api/",
+        "SLACK_BOT_TOKEN": "xoxb-fake",
+        "SLACK_CHANNEL": "#fake",
+        "SLACK_LOG_CHANNEL": "#fake-log",
+        "AI_PROVIDER": "ollama",
+        "OLLAMA_HOST": ollama.url,
+        "OLLAMA_HOSTS": ollama.url,
+        "AI_CACHE_ENABLED": "false",  # Every card should reach the model
+        "QUEUE_BACKEND": args.queue_backend,
+        "QUEUE_DB_FILE": os.path.join(work_dir, "webhook_queue.sqlite3"),
+        "LABEL_MAP_FILE": os.path.join(work_dir, "label_map.json"),
+        "METADATA_TRAINING_FILE": os.path.join(work_dir, "metadata_training.json"),
+        "SUMMARY_STORE_FILE": os.path.join(work_dir, "summary_store.json"),
+        "TRACE_FILE": os.path.join(work_dir, "traces.jsonl"),
+    })
+    if args.workers is not None:
+        os.environ["WEBHOOK_WORKERS"] = str(args.workers)
+    if args.coalesce_window is not None:
+        os.environ["COALESCE_WINDOW"] = str(args.coalesce_window)
+    if args.trello_rate is not None:
+        os.environ["TRELLO_RATE_LIMIT"] = str(args.trello_rate)
+
+def start_server(kind):
+    """Serve the webhook app on a free local port; returns (base_url, stop)"""
+    if kind == "asgi":
+        import socket
+        import uvicorn
+        import asgi_app
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        server = uvicorn.Server(uvicorn.Config(asgi_app.app, log_level="warning", lifespan="on"))
+        thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+
+        def stop():
+            server.should_exit = True
+            thread.join(timeout=60)
+        return f"http://127.0.0.1:{sock.getsockname()[1]}", stop
+
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    import app
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    app.start_webhook_processor()
+    server = make_server("127.0.0.1", 0, app.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop():
+        server.shutdown()
+        app.stop_webhook_processor()
+    return f"http://127.0.0.1:{server.server_port}", stop
+
+def make_event(index, action_type, rng):
+    """A synthetic webhook for a fresh card, shaped like Trello's payloads"""
+    card_id = f"load{index:06d}"
+    desc = rng.choice(DESCRIPTIONS)
+    data = {"card": {"id": card_id, "name": f"Load test card {index}", "desc": desc}}
+    if action_type == "commentCard":
+        data["text"] = "How should I approach this?"
+    else:
+        data["old"] = {"desc": ""}
+    return card_id, {"action": {"id": f"action{index:06d}", "type": action_type, "data": data}}
+
+def send_events(args, url, trello, rng):
+    """Post webhooks at the configured rate; returns the sent events"""
+    from http_utils import http_request
+
+    sent = []
+    lock = threading.Lock()
+
+    def post(card_id, action_type, payload):
+        card = payload["action"]["data"]["card"]
+        trello.add_card(card_id, card["name"], card["desc"])
+        event = {"card_id": card_id, "action_type": action_type, "sent_at": time.perf_counter()}
+        try:
+            response = http_request("loadtest", "POST", f"{url}/webhook", json=payload, retries=0, timeout=(5, 30))
+            event["status"] = response.status_code
+        except Exception as e:
+            event["status"] = None
+            event["error"] = str(e)
+        event["response_time"] = time.perf_counter() - event["sent_at"]
+        with lock:
+            sent.append(event)
+
+    start = time.perf_counter()
+    next_at = start
+    index = 0
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        while next_at - start < args.duration:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            action_type = "commentCard" if rng.random() < args.comment_share else "updateCard"
+            card_id, payload = make_event(index, action_type, rng)
+            pool.submit(post, card_id, action_type, payload)
+            index += 1
+            next_at += rng.expovariate(args.rate) if args.poisson else 1.0 / args.rate
+    return sent
+
+def sample_queue(stop_event, interval, samples, started):
+    """Record queue depth (waiting and unfinished requests) until stop_event is set"""
+    import app
+    while not stop_event.is_set():
+        webhook_queue = app.get_webhook_queue()
+        stats = webhook_queue.stats()
+        samples.append({
+            "t": round(time.perf_counter() - started, 2),
+            "pending": stats["pending"],
+            "in_flight": stats["in_flight"],
+            "unfinished": webhook_queue.depth(),
+        })
+        stop_event.wait(interval)
+
+def wait_for_replies(trello, events, timeout):
+    """Wait until every accepted webhook got its AI reply or the timeout passes"""
+    deadline = time.perf_counter() + timeout
+    expected = [event for event in events if event.get("status") == 200]
+    while time.perf_counter() < deadline:
+        with trello.lock:
+            done = sum(1 for event in expected if event["card_id"] in trello.comment_times)
+        if done == len(expected):
+            return True
+        time.sleep(0.2)
+    return False
+
+def summarize(events, trello, started, finished):
+    from compare_models import percentile
+
+    def latency_stats(values):
+        return {
+            "count": len(values),
+            "p50": round(percentile(values, 50), 3) if values else None,
+            "p95": round(percentile(values, 95), 3) if values else None,
+            "p99": round(percentile(values, 99), 3) if values else None,
+            "max": round(max(values), 3) if values else None,
+        }
+
+    by_type = {}
+    completed_at = []
+    for event in events:
+        times = trello.comment_times.get(event["card_id"])
+        if event.get("status") == 200 and times:
+            event["latency"] = times[0] - event["sent_at"]
+            completed_at.append(times[0])
+        by_type.setdefault(event["action_type"], []).append(event)
+
+    completed = [event for event in events if "latency" in event]
+    window = (max(completed_at) - started) if completed_at else 0
+    statuses = {}
+    for event in events:
+        statuses[str(event.get("status"))] = statuses.get(str(event.get("status")), 0) + 1
+    return {
+        "sent": len(events),
+        "responses": statuses,
+        "completed": len(completed),
+        "lost": sum(1 for event in events if event.get("status") == 200 and "latency" not in event),
+        "wall_time": round(finished - started, 2),
+        "throughput_per_s": round(len(completed) / window, 2) if window else None,
+        "latency": latency_stats([event["latency"] for event in completed]),
+        "latency_by_type": {
+            action_type: latency_stats([event["latency"] for event in items if "latency" in event])
+            for action_type, items in sorted(by_type.items())
+        },
+        "webhook_response_ms": {
+            key: round(value * 1000, 2) if value is not None else None
+            for key, value in latency_stats([event["response_time"] for event in events]).items() if key != "count"
+        },
+    }
+
+def print_report(settings, summary, samples, fakes):
+    trello, ollama, slack = fakes
+    print(f"\n📊 Load test: {settings['rate']}/s for {settings['duration']}s "
+          f"({settings['comment_share']:.0%} comments), {settings['server']} server, {settings['queue_backend']} queue")
+    print(f"   Sent {summary['sent']}, responses {summary['responses']}, completed {summary['completed']}, "
+          f"lost {summary['lost']}")
+    print(f"   Throughput: {summary['throughput_per_s']} replies/s")
+    latency = summary["latency"]
+    print(f"   End-to-end latency: p50 {latency['p50']}s, p95 {latency['p95']}s, p99 {latency['p99']}s, max {latency['max']}s")
+    for action_type, stats in summary["latency_by_type"].items():
+        print(f"     {action_type:<12} n={stats['count']:<5} p50 {stats['p50']}s  p95 {stats['p95']}s  p99 {stats['p99']}s")
+    response = summary["webhook_response_ms"]
+    print(f"   Webhook response: p50 {response['p50']}ms, p99 {response['p99']}ms, max {response['max']}ms")
+    print(f"   Fake calls: Trello {sum(trello.calls.values())} {dict(trello.calls)}, "
+          f"Ollama {len(ollama.requests)}, Slack {len(slack.messages)}")
+    print("\n   Queue depth over time (s: pending / in flight)")
+    peak = max((sample["unfinished"] for sample in samples), default=0) or 1
+    for sample in samples:
+        bar = "█" * round(30 * sample["unfinished"] / peak)
+        print(f"   {sample['t']:>7.1f}s {sample['pending']:>5} / {sample['in_flight']:<3} {bar}")
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    work_dir = tempfile.mkdtemp(prefix="load_test_")
+
+    trello = FakeTrello(latency=args.trello_latency, jitter_ratio=0.2, seed=args.seed)
+    ollama = FakeOllama(tokens_per_second=args.tokens_per_second, first_token_delay=args.first_token_delay,
+                        response_tokens=args.response_tokens, jitter_ratio=0.2, seed=args.seed)
+    slack = FakeSlack(latency=args.slack_latency)
+    for fake in (trello, ollama, slack):
+        fake.start()
+    configure_environment(args, trello, ollama, slack, work_dir)
+
+    url, stop_server = start_server(args.server)
+    print(f"🧪 Webhook server {url} - fake Trello {trello.url}, Ollama {ollama.url}, Slack {slack.url}")
+
+    samples = []
+    stop_sampling = threading.Event()
+    started = time.perf_counter()
+    sampler = threading.Thread(target=sample_queue, args=(stop_sampling, args.sample_interval, samples, started),
+                               daemon=True)
+    sampler.start()
+    try:
+        events = send_events(args, url, trello, rng)
+        print(f"📨 Sent {len(events)} webhooks, waiting up to {args.drain_timeout:.0f}s for the replies...")
+        drained = wait_for_replies(trello, events, args.drain_timeout)
+        finished = time.perf_counter()
+    finally:
+        stop_sampling.set()
+        sampler.join()
+        stop_server()
+        for fake in (trello, ollama, slack):
+            fake.stop()
+
+    settings = {key: value for key, value in vars(args).items() if key != "output_dir"}
+    summary = summarize(events, trello, started, finished)
+    summary["drained"] = drained
+    print_report(settings, summary, samples, (trello, ollama, slack))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    now = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M")
+    path = os.path.join(args.output_dir, f"load_test_{now}.json")
+    with open(path, "w") as f:
+        json.dump({"settings": settings, "summary": summary, "queue_depth": samples, "events": events}, f, indent=2)
+    print(f"\n📄 Results saved to: `{path}`")
+    return 0 if drained else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
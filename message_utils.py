@@ -0,0 +1,143 @@
+import re
+
+# Markdown structure the splitter keeps intact where it can
+_FENCE = re.compile(r"^\s*(`{3,}|~{3,})")
+_LIST_ITEM = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s+")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+_WORD_BREAK = re.compile(r"\s+")
+
+PART_HEADER_RESERVE = len("[Part 9999/9999]\n")  # Room for the header comment_on_card adds to each part
+
+def _is_closing_fence(line, marker):
+    stripped = line.strip()
+    return stripped.startswith(marker) and not stripped.strip(marker[0])
+
+def _blocks(lines):
+    """
+    Group lines into ("code", lines), ("list", items) and ("text", lines) blocks in one pass.
+    Blank lines are one-line text blocks so paragraph breaks survive the split.
+    """
+    i, count = 0, len(lines)
+    while i < count:
+        line = lines[i]
+        fence = _FENCE.match(line)
+        if fence:
+            marker = fence.group(1)
+            end = i + 1
+            while end < count and not (marker[0] in lines[end] and _is_closing_fence(lines[end], marker)):
+                end += 1
+            yield "code", lines[i:end + 1]
+            i = end + 1
+        elif not line.strip():
+            yield "text", [line]
+            i += 1
+        elif _LIST_ITEM.match(line):
+            # Items with their indented continuation lines, up to the first blank or plain line
+            items = [[line]]
+            i += 1
+            while i < count and lines[i].strip() and not _FENCE.match(lines[i]):
+                if _LIST_ITEM.match(lines[i]):
+                    items.append([lines[i]])
+                elif lines[i][0].isspace():
+                    items[-1].append(lines[i])
+                else:
+                    break
+                i += 1
+            yield "list", items
+        else:
+            end = i + 1
+            while (end < count and lines[end].strip() and not _FENCE.match(lines[end])
+                   and not _LIST_ITEM.match(lines[end])):
+                end += 1
+            yield "text", lines[i:end]
+            i = end
+
+def _pack(pieces, separator, limit):
+    """Greedily join pieces (each at most limit long) into strings of at most limit characters"""
+    buffer, size = [], 0
+    for piece in pieces:
+        added = len(piece) + (len(separator) if buffer else 0)
+        if buffer and size + added > limit:
+            yield separator.join(buffer)
+            buffer, size = [piece], len(piece)
+        else:
+            buffer.append(piece)
+            size += added
+    if buffer:
+        yield separator.join(buffer)
+
+def _split_text(text, limit):
+    """Split one line at sentence, then word boundaries, cutting words only if they exceed limit"""
+    def pieces():
+        for sentence in _SENTENCE_BREAK.split(text):
+            if len(sentence) <= limit:
+                yield sentence
+                continue
+            for word in _WORD_BREAK.split(sentence):
+                if len(word) <= limit:
+                    yield word
+                else:
+                    yield from (word[start:start + limit] for start in range(0, len(word), limit))
+    return _pack(pieces(), " ", limit)
+
+def _split_lines(lines, limit):
+    """Split at line breaks, falling back to _split_text for lines longer than limit"""
+    def pieces():
+        for line in lines:
+            if len(line) <= limit:
+                yield line
+            else:
+                yield from _split_text(line, limit)
+    return _pack(pieces(), "\n", limit)
+
+def _split_code(lines, limit):
+    """Split a fenced code block at line breaks, closing and reopening the fence in every part"""
+    opening = lines[0]
+    marker = _FENCE.match(opening).group(1)
+    has_closing = len(lines) > 1 and _is_closing_fence(lines[-1], marker)
+    closing = lines[-1].strip() if has_closing else marker
+    body = lines[1:-1] if has_closing else lines[1:]
+    body_limit = limit - len(opening) - len(closing) - 2
+    if body_limit < 1:
+        yield from _split_lines(lines, limit)  # Limit too small for fences at all
+        return
+    for part in _split_lines(body, body_limit):
+        yield f"{opening}\n{part}\n{closing}"
+
+def _pieces(message, limit):
+    """Blocks that fit within limit, or their parts where a block alone is too long"""
+    for kind, block in _blocks(message.split("\n")):
+        if kind == "list":
+            text = "\n".join("\n".join(item) for item in block)
+            if len(text) <= limit:
+                yield text
+            else:
+                # Break between items, only inside an item that is longer than limit itself
+                for item in block:
+                    item_text = "\n".join(item)
+                    if len(item_text) <= limit:
+                        yield item_text
+                    else:
+                        yield from _split_lines(item, limit)
+            continue
+        text = "\n".join(block)
+        if len(text) <= limit:
+            yield text
+        elif kind == "code":
+            yield from _split_code(block, limit)
+        else:
+            yield from _split_lines(block, limit)
+
+def split_large_message(message, max_length=7000, reserve=0):
+    """
+    Split a message into chunks of at most max_length - reserve characters in a single pass.
+    Breaks prefer paragraph, then list item, line, sentence and word boundaries; fenced code
+    blocks are closed and reopened around a break so every chunk renders on its own.
+    """
+    limit = max_length - reserve
+    if limit < 1:
+        raise ValueError(f"max_length {max_length} leaves no room after reserving {reserve} characters")
+    if len(message) <= limit:
+        return [message]
+    chunks = (chunk.strip("\n") for chunk in _pack(_pieces(message, limit), "\n", limit))
+    return [chunk for chunk in chunks if chunk.strip()]
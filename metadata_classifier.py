@@ -0,0 +1,256 @@
+import os
+import re
+import json
+import math
+import atexit
+import threading
+from collections import Counter, defaultdict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Local GameSystem/Mode/Subsystem inference so generate_card_metadata can skip the LLM
+METADATA_CLASSIFIER_ENABLED = os.getenv("METADATA_CLASSIFIER_ENABLED", "true").lower() == "true"
+METADATA_CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("METADATA_CLASSIFIER_MIN_CONFIDENCE", "0.6"))
+METADATA_TRAINING_FILE = os.getenv("METADATA_TRAINING_FILE", "metadata_training.json")
+METADATA_TRAINING_MAX_CARDS = int(os.getenv("METADATA_TRAINING_MAX_CARDS", "2000"))
+METADATA_TRAINING_SAVE_DELAY = float(os.getenv("METADATA_TRAINING_SAVE_DELAY", "30"))  # Seconds to batch file writes
+
+FIELDS = ["GameSystem", "Mode", "Subsystem"]
+
+# Who wrote a [Context] block: "classifier" and "llm" blocks carry a Source line, anything without one
+# is taken as written by a human. Classifier blocks are never learned from, they would only reinforce its errors.
+SOURCE_FIELD = "Source"
+
+# Seed vocabulary, each keyword list acts as one pseudo training document for its label
+SEED_KEYWORDS = {
+    "GameSystem": {
+        "World Map": "world map travel trade caravan build house crop field watch tower poi strategic merchant",
+        "Settlement Mode": "settlement battle siege skirmish formation army combat follower horse soldier troops",
+        "Dungeon": "dungeon boss chest loot trap mini boss tier",
+    },
+    "Mode": {
+        "Battle": "battle formation army charge hold position advance soldier troops",
+        "Siege": "siege wall gate ladder ram tower defend attacker",
+        "Skirmish": "skirmish ambush small fight bandit",
+        "Dungeon": "dungeon boss chest trap mini boss",
+        "None": "trade caravan world map menu inventory travel build",
+    },
+    "Subsystem": {
+        "Combat AI": "ai behavior tree behaviour tree formation combat follower enemy blackboard perception",
+        "UI": "ui interface widget slider button menu hud input stepper tooltip",
+        "Animation": "animation rotation montage smooth blend anim root motion",
+        "Loot": "loot chest item reward drop rarity randomized",
+        "Economy": "trade caravan price gold economy quantity buy sell weight capacity",
+        "Multiplayer": "multiplayer replication server client dedicated network rpc",
+        "Level Design": "level terrain layout poi landscape spawn point",
+    },
+}
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = set("""
+a an and are as at be but by can do does for from has have he if in into is it its not of on or our
+should so that the their them then there these they this to was we were when which will with without
+would you your all also any just only must need needs one more most some such than too very up out
+""".split())
+
+_lock = threading.Lock()
+_training_cards = {}   # card_id -> {'text': ..., 'labels': {field: label}}, oldest first
+_model = None          # Lazily built from seeds + training cards
+_loaded = False        # Training file read yet?
+_save_timer = None     # Pending write of the training file
+_save_lock = threading.Lock()  # One writer of the training file at a time
+_stats = {'local': 0, 'fallback': 0, 'learned': 0, 'updated': 0, 'skipped_own': 0, 'skipped_empty': 0}
+
+def tokenize(text):
+    """Lower-case word unigrams plus bigrams ("world map", "behavior tree"), without stop words"""
+    words = [w for w in _TOKEN_PATTERN.findall((text or "").lower()) if w not in _STOP_WORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+def extract_context_from_description(desc):
+    """Split a card description into its [Context] block (None without one) and the remaining text"""
+    match = re.search(r'\[Context\](.*?)(\n\n|\Z)', desc, re.DOTALL)
+    if match:
+        context_block = match.group(1).strip()
+        cleaned = desc.replace(match.group(0), '').strip()
+    else:
+        context_block = None
+        cleaned = desc
+    return context_block, cleaned
+
+def parse_context_block(context_block):
+    """Turn a [Context] block into {field: label}; missing fields become "None" """
+    labels = {}
+    for line in (context_block or "").splitlines():
+        if ":" in line:
+            field, value = line.split(":", 1)
+            field = field.strip()
+            if field in FIELDS:
+                labels[field] = value.strip() or "None"
+    return {field: labels.get(field, "None") for field in FIELDS}
+
+def context_source(context_block):
+    """"classifier", "llm" or "human" (no Source line) for a [Context] block"""
+    for line in (context_block or "").splitlines():
+        if ":" in line:
+            field, value = line.split(":", 1)
+            if field.strip() == SOURCE_FIELD:
+                return value.strip().lower() or "human"
+    return "human"
+
+def with_source(context_block, source):
+    """The context block with a Source line naming who wrote it (replacing any existing one)"""
+    lines = [line for line in context_block.strip().splitlines()
+             if not (":" in line and line.split(":", 1)[0].strip() == SOURCE_FIELD)]
+    return "\n".join(lines + [f"{SOURCE_FIELD}: {source}"])
+
+def format_context_block(labels):
+    """Format labels like the LLM is asked to (without the [Context] header line)"""
+    return "\n".join(f"{field}: {labels[field]}" for field in FIELDS)
+
+def _build_model(training_cards):
+    """Multinomial naive Bayes counts per field, seeded with SEED_KEYWORDS"""
+    model = {}
+    for field in FIELDS:
+        label_counts = Counter()
+        token_counts = defaultdict(Counter)
+        for label, keywords in SEED_KEYWORDS[field].items():
+            label_counts[label] += 1
+            token_counts[label].update(tokenize(keywords))
+        for card in training_cards.values():
+            label = card['labels'][field]
+            label_counts[label] += 1
+            token_counts[label].update(tokenize(card['text']))
+        vocab = set()
+        for counts in token_counts.values():
+            vocab.update(counts)
+        model[field] = {
+            'labels': label_counts,
+            'tokens': token_counts,
+            'totals': {label: sum(counts.values()) for label, counts in token_counts.items()},
+            'vocab': vocab,
+        }
+    return model
+
+def _get_model():
+    """Return the current model, loading training cards from disk on first use (caller holds the lock)"""
+    global _model, _loaded
+    if not _loaded:
+        _loaded = True
+        if os.path.exists(METADATA_TRAINING_FILE):
+            with open(METADATA_TRAINING_FILE, "r") as f:
+                _training_cards.update(json.load(f))
+    if _model is None:
+        _model = _build_model(_training_cards)
+    return _model
+
+def _classify_field(field_model, tokens):
+    """Return (label, posterior probability) for one field"""
+    total_docs = sum(field_model['labels'].values())
+    vocab_size = len(field_model['vocab'])
+    # Words never seen in training carry no evidence, but would favour the shortest documents
+    tokens = [token for token in tokens if token in field_model['vocab']]
+    scores = {}
+    for label, docs in field_model['labels'].items():
+        counts = field_model['tokens'][label]
+        denominator = field_model['totals'][label] + vocab_size
+        score = math.log(docs / total_docs)
+        for token in tokens:
+            score += math.log((counts.get(token, 0) + 1) / denominator)
+        scores[label] = score
+    best = max(scores, key=scores.get)
+    # Softmax over log scores gives the posterior of the winner
+    norm = sum(math.exp(score - scores[best]) for score in scores.values())
+    return best, 1.0 / norm
+
+def classify_card(card_name, desc, comment=None):
+    """
+    Infer {field: label} for a card locally.
+    Returns (labels, confidence) where confidence is the lowest posterior of the three fields.
+    """
+    tokens = tokenize(f"{card_name}\n{desc}\n{comment or ''}")
+    with _lock:
+        model = _get_model()
+        labels = {}
+        confidence = 1.0
+        for field in FIELDS:
+            label, probability = _classify_field(model[field], tokens)
+            labels[field] = label
+            confidence = min(confidence, probability)
+    return labels, confidence
+
+def infer_context(card_name, desc, comment=None):
+    """Return a context block if the local classifier is confident enough, otherwise None"""
+    if not METADATA_CLASSIFIER_ENABLED:
+        return None
+    labels, confidence = classify_card(card_name, desc, comment)
+    with _lock:
+        if confidence < METADATA_CLASSIFIER_MIN_CONFIDENCE:
+            _stats['fallback'] += 1
+            return None
+        _stats['local'] += 1
+    return format_context_block(labels)
+
+def learn_from_card(card_id, card_name, desc, context_block):
+    """
+    Add a card with known metadata to the training set (e.g. one that already has a [Context] block).
+    A card is one training example: a later version of it replaces the earlier one.
+    """
+    global _model
+    labels = parse_context_block(context_block)
+    with _lock:
+        if context_source(context_block) == "classifier":
+            _stats['skipped_own'] += 1
+            return
+        if all(label == "None" for label in labels.values()):
+            _stats['skipped_empty'] += 1  # Nothing to learn, e.g. a block without any known field
+            return
+        _get_model()
+        card = {'text': f"{card_name}\n{desc}", 'labels': labels}
+        previous = _training_cards.pop(card_id, None)
+        _training_cards[card_id] = card  # Re-inserted, so the most recently seen cards are kept
+        if previous == card:
+            return
+        for old_id in list(_training_cards)[:-METADATA_TRAINING_MAX_CARDS]:
+            del _training_cards[old_id]
+        _model = None  # Rebuilt on the next classification
+        _stats['updated' if previous else 'learned'] += 1
+        _schedule_save()
+
+def _schedule_save():
+    """Write the training file after METADATA_TRAINING_SAVE_DELAY, batching the cards learned meanwhile (caller holds the lock)"""
+    global _save_timer
+    if _save_timer is None:
+        _save_timer = threading.Timer(METADATA_TRAINING_SAVE_DELAY, save_training)
+        _save_timer.daemon = True
+        _save_timer.start()
+
+def save_training():
+    """Write pending training cards to METADATA_TRAINING_FILE now (also runs at exit)"""
+    global _save_timer
+    with _save_lock:
+        with _lock:
+            if _save_timer is None:
+                return
+            _save_timer.cancel()
+            _save_timer = None
+            cards = dict(_training_cards)
+        with open(METADATA_TRAINING_FILE, "w") as f:
+            json.dump(cards, f, indent=2)
+
+atexit.register(save_training)
+
+def reset_training(cards=()):
+    """Replace the in-memory training set (used by the benchmark for leave-one-out runs)"""
+    global _model, _loaded
+    with _lock:
+        _training_cards.clear()
+        _training_cards.update(enumerate(cards))
+        _model = None
+        _loaded = True
+
+def get_classifier_stats():
+    """How often the local classifier answered vs. fell back to the LLM"""
+    with _lock:
+        return dict(_stats, training_cards=len(_training_cards),
+                    min_confidence=METADATA_CLASSIFIER_MIN_CONFIDENCE)
@@ -0,0 +1,157 @@
+"""
+Process metrics in the Prometheus text format, served on /metrics.
+
+Every step of handling a webhook is recorded in trello_ai_stage_seconds with the labels
+stage, provider, model and outcome:
+
+    fetch_card_data          provider=trello   outcome=ok|cached|error
+    generate_card_metadata   provider=local|ollama|openai   outcome=ok|cached|error
+    metadata_and_advice      combined generation (COMBINED_PROMPT_MODE)
+    advice                   the AI reply posted as a comment
+    daily_summary            morning summaries
+    update_card_description  provider=trello (carries the card's labels too when both changed)
+    set_card_labels          provider=trello (label-only writes)
+    comment_on_card          provider=trello
+
+Queue wait is trello_ai_queue_wait_seconds per priority class.
+"""
+
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+METRIC_PREFIX = "trello_ai_"
+STAGE_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+INGRESS_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1]
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = METRIC_PREFIX + name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_number(value)}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = list(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            series['counts'][bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+
+    def render(self):
+        with self._lock:
+            items = [(key, {'counts': list(series['counts']), 'sum': series['sum']})
+                     for key, series in sorted(self._values.items())]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + [float("inf")], series['counts']):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, f'le="{_format_number(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {series['sum']!r}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+_registry = []
+
+STAGE_SECONDS = Histogram("stage_seconds", "Time spent in each processing stage",
+                          ("stage", "provider", "model", "outcome"))
+QUEUE_WAIT_SECONDS = Histogram("queue_wait_seconds", "Time a ready webhook waited for a worker",
+                               ("priority_class",))
+WEBHOOKS_TOTAL = Counter("webhooks_total", "Webhook requests by ingress server and outcome",
+                         ("server", "outcome"))
+INGRESS_SECONDS = Histogram("ingress_seconds", "Time to accept or reject a webhook request",
+                            ("server",), buckets=INGRESS_BUCKETS)
+QUEUE_DEPTH = Gauge("queue_depth", "Pending webhook requests per priority class", ("priority_class",))
+QUEUE_IN_FLIGHT = Gauge("queue_in_flight", "Webhook requests being processed")
+_started = time.time()
+UPTIME_SECONDS = Gauge("uptime_seconds", "Seconds since the process started")
+
+def observe_stage(stage, seconds, provider="", model="", outcome="ok"):
+    STAGE_SECONDS.observe(seconds, stage=stage, provider=provider, model=model, outcome=outcome)
+
+@contextmanager
+def stage_timer(stage, provider="", model="", outcome="ok"):
+    """
+    Time a block as one stage. The yielded dict holds the labels and may be changed inside
+    the block (e.g. outcome="cached" or the model that actually answered); an exception
+    records outcome="error".
+    """
+    labels = {'provider': provider, 'model': model, 'outcome': outcome}
+    start = time.perf_counter()
+    try:
+        yield labels
+    except Exception:
+        labels['outcome'] = "error"
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - start, **labels)
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    UPTIME_SECONDS.set(round(time.time() - _started, 3))
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
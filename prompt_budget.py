@@ -0,0 +1,90 @@
+import re
+import math
+
+# Token estimates without a tokenizer: words and punctuation marks count as one token each,
+# long words and identifiers roughly one per 4 characters. Errs on the high side for code and logs.
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+CHARS_PER_LONG_TOKEN = 4
+
+NUM_CTX_BUCKETS = [2048, 4096, 8192, 16384, 32768]
+TRIM_MARKER = "[... {count} lines trimmed to fit the prompt ...]"
+TRIM_HEAD_SHARE = 0.6  # Share of a trimmed section kept from its start, the rest from its end
+MIN_SECTION_TOKENS = 200  # Kept of every section even when the budget is smaller, a prompt without card text is useless
+
+def estimate_tokens(text):
+    """Rough token count of a text"""
+    return sum(math.ceil(len(piece) / CHARS_PER_LONG_TOKEN) if len(piece) > CHARS_PER_LONG_TOKEN else 1
+               for piece in _TOKEN_PATTERN.findall(text or ""))
+
+def trim_text(text, max_tokens):
+    """
+    Cut a text to about max_tokens, keeping its beginning and its end (the end of a pasted
+    log is usually what matters) with a marker for what was left out.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lines = text.split("\n")
+    marker_tokens = estimate_tokens(TRIM_MARKER.format(count=len(lines)))
+    head_budget = max(0, int((max_tokens - marker_tokens) * TRIM_HEAD_SHARE))
+    tail_budget = max(0, max_tokens - marker_tokens - head_budget)
+
+    head, used = [], 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > head_budget:
+            break
+        head.append(line)
+        used += cost
+    tail, used = [], 0
+    for line in reversed(lines[len(head):]):
+        cost = estimate_tokens(line) + 1
+        if used + cost > tail_budget:
+            break
+        tail.append(line)
+        used += cost
+    tail.reverse()
+
+    if not head and not tail:
+        # A single enormous line: fall back to characters
+        keep = max(0, max_tokens - marker_tokens) * CHARS_PER_LONG_TOKEN
+        return text[:keep // 2] + "\n" + TRIM_MARKER.format(count=1) + "\n" + text[-(keep // 2):] if keep else ""
+    skipped = len(lines) - len(head) - len(tail)
+    return "\n".join(head + [TRIM_MARKER.format(count=skipped)] + tail)
+
+def fit_sections(sections, budget, min_tokens=MIN_SECTION_TOKENS):
+    """
+    Trim {name: text} so the sections together fit in budget tokens. Small sections stay whole;
+    the remaining budget is shared evenly among the large ones, but each keeps at least
+    min_tokens (so the result can exceed a budget that is too small). Returns (sections, trimmed_names).
+    """
+    sizes = {name: estimate_tokens(text) for name, text in sections.items()}
+    if sum(sizes.values()) <= budget:
+        return dict(sections), []
+
+    fitted = dict(sections)
+    trimmed = []
+    remaining_budget = max(0, budget)
+    pending = sorted(sizes, key=sizes.get)  # Smallest first
+    while pending:
+        share = max(remaining_budget // len(pending), min_tokens)
+        name = pending.pop(0)
+        if sizes[name] <= share:
+            remaining_budget -= sizes[name]
+            continue
+        fitted[name] = trim_text(sections[name], share)
+        trimmed.append(name)
+        remaining_budget -= share
+    return fitted, trimmed
+
+def pick_num_ctx(needed_tokens, max_ctx, current=None):
+    """
+    Smallest context bucket that holds needed_tokens, capped at max_ctx. Never smaller than
+    `current`: Ollama reloads the model whenever num_ctx changes, so the window only grows.
+    """
+    for size in NUM_CTX_BUCKETS:
+        if size >= needed_tokens:
+            chosen = min(size, max_ctx)
+            break
+    else:
+        chosen = max_ctx
+    return max(chosen, current or 0)
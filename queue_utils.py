@@ -0,0 +1,410 @@
+import json
+import time
+import queue
+import sqlite3
+import threading
+from collections import deque
+from metrics import QUEUE_WAIT_SECONDS
+
+WAIT_SAMPLES = 1000  # Recent queue waits kept per priority class for percentiles
+
+class _ClassWaits:
+    """Recent queue wait times per priority class"""
+
+    def __init__(self):
+        self._waits = {}
+        self.dequeued = {}
+
+    def record(self, priority_class, seconds):
+        self._waits.setdefault(priority_class, deque(maxlen=WAIT_SAMPLES)).append(seconds)
+        self.dequeued[priority_class] = self.dequeued.get(priority_class, 0) + 1
+        QUEUE_WAIT_SECONDS.observe(seconds, priority_class=priority_class or 'default')
+
+    def stats(self, depths, class_offsets):
+        """Depth, dequeue count and wait times per class (caller holds the queue lock)"""
+        result = {}
+        for priority_class in sorted(set(depths) | set(self._waits) | set(class_offsets), key=str):
+            waits = sorted(self._waits.get(priority_class, ()))
+            result[priority_class or 'default'] = {
+                'pending': depths.get(priority_class, 0),
+                'dequeued': self.dequeued.get(priority_class, 0),
+                'offset': class_offsets.get(priority_class, 0.0),
+                'avg_wait': round(sum(waits) / len(waits), 3) if waits else None,
+                'p95_wait': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else None,
+                'max_wait': round(waits[-1], 3) if waits else None,
+            }
+        return result
+
+class CoalescingQueue:
+    """
+    In-memory queue for webhook requests that merges bursts of events for the same key (card ID).
+
+    An item put with hold=True waits until no newer event for its key arrived for
+    `window` seconds (but at most `max_delay` seconds after the first one); a newer
+    held item replaces it. An item put with hold=False for a key that has a held item
+    takes over that item's place and is released immediately.
+
+    get() returns (entry_id, item); every entry must be acknowledged with
+    task_done(entry_id, failed=...). Failed entries are retried after `retry_delay`
+    seconds until `max_attempts` is reached - except held items for which a newer item
+    with the same key is queued or in flight: that one carries the latest state, and a
+    late retry would overwrite its result.
+
+    Ready entries are handed out by rank: the time they became ready plus the offset of
+    their priority class (`class_offsets`, seconds). An entry of a class with a 30s offset
+    yields to newer entries of a 0s class, but only for 30s - so nothing starves.
+    """
+
+    def __init__(self, window=0.0, max_delay=None, max_attempts=3, retry_delay=30.0, class_offsets=None):
+        self.window = window
+        self.max_delay = max_delay if max_delay is not None else window
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.class_offsets = dict(class_offsets or {})
+        self._entries = []   # Pending, in arrival order: {'id', 'item', 'key', 'ready_at', 'first_seen', 'attempts', 'class', 'hold'}
+        self._held = {}      # key -> pending entry that is still waiting for its quiet window
+        self._in_flight = {}  # entry_id -> entry handed out by get()
+        self._next_id = 1
+        self._condition = threading.Condition()
+        self.unfinished_tasks = 0
+        self.merged = 0
+        self.failed = 0
+        self._waits = _ClassWaits()
+
+    def put(self, item, key=None, hold=False, priority_class=None):
+        """Add an item, merging it with a held item for the same key if there is one"""
+        now = time.time()
+        with self._condition:
+            entry = self._held.get(key) if key is not None else None
+            if entry is not None:
+                # Only the latest state matters - replace the held item
+                entry['item'] = item
+                entry['class'] = priority_class
+                entry['hold'] = hold
+                self.merged += 1
+                if hold:
+                    entry['ready_at'] = min(now + self.window, entry['first_seen'] + self.max_delay)
+                else:
+                    entry['ready_at'] = now
+                    del self._held[key]
+            else:
+                entry = {
+                    'id': self._next_id,
+                    'item': item,
+                    'key': key,
+                    'ready_at': now + self.window if hold else now,
+                    'first_seen': now,
+                    'attempts': 0,
+                    'class': priority_class,
+                    'hold': hold,
+                }
+                self._next_id += 1
+                self._entries.append(entry)
+                self.unfinished_tasks += 1
+                if hold and key is not None and self.window > 0:
+                    self._held[key] = entry
+            self._condition.notify_all()
+
+    def _rank(self, entry):
+        return entry['ready_at'] + self.class_offsets.get(entry['class'], 0.0)
+
+    def _pop_ready(self, now):
+        """Remove and return the best ranked entry that is ready (caller holds the lock)"""
+        best = None
+        for index, entry in enumerate(self._entries):
+            if entry['ready_at'] <= now and (best is None or self._rank(entry) < self._rank(self._entries[best])):
+                best = index
+        if best is None:
+            return None
+        entry = self._entries.pop(best)
+        if self._held.get(entry['key']) is entry:
+            del self._held[entry['key']]
+        self._waits.record(entry['class'], now - entry['ready_at'])
+        return entry
+
+    def get(self, timeout=None):
+        """Return the next ready (entry_id, item), raising queue.Empty after `timeout` seconds"""
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._condition:
+            while True:
+                now = time.time()
+                entry = self._pop_ready(now)
+                if entry is not None:
+                    entry['attempts'] += 1
+                    self._in_flight[entry['id']] = entry
+                    return entry['id'], entry['item']
+
+                # Sleep until the next held item becomes ready, a new item arrives or we time out
+                wake_at = min((e['ready_at'] for e in self._entries), default=None)
+                if deadline is not None:
+                    if now >= deadline:
+                        raise queue.Empty
+                    wake_at = deadline if wake_at is None else min(wake_at, deadline)
+                self._condition.wait(None if wake_at is None else max(0, wake_at - now))
+
+    def _superseded(self, entry):
+        """Whether a newer entry for the same key is pending or in flight (caller holds the lock)"""
+        if entry['key'] is None:
+            return False
+        return any(other['key'] == entry['key'] and other['id'] > entry['id']
+                   for other in self._entries + list(self._in_flight.values()))
+
+    def task_done(self, entry_id, failed=False):
+        """Acknowledge an entry returned by get(); failed entries are retried up to max_attempts"""
+        with self._condition:
+            entry = self._in_flight.pop(entry_id, None)
+            if entry is not None and failed:
+                if entry['hold'] and self._superseded(entry):
+                    self.merged += 1  # A newer item for the key carries the latest state - drop the stale retry
+                elif entry['attempts'] < self.max_attempts:
+                    entry['ready_at'] = time.time() + self.retry_delay * entry['attempts']
+                    self._entries.append(entry)
+                    self._condition.notify_all()
+                    return
+                else:
+                    self.failed += 1
+            self.unfinished_tasks -= 1
+            self._condition.notify_all()
+
+    def record_merged(self, count=1):
+        """Count items merged by the consumer (e.g. while a card was being processed)"""
+        with self._condition:
+            self.merged += count
+
+    def join(self):
+        """Block until every item has been processed"""
+        with self._condition:
+            while self.unfinished_tasks:
+                self._condition.wait()
+
+    def qsize(self):
+        with self._condition:
+            return len(self._entries)
+
+    def depth(self):
+        """Requests not acknowledged yet (pending, held and in flight)"""
+        with self._condition:
+            return self.unfinished_tasks
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def stats(self):
+        """Queue depth and coalescing counters"""
+        with self._condition:
+            depths = {}
+            for entry in self._entries:
+                depths[entry['class']] = depths.get(entry['class'], 0) + 1
+            return {
+                'backend': 'memory',
+                'pending': len(self._entries),
+                'held': len(self._held),
+                'in_flight': len(self._in_flight),
+                'failed': self.failed,
+                'merged': self.merged,
+                'window': self.window,
+                'classes': self._waits.stats(depths, self.class_offsets),
+            }
+
+class PersistentQueue:
+    """
+    Crash-safe variant of CoalescingQueue backed by SQLite in WAL mode.
+
+    Items are stored as JSON when they are put and deleted when they are acknowledged,
+    so delivery is at-least-once: entries that were in flight when the process died are
+    replayed on the next start. Failed entries are retried up to `max_attempts` and then
+    kept with status 'failed' for inspection.
+
+    With synchronous="NORMAL" (default) commits are not fsynced one by one; the WAL is
+    synced in batches at checkpoints, which survives process crashes but may lose the
+    last transactions on power loss. Use synchronous="FULL" to fsync every commit.
+
+    Entries are ranked by priority class like in CoalescingQueue; the rank is stored with
+    the entry and recomputed whenever its ready time changes.
+    """
+
+    def __init__(self, path, window=0.0, max_delay=None, max_attempts=3, retry_delay=30.0,
+                 synchronous="NORMAL", checkpoint_pages=1000, class_offsets=None):
+        self.path = path
+        self.window = window
+        self.max_delay = max_delay if max_delay is not None else window
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.class_offsets = dict(class_offsets or {})
+        self._condition = threading.Condition()
+        self.merged = 0
+        self._waits = _ClassWaits()
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"PRAGMA synchronous={synchronous}")
+        self._db.execute(f"PRAGMA wal_autocheckpoint={int(checkpoint_pages)}")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS webhook_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT,
+                item TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                held INTEGER NOT NULL DEFAULT 0,
+                ready_at REAL NOT NULL,
+                first_seen REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                priority_class TEXT,
+                rank REAL,
+                hold INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS webhook_queue_ready ON webhook_queue (status, ready_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS webhook_queue_rank ON webhook_queue (status, rank)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS webhook_queue_key ON webhook_queue (key, held)")
+        self._db.create_function("class_offset", 1, lambda priority_class: self.class_offsets.get(priority_class, 0.0))
+
+        # Anything that was in flight when we stopped has not been acknowledged - deliver it again
+        self.replayed = self._db.execute(
+            "UPDATE webhook_queue SET status = 'pending', held = 0, ready_at = ? WHERE status = 'in_flight'",
+            (time.time(),)).rowcount
+        # Offsets may have changed since the entries were ranked
+        self._db.execute("UPDATE webhook_queue SET rank = ready_at + class_offset(priority_class) "
+                         "WHERE status = 'pending'")
+        self.unfinished_tasks = self._db.execute(
+            "SELECT COUNT(*) FROM webhook_queue WHERE status IN ('pending', 'in_flight')").fetchone()[0]
+
+    def put(self, item, key=None, hold=False, priority_class=None):
+        """Persist an item, merging it with a held item for the same key if there is one"""
+        now = time.time()
+        data = json.dumps(item)
+        offset = self.class_offsets.get(priority_class, 0.0)
+        with self._condition:
+            row = None
+            if key is not None:
+                row = self._db.execute(
+                    "SELECT id, first_seen FROM webhook_queue WHERE key = ? AND held = 1 AND status = 'pending'",
+                    (key,)).fetchone()
+            if row is not None:
+                # Only the latest state matters - replace the held item
+                entry_id, first_seen = row
+                ready_at = min(now + self.window, first_seen + self.max_delay) if hold else now
+                self._db.execute(
+                    "UPDATE webhook_queue SET item = ?, ready_at = ?, held = ?, hold = ?, priority_class = ?, rank = ? "
+                    "WHERE id = ?", (data, ready_at, 1 if hold else 0, 1 if hold else 0, priority_class,
+                                     ready_at + offset, entry_id))
+                self.merged += 1
+            else:
+                held = hold and key is not None and self.window > 0
+                ready_at = now + self.window if hold else now
+                self._db.execute(
+                    "INSERT INTO webhook_queue (key, item, held, hold, ready_at, first_seen, priority_class, rank) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, data, 1 if held else 0, 1 if hold else 0, ready_at, now, priority_class, ready_at + offset))
+                self.unfinished_tasks += 1
+            self._condition.notify_all()
+
+    def get(self, timeout=None):
+        """Return the next ready (entry_id, item), raising queue.Empty after `timeout` seconds"""
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._condition:
+            while True:
+                now = time.time()
+                row = self._db.execute(
+                    "SELECT id, item, priority_class, ready_at FROM webhook_queue "
+                    "WHERE status = 'pending' AND ready_at <= ? ORDER BY rank, id LIMIT 1", (now,)).fetchone()
+                if row is not None:
+                    entry_id, data, priority_class, ready_at = row
+                    self._waits.record(priority_class, now - ready_at)
+                    self._db.execute(
+                        "UPDATE webhook_queue SET status = 'in_flight', held = 0, attempts = attempts + 1 "
+                        "WHERE id = ?", (entry_id,))
+                    item = json.loads(data)
+                    return entry_id, tuple(item) if isinstance(item, list) else item
+
+                # Sleep until the next held item becomes ready, a new item arrives or we time out
+                wake_at = self._db.execute(
+                    "SELECT MIN(ready_at) FROM webhook_queue WHERE status = 'pending'").fetchone()[0]
+                if deadline is not None:
+                    if now >= deadline:
+                        raise queue.Empty
+                    wake_at = deadline if wake_at is None else min(wake_at, deadline)
+                self._condition.wait(None if wake_at is None else max(0, wake_at - now))
+
+    def _superseded(self, entry_id, key):
+        """Whether a newer entry for the same key is pending or in flight (caller holds the lock)"""
+        if key is None:
+            return False
+        return self._db.execute(
+            "SELECT 1 FROM webhook_queue WHERE key = ? AND id > ? AND status IN ('pending', 'in_flight') LIMIT 1",
+            (key, entry_id)).fetchone() is not None
+
+    def task_done(self, entry_id, failed=False):
+        """Acknowledge an entry returned by get(); failed entries are retried up to max_attempts"""
+        with self._condition:
+            if failed:
+                row = self._db.execute("SELECT attempts, key, hold FROM webhook_queue WHERE id = ?",
+                                       (entry_id,)).fetchone()
+                if row is not None and row[2] and self._superseded(entry_id, row[1]):
+                    # A newer item for the key carries the latest state - drop the stale retry
+                    self._db.execute("DELETE FROM webhook_queue WHERE id = ?", (entry_id,))
+                    self.merged += 1
+                elif row is not None and row[0] < self.max_attempts:
+                    ready_at = time.time() + self.retry_delay * row[0]
+                    self._db.execute(
+                        "UPDATE webhook_queue SET status = 'pending', ready_at = ?, "
+                        "rank = ? + class_offset(priority_class) WHERE id = ?", (ready_at, ready_at, entry_id))
+                    self._condition.notify_all()
+                    return
+                else:
+                    self._db.execute("UPDATE webhook_queue SET status = 'failed' WHERE id = ?", (entry_id,))
+            else:
+                self._db.execute("DELETE FROM webhook_queue WHERE id = ?", (entry_id,))
+            self.unfinished_tasks -= 1
+            self._condition.notify_all()
+
+    def record_merged(self, count=1):
+        """Count items merged by the consumer (e.g. while a card was being processed)"""
+        with self._condition:
+            self.merged += count
+
+    def join(self):
+        """Block until every item has been processed"""
+        with self._condition:
+            while self.unfinished_tasks:
+                self._condition.wait()
+
+    def qsize(self):
+        with self._condition:
+            return self._db.execute("SELECT COUNT(*) FROM webhook_queue WHERE status = 'pending'").fetchone()[0]
+
+    def depth(self):
+        """Requests not acknowledged yet (pending, held and in flight)"""
+        with self._condition:
+            return self.unfinished_tasks
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def close(self):
+        """Checkpoint the WAL and close the database"""
+        with self._condition:
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._db.close()
+
+    def stats(self):
+        """Queue depth per status and coalescing counters"""
+        with self._condition:
+            counts = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM webhook_queue GROUP BY status").fetchall())
+            held = self._db.execute(
+                "SELECT COUNT(*) FROM webhook_queue WHERE status = 'pending' AND held = 1").fetchone()[0]
+            depths = dict(self._db.execute(
+                "SELECT priority_class, COUNT(*) FROM webhook_queue WHERE status = 'pending' "
+                "GROUP BY priority_class").fetchall())
+            return {
+                'backend': 'sqlite',
+                'pending': counts.get('pending', 0),
+                'held': held,
+                'in_flight': counts.get('in_flight', 0),
+                'failed': counts.get('failed', 0),
+                'replayed_on_start': self.replayed,
+                'merged': self.merged,
+                'window': self.window,
+                'classes': self._waits.stats(depths, self.class_offsets),
+            }
@@ -4,8 +4,8 @@ Script to register a Trello webhook for the In Progress list
 """
 
 import os
-import requests
 from dotenv import load_dotenv
+from http_utils import http_request, TRELLO_API_URL
 
 load_dotenv()
 
@@ -16,13 +16,13 @@ WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Your server's webhook URL
 
 def get_board_lists():
     """Get all lists in the board to find the In Progress list"""
-    url = f"https://api.trello.com/1/boards/{TRELLO_BOARD_ID}/lists"
+    url = f"{TRELLO_API_URL}/boards/{TRELLO_BOARD_ID}/lists"
     params = {
         "key": TRELLO_KEY,
         "token": TRELLO_TOKEN
     }
     
-    response = requests.get(url, params=params)
+    response = http_request("trello", "GET", url, params=params)
     response.raise_for_status()
     
     lists = response.json()
@@ -44,7 +44,7 @@ def find_in_progress_list(lists):
 
 def register_webhook(list_id, webhook_url):
     """Register a webhook for the specified list"""
-    url = "https://api.trello.com/1/webhooks/"
+    url = f"{TRELLO_API_URL}/webhooks/"
     
     data = {
         "key": TRELLO_KEY,
@@ -53,7 +53,7 @@ def register_webhook(list_id, webhook_url):
         "description": "Webhook for In Progress list changes"
     }
     
-    response = requests.post(url, data=data)
+    response = http_request("trello", "POST", url, data=data)
     
     if response.status_code == 200:
         webhook_data = response.json()
@@ -69,12 +69,12 @@ def register_webhook(list_id, webhook_url):
 
 def list_existing_webhooks():
     """List all existing webhooks for the board"""
-    url = f"https://api.trello.com/1/tokens/{TRELLO_TOKEN}/webhooks"
+    url = f"{TRELLO_API_URL}/tokens/{TRELLO_TOKEN}/webhooks"
     params = {
         "key": TRELLO_KEY
     }
     
-    response = requests.get(url, params=params)
+    response = http_request("trello", "GET", url, params=params)
     response.raise_for_status()
     
     webhooks = response.json()
@@ -93,13 +93,13 @@ def list_existing_webhooks():
 
 def delete_webhook(webhook_id):
     """Delete a webhook by ID"""
-    url = f"https://api.trello.com/1/webhooks/{webhook_id}"
+    url = f"{TRELLO_API_URL}/webhooks/{webhook_id}"
     params = {
         "key": TRELLO_KEY,
         "token": TRELLO_TOKEN
     }
     
-    response = requests.delete(url, params=params)
+    response = http_request("trello", "DELETE", url, params=params)
     
     if response.status_code == 200:
         print(f"✅ Webhook {webhook_id} deleted successfully")
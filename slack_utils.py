@@ -1,31 +1,168 @@
 import os
+import time
+import atexit
+import random
+import threading
+from collections import deque
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 from dotenv import load_dotenv
+from tracing import span
 
 load_dotenv()
 
 SLACK_TOKEN = os.getenv("SLACK_BOT_TOKEN")
 SLACK_CHANNEL = os.getenv("SLACK_CHANNEL")
 SLACK_LOG_CHANNEL = os.getenv("SLACK_LOG_CHANNEL")
+SLACK_API_URL = os.getenv("SLACK_API_URL", "https://slack.com/api/")  # Point at a stand-in server for load tests
 
-client = WebClient(token=SLACK_TOKEN)
+# Log sink configuration - log lines are buffered and posted in batches by a background thread
+SLACK_LOG_ASYNC = os.getenv("SLACK_LOG_ASYNC", "true").lower() == "true"
+SLACK_LOG_FLUSH_INTERVAL = float(os.getenv("SLACK_LOG_FLUSH_INTERVAL", "2"))  # Seconds between batched posts
+SLACK_LOG_BATCH_CHARS = int(os.getenv("SLACK_LOG_BATCH_CHARS", "3500"))      # Flush early once this much text is buffered
+SLACK_LOG_BUFFER_SIZE = int(os.getenv("SLACK_LOG_BUFFER_SIZE", "1000"))      # Oldest lines are dropped beyond this
+SLACK_MAX_RETRIES = int(os.getenv("SLACK_MAX_RETRIES", "5"))
+SLACK_MAX_MESSAGE_CHARS = 39000  # Slack rejects messages above 40k characters
+
+client = WebClient(token=SLACK_TOKEN, base_url=SLACK_API_URL.rstrip("/") + "/")
+
+_log_buffer = deque()
+_log_buffer_chars = 0
+_log_condition = threading.Condition()
+_log_thread = None
+_log_stats = {
+    'queued': 0,
+    'posted_lines': 0,
+    'posted_batches': 0,
+    'dropped': 0,
+    'rate_limited': 0,
+    'failed_batches': 0,
+}
+
+def _post_with_retry(channel, text):
+    """
+    Post a message, waiting out Slack rate limits and retrying transient errors with backoff.
+    Raises the last SlackApiError if every attempt fails.
+    """
+    for attempt in range(SLACK_MAX_RETRIES + 1):
+        try:
+            with span("slack chat.postMessage", channel=channel, attempt=attempt):
+                return client.chat_postMessage(channel=channel, text=text)
+        except SlackApiError as e:
+            if attempt == SLACK_MAX_RETRIES:
+                raise
+            if e.response.status_code == 429:
+                # Slack tells us how long to back off for
+                with _log_condition:
+                    _log_stats['rate_limited'] += 1
+                delay = float(e.response.headers.get("Retry-After", 1))
+            elif e.response.status_code >= 500:
+                delay = min(30, 2 ** attempt) * (0.5 + random.random())
+            else:
+                raise  # Auth/channel errors will not fix themselves
+            time.sleep(delay)
 
 def post_to_main(message: str):
     """
     Send a message to the main Slack channel (e.g., for daily summaries).
     """
     try:
-        client.chat_postMessage(channel=SLACK_CHANNEL, text=message)
+        _post_with_retry(SLACK_CHANNEL, message)
     except SlackApiError as e:
         print(f"[Slack ERROR] Failed to post to main channel: {e.response['error']}")
 
+def _take_batch():
+    """Pop as many buffered lines as fit into a single Slack message (caller holds the lock)"""
+    global _log_buffer_chars
+    batch = []
+    size = 0
+    while _log_buffer:
+        line = _log_buffer[0]
+        if batch and size + len(line) + 1 > SLACK_LOG_BATCH_CHARS:
+            break
+        _log_buffer.popleft()
+        _log_buffer_chars -= len(line)
+        batch.append(line)
+        size += len(line) + 1
+    return batch
+
+def _send_log_batch(batch):
+    """Post a batch of log lines, falling back to stdout if Slack is unavailable"""
+    text = "\n".join(batch)[:SLACK_MAX_MESSAGE_CHARS]
+    try:
+        _post_with_retry(SLACK_LOG_CHANNEL, text)
+        with _log_condition:
+            _log_stats['posted_batches'] += 1
+            _log_stats['posted_lines'] += len(batch)
+    except Exception:
+        with _log_condition:
+            _log_stats['failed_batches'] += 1
+        print(text)
+
+def _log_sink():
+    """Background thread that merges buffered log lines into batched Slack posts"""
+    while True:
+        with _log_condition:
+            # Wait for the flush interval unless the size budget fills up first
+            deadline = time.monotonic() + SLACK_LOG_FLUSH_INTERVAL
+            while _log_buffer_chars < SLACK_LOG_BATCH_CHARS:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                _log_condition.wait(remaining)
+            batch = _take_batch()
+        if batch:
+            _send_log_batch(batch)
+
+def _ensure_log_sink():
+    """Start the background log sink on first use"""
+    global _log_thread
+    if _log_thread is None:
+        with _log_condition:
+            if _log_thread is None:
+                _log_thread = threading.Thread(target=_log_sink, name="slack-log-sink", daemon=True)
+                _log_thread.start()
+
+def flush_slack_logs():
+    """Synchronously post everything still buffered (used on shutdown)"""
+    while True:
+        with _log_condition:
+            batch = _take_batch()
+        if not batch:
+            return
+        _send_log_batch(batch)
+
+def get_slack_log_stats():
+    """Counters of the Slack log sink"""
+    with _log_condition:
+        return dict(_log_stats, buffered=len(_log_buffer))
+
 def log_to_slack(message: str):
     """
     Send a log or debug message to the Slack log channel.
+    Messages are buffered and posted in batches in the background, so this never blocks on Slack.
     """
-    try:
-        client.chat_postMessage(channel=SLACK_LOG_CHANNEL, text=f"[LOG] {message}")
-    except SlackApiError as e:
-        print(message)
-        # print(f"[Slack ERROR] Failed to log to Slack: {e.response['error']}")
+    global _log_buffer_chars
+    line = f"[LOG] {message}"
+
+    if not SLACK_LOG_ASYNC:
+        try:
+            with span("slack chat.postMessage", channel=SLACK_LOG_CHANNEL):
+                client.chat_postMessage(channel=SLACK_LOG_CHANNEL, text=line)
+        except SlackApiError as e:
+            print(message)
+        return
+
+    _ensure_log_sink()
+    with _log_condition:
+        if len(_log_buffer) >= SLACK_LOG_BUFFER_SIZE:
+            dropped = _log_buffer.popleft()
+            _log_buffer_chars -= len(dropped)
+            _log_stats['dropped'] += 1
+        _log_buffer.append(line)
+        _log_buffer_chars += len(line)
+        _log_stats['queued'] += 1
+        if _log_buffer_chars >= SLACK_LOG_BATCH_CHARS:
+            _log_condition.notify()
+
+atexit.register(flush_slack_logs)
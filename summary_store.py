@@ -0,0 +1,50 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Summaries from previous daily runs, reused while a card's content is unchanged
+SUMMARY_STORE_FILE = os.getenv("SUMMARY_STORE_FILE", "summary_store.json")
+SUMMARY_COMMENT_LIMIT = 3  # Latest comments that count as card content
+
+def latest_comments(card, limit=SUMMARY_COMMENT_LIMIT):
+    """Texts of the newest comments of a card fetched with nested commentCard actions"""
+    comments = [action.get("data", {}).get("text", "") for action in card.get("actions", [])
+                if action.get("type") == "commentCard"]
+    return comments[:limit]  # Trello returns actions newest first
+
+def card_content_hash(card):
+    """Hash of everything a morning summary depends on"""
+    material = json.dumps([
+        card.get("name", ""),
+        card.get("desc", ""),
+        latest_comments(card),
+        card.get("dateLastActivity", ""),
+    ], ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+def load_summary_store(path=SUMMARY_STORE_FILE):
+    """Return {card_id: {'hash', 'summary', 'updated'}}, empty if there is no store yet"""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_summary_store(store, path=SUMMARY_STORE_FILE):
+    """Write the store atomically so a crash never leaves a truncated file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(store, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def make_entry(card, summary):
+    """Store entry for a freshly generated summary"""
+    return {
+        "hash": card_content_hash(card),
+        "summary": summary,
+        "updated": datetime.now().isoformat(timespec="seconds"),
+    }
@@ -1,36 +1,16 @@
-import os
-import requests
-import json
-from dotenv import load_dotenv
-
-load_dotenv()
-
-TRELLO_KEY = os.getenv("TRELLO_KEY")
-TRELLO_TOKEN = os.getenv("TRELLO_TOKEN")
-TRELLO_BOARD_ID = os.getenv("TRELLO_BOARD_ID")
-OUTPUT_FILE = "label_map.json"
+from label_index import LABEL_MAP_FILE, refresh_label_index, get_label_stats
 
 def sync_labels():
-    url = f"https://api.trello.com/1/boards/{TRELLO_BOARD_ID}/labels"
-    params = {
-        "key": TRELLO_KEY,
-        "token": TRELLO_TOKEN,
-        "limit": 1000  # Fetch up to 1000 labels
-    }
-
+    """Refresh the label index now and write it to label_map.json (the app also does this on its own)"""
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        labels = response.json()
-
-        label_map = {label["name"]: label["id"] for label in labels if label["name"]}
-
-        with open(OUTPUT_FILE, "w") as f:
-            json.dump(label_map, f, indent=2)
-
-        print(f"✅ Synced {len(label_map)} labels to {OUTPUT_FILE}")
-
-    except requests.exceptions.RequestException as e:
+        changed = refresh_label_index(max_age=0)
+        labels = get_label_stats()['labels']
+        if changed:
+            print(f"✅ Synced {labels} labels to {LABEL_MAP_FILE}")
+        else:
+            print(f"✅ {LABEL_MAP_FILE} already up to date ({labels} labels)")
+
+    except Exception as e:
         print(f"❌ Failed to sync labels: {e}")
 
 if __name__ == "__main__":
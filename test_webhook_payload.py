@@ -34,6 +34,9 @@ def test_update_card():
                     "id": "def456",
                     "name": "Formation Hold Position Fix",
                     "desc": "Fix the issue where formations don't maintain their positions during combat. Implement proper position holding logic and visual indicators."
+                },
+                "old": {
+                    "desc": "Fix the issue where formations don't maintain their positions during combat."
                 }
             }
         }
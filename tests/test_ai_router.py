@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+
+import ai_router
+from ai_router import AIRouter, Backend
+
+@pytest.fixture(autouse=True)
+def router_settings(monkeypatch):
+    monkeypatch.setattr(ai_router, "AI_ROUTER_HEALTH_INTERVAL", 0)
+    monkeypatch.setattr(ai_router, "AI_ROUTER_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(ai_router, "AI_ROUTER_COOLDOWN", 60)
+
+def failing(prompt, json_format):
+    raise TimeoutError("read timed out")
+
+def answering(name):
+    return lambda prompt, json_format: f"reply from {name}"
+
+def is_error(reply):
+    return reply.startswith("[ERROR")
+
+def test_least_loaded_backend_is_used():
+    first, second = Backend("first", answering("first")), Backend("second", answering("second"))
+    first.outstanding = 1
+    router = AIRouter([first, second], is_error=is_error)
+    assert router.ask("prompt") == ("reply from second", "second")
+
+def test_fails_over_to_the_next_backend():
+    router = AIRouter([Backend("down", failing), Backend("up", answering("up"))], is_error=is_error)
+    assert router.ask("prompt") == ("reply from up", "up")
+
+def test_error_reply_fails_over_without_counting_as_failure():
+    refusing = Backend("refusing", lambda prompt, json_format: "[ERROR from Ollama: model not found]")
+    router = AIRouter([refusing, Backend("up", answering("up"))], is_error=is_error)
+    assert router.ask("prompt") == ("reply from up", "up")
+    assert refusing.consecutive_failures == 0
+    assert refusing.error_replies == 1
+
+def test_overflow_is_used_when_primaries_fail():
+    router = AIRouter([Backend("down", failing)], overflow=Backend("openai", answering("openai")), is_error=is_error)
+    assert router.ask("prompt") == ("reply from openai", "openai")
+
+def test_circuit_opens_after_consecutive_failures():
+    down = Backend("down", failing)
+    router = AIRouter([down, Backend("up", answering("up"))], is_error=is_error)
+    router.ask("prompt")
+    router.ask("prompt")
+    assert down.stats(ai_router.time.monotonic())['circuit'] == "open"
+    requests_before = down.requests
+    router.ask("prompt")
+    assert down.requests == requests_before  # Skipped while the circuit is open
+
+def test_single_trial_after_the_cooldown_closes_the_circuit():
+    calls = []
+    started, release = threading.Event(), threading.Event()
+
+    def recovering(prompt, json_format):
+        calls.append(prompt)
+        started.set()
+        release.wait(5)
+        return "recovered"
+
+    backend = Backend("host", recovering)
+    backend.consecutive_failures = ai_router.AI_ROUTER_FAILURE_THRESHOLD  # Tripped, cooldown over
+    router = AIRouter([backend], is_error=is_error)
+    trial = threading.Thread(target=router.ask, args=("trial",))
+    trial.start()
+    assert started.wait(5)
+    assert router.ask("second") == ("[ERROR: No AI backend available]", None)
+    release.set()
+    trial.join()
+    assert calls == ["trial"]
+    assert not backend.half_open
+    assert backend.consecutive_failures == 0
+
+def test_request_from_before_the_circuit_opened_does_not_end_the_trial():
+    backend = Backend("host", answering("host"))
+    router = AIRouter([backend], is_error=is_error)
+    earlier = router._acquire(backend)
+    backend.consecutive_failures = ai_router.AI_ROUTER_FAILURE_THRESHOLD
+    trial = router._acquire(backend)
+    router._release(backend, earlier, 0.1, error="TimeoutError: read timed out")
+    assert backend.half_open
+    assert router._acquire(backend) is None  # Still only one trial
+    router._release(backend, trial, 0.1)
+    assert not backend.half_open
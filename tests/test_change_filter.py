@@ -0,0 +1,49 @@
+import pytest
+
+import change_filter
+from change_filter import check_webhook_relevance, forget_webhook, remember_card_state
+
+@pytest.fixture(autouse=True)
+def clean_filter(monkeypatch):
+    monkeypatch.setattr(change_filter, "CHANGE_FILTER_ENABLED", True)
+    change_filter._card_states.clear()
+    change_filter._seen_actions.clear()
+
+def update(action_id, desc, old, card_id="card1", name="Boss chest"):
+    return {'id': action_id, 'type': 'updateCard',
+            'data': {'card': {'id': card_id, 'name': name, 'desc': desc}, 'old': old}}
+
+def comment(action_id, text, card_id="card1"):
+    return {'id': action_id, 'type': 'commentCard', 'data': {'card': {'id': card_id, 'name': "Boss chest"}, 'text': text}}
+
+def test_description_change_is_accepted():
+    assert check_webhook_relevance(update("a1", "Spawn a chest", {'desc': ""})) == (True, None)
+
+def test_irrelevant_fields_are_dropped():
+    assert check_webhook_relevance(update("a1", "Spawn a chest", {'idList': "list2"})) == (False, 'irrelevant_fields')
+
+def test_context_only_change_is_dropped():
+    action = update("a1", "[Context]\nGameSystem: Dungeon\n\nSpawn a chest", {'desc': "Spawn a chest"})
+    assert check_webhook_relevance(action) == (False, 'context_only')
+
+def test_redelivered_action_is_dropped():
+    check_webhook_relevance(update("a1", "Spawn a chest", {'desc': ""}))
+    assert check_webhook_relevance(update("a1", "Spawn a chest", {'desc': ""})) == (False, 'duplicate_action')
+
+def test_processed_state_is_not_processed_again():
+    remember_card_state("card1", name="Boss chest", desc="Spawn a chest")
+    assert check_webhook_relevance(update("a2", "Spawn a chest", {'desc': "old"})) == (False, 'unchanged')
+
+def test_repeated_comment_is_accepted():
+    assert check_webhook_relevance(comment("c1", "Which tiers?"))[0]
+    assert check_webhook_relevance(comment("c2", "Which tiers?")) == (True, None)
+
+def test_redelivered_comment_is_dropped():
+    assert check_webhook_relevance(comment("c1", "Which tiers?"))[0]
+    assert check_webhook_relevance(comment("c1", "Which tiers?")) == (False, 'duplicate_action')
+
+def test_forgotten_webhook_is_accepted_when_redelivered():
+    action = comment("c1", "Which tiers?")
+    assert check_webhook_relevance(action)[0]
+    forget_webhook(action)
+    assert check_webhook_relevance(action) == (True, None)
@@ -0,0 +1,47 @@
+import pytest
+
+from message_utils import split_large_message, PART_HEADER_RESERVE
+
+def test_short_message_is_one_chunk():
+    assert split_large_message("Short reply", max_length=100) == ["Short reply"]
+
+def test_chunks_respect_the_limit_and_the_reserve():
+    message = "\n\n".join(f"Paragraph {n}. " + "Some words here. " * 20 for n in range(40))
+    chunks = split_large_message(message, max_length=1000, reserve=PART_HEADER_RESERVE)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 1000 - PART_HEADER_RESERVE for chunk in chunks)
+
+def test_no_text_is_lost():
+    message = "\n\n".join(f"Paragraph {n} with a sentence. And another one." for n in range(200))
+    chunks = split_large_message(message, max_length=500)
+    assert " ".join(chunks).split() == message.split()
+
+def test_paragraphs_are_not_broken_when_they_fit():
+    paragraphs = [f"Paragraph {n}: " + "x" * 150 for n in range(20)]
+    chunks = split_large_message("\n\n".join(paragraphs), max_length=400)
+    for paragraph in paragraphs:
+        assert any(paragraph in chunk for chunk in chunks)
+
+def test_code_blocks_are_closed_and_reopened():
+    code = "\n".join(f"    int value{n} = {n};" for n in range(200))
+    message = f"Use this:\n```cpp\n{code}\n```\nDone."
+    chunks = split_large_message(message, max_length=600)
+    assert len(chunks) > 2
+    for chunk in chunks:
+        assert chunk.count("```") % 2 == 0, chunk
+    code_chunks = [chunk for chunk in chunks if "int value" in chunk]
+    assert all("```cpp" in chunk for chunk in code_chunks)
+
+def test_list_items_stay_whole():
+    items = [f"- Step {n}: " + "do the thing " * 8 for n in range(60)]
+    chunks = split_large_message("\n".join(items), max_length=500)
+    for item in items:
+        assert any(item in chunk for chunk in chunks)
+
+def test_a_single_long_word_is_cut():
+    chunks = split_large_message("a" * 2500, max_length=1000)
+    assert [len(chunk) for chunk in chunks] == [1000, 1000, 500]
+
+def test_reserve_larger_than_the_limit_is_rejected():
+    with pytest.raises(ValueError):
+        split_large_message("text", max_length=10, reserve=10)
@@ -0,0 +1,32 @@
+from prompt_budget import estimate_tokens, trim_text, fit_sections, pick_num_ctx, MIN_SECTION_TOKENS
+
+LOG = "\n".join(f"[{n:05d}] LogTemp: Warning: Spawned actor BP_LootChest_{n} at tier {n % 5}" for n in range(2000))
+
+def test_trimmed_text_keeps_its_start_and_end():
+    trimmed = trim_text(LOG, 500)
+    assert estimate_tokens(trimmed) <= 500
+    assert trimmed.startswith("[00000]")
+    assert trimmed.endswith("BP_LootChest_1999 at tier 4")
+    assert "lines trimmed to fit the prompt" in trimmed
+
+def test_sections_within_budget_are_untouched():
+    sections = {'desc': "Spawn a chest", 'comment': "Which tiers?"}
+    assert fit_sections(sections, 1000) == (sections, [])
+
+def test_small_sections_stay_whole_and_large_ones_share_the_rest():
+    fitted, trimmed = fit_sections({'desc': LOG, 'comment': "Which tiers?"}, 1000)
+    assert trimmed == ['desc']
+    assert fitted['comment'] == "Which tiers?"
+    assert estimate_tokens(fitted['desc']) + estimate_tokens(fitted['comment']) <= 1000
+
+def test_exhausted_budget_keeps_a_minimum_per_section():
+    fitted, trimmed = fit_sections({'desc': LOG, 'comment': LOG}, -200)
+    assert trimmed == ['desc', 'comment']
+    for text in fitted.values():
+        assert 0 < estimate_tokens(text) <= MIN_SECTION_TOKENS
+
+def test_num_ctx_fits_the_prompt_and_never_shrinks():
+    assert pick_num_ctx(1500, 16384) == 2048
+    assert pick_num_ctx(5000, 16384) == 8192
+    assert pick_num_ctx(50000, 16384) == 16384
+    assert pick_num_ctx(1500, 16384, current=8192) == 8192
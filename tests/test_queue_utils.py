@@ -0,0 +1,165 @@
+import time
+import queue
+import threading
+
+import pytest
+
+from queue_utils import CoalescingQueue, PersistentQueue
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_queue(request, tmp_path):
+    """Factory for a queue of the parametrized backend"""
+    def make(**kwargs):
+        if request.param == "sqlite":
+            return PersistentQueue(str(tmp_path / "queue.sqlite3"), **kwargs)
+        return CoalescingQueue(**kwargs)
+    return make
+
+def drain(work_queue):
+    """Items of every ready entry, acknowledged"""
+    items = []
+    while True:
+        try:
+            entry_id, item = work_queue.get(timeout=0)
+        except queue.Empty:
+            return items
+        items.append(list(item))
+        work_queue.task_done(entry_id)
+
+def test_items_come_out_in_order(make_queue):
+    work_queue = make_queue()
+    for n in range(3):
+        work_queue.put(["item", n], key=f"card{n}")
+    assert drain(work_queue) == [["item", 0], ["item", 1], ["item", 2]]
+    assert work_queue.depth() == 0
+
+def test_held_updates_for_a_card_merge_into_the_latest(make_queue):
+    work_queue = make_queue(window=0.05, max_delay=1)
+    for n in range(3):
+        work_queue.put(["update", n], key="card1", hold=True)
+    assert work_queue.depth() == 1
+    entry_id, item = work_queue.get(timeout=1)
+    assert list(item) == ["update", 2]
+    work_queue.task_done(entry_id)
+    assert work_queue.stats()['merged'] == 2
+
+def test_held_update_waits_for_the_quiet_window(make_queue):
+    work_queue = make_queue(window=0.3, max_delay=1)
+    work_queue.put(["update"], key="card1", hold=True)
+    with pytest.raises(queue.Empty):
+        work_queue.get(timeout=0.05)
+    entry_id, item = work_queue.get(timeout=1)
+    assert list(item) == ["update"]
+
+def test_comment_releases_a_held_update_right_away(make_queue):
+    work_queue = make_queue(window=10, max_delay=10)
+    work_queue.put(["update"], key="card1", hold=True)
+    work_queue.put(["comment"], key="card1")
+    entry_id, item = work_queue.get(timeout=0.5)
+    assert list(item) == ["comment"]
+    assert work_queue.depth() == 1
+
+def test_max_delay_caps_the_wait(make_queue):
+    work_queue = make_queue(window=0.2, max_delay=0.3)
+    stop = threading.Event()
+
+    def keep_editing():
+        n = 0
+        while not stop.is_set():
+            work_queue.put(["update", n], key="card1", hold=True)
+            n += 1
+            time.sleep(0.05)
+
+    editor = threading.Thread(target=keep_editing)
+    started = time.time()
+    editor.start()
+    try:
+        entry_id, item = work_queue.get(timeout=2)
+    finally:
+        stop.set()
+        editor.join()
+    assert time.time() - started < 0.6
+
+def test_failed_entry_is_retried_until_max_attempts(make_queue):
+    work_queue = make_queue(max_attempts=2, retry_delay=0)
+    work_queue.put(["comment"], key="card1")
+    for _ in range(2):
+        entry_id, item = work_queue.get(timeout=1)
+        work_queue.task_done(entry_id, failed=True)
+    with pytest.raises(queue.Empty):
+        work_queue.get(timeout=0.05)
+    assert work_queue.depth() == 0
+    assert work_queue.stats()['failed'] == 1
+
+def test_failed_update_is_dropped_when_a_newer_one_is_queued(make_queue):
+    work_queue = make_queue(retry_delay=0)
+    work_queue.put(["update", 1], key="card1", hold=True)
+    entry_id, item = work_queue.get(timeout=1)
+    work_queue.put(["update", 2], key="card1", hold=True)
+    work_queue.task_done(entry_id, failed=True)
+    assert drain(work_queue) == [["update", 2]]
+    assert work_queue.depth() == 0
+
+def test_failed_comment_is_retried_despite_a_newer_update(make_queue):
+    work_queue = make_queue(retry_delay=0)
+    work_queue.put(["comment"], key="card1")
+    entry_id, item = work_queue.get(timeout=1)
+    work_queue.put(["update"], key="card1", hold=True)
+    work_queue.task_done(entry_id, failed=True)
+    assert sorted(item[0] for item in drain(work_queue)) == ["comment", "update"]
+
+def test_acknowledged_entries_are_gone_after_a_restart(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    work_queue = PersistentQueue(path)
+    work_queue.put(["comment"], key="card1")
+    entry_id, item = work_queue.get(timeout=1)
+    work_queue.task_done(entry_id)
+    work_queue.close()
+    restarted = PersistentQueue(path)
+    assert restarted.depth() == 0
+    assert restarted.replayed == 0
+
+def test_unacknowledged_entries_are_replayed_after_a_crash(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    work_queue = PersistentQueue(path)
+    work_queue.put(["comment", 1], key="card1")
+    work_queue.put(["comment", 2], key="card2")
+    work_queue.get(timeout=1)  # In flight when the process dies, never acknowledged
+    restarted = PersistentQueue(path)
+    assert restarted.replayed == 1
+    assert restarted.depth() == 2
+    assert sorted(drain(restarted)) == [["comment", 1], ["comment", 2]]
+
+def test_entries_failing_every_attempt_are_kept_as_failed(tmp_path):
+    path = str(tmp_path / "queue.sqlite3")
+    work_queue = PersistentQueue(path, max_attempts=1)
+    work_queue.put(["comment"], key="card1")
+    entry_id, item = work_queue.get(timeout=1)
+    work_queue.task_done(entry_id, failed=True)
+    work_queue.close()
+    assert PersistentQueue(path).stats()['failed'] == 1
+
+PRIORITIES = {'commentCard': 0, 'updateCard': 30}
+
+def test_comments_go_ahead_of_ready_updates(make_queue):
+    work_queue = make_queue(class_offsets=PRIORITIES)
+    work_queue.put(["update"], key="card1", priority_class='updateCard')
+    work_queue.put(["comment"], key="card2", priority_class='commentCard')
+    assert drain(work_queue) == [["comment"], ["update"]]
+
+def test_updates_age_past_newer_comments(make_queue):
+    work_queue = make_queue(class_offsets={'commentCard': 0, 'updateCard': 0.1})
+    work_queue.put(["update"], key="card1", priority_class='updateCard')
+    time.sleep(0.15)  # Waited longer than the offset between the classes
+    work_queue.put(["comment"], key="card2", priority_class='commentCard')
+    assert drain(work_queue) == [["update"], ["comment"]]
+
+def test_stats_per_priority_class(make_queue):
+    work_queue = make_queue(class_offsets=PRIORITIES)
+    work_queue.put(["update"], key="card1", priority_class='updateCard')
+    work_queue.put(["comment"], key="card2", priority_class='commentCard')
+    entry_id, item = work_queue.get(timeout=1)
+    classes = work_queue.stats()['classes']
+    assert classes['commentCard']['dequeued'] == 1
+    assert classes['updateCard']['pending'] == 1
+    assert classes['updateCard']['offset'] == 30
@@ -0,0 +1,87 @@
+import pytest
+
+import trello_utils
+import trello_writer
+from trello_writer import queue_description_update, queue_labels, queue_comment, after_card_writes, flush_trello_writes
+
+class FakeTrello:
+    """Records the calls the writer makes instead of sending them"""
+
+    def __init__(self, card_labels=None):
+        self.calls = []
+        self.card_labels = card_labels or {}
+        self.fail = False
+
+    def update_card(self, card_id, desc=None, label_ids=None):
+        self.calls.append(("put", card_id, desc, label_ids))
+        if self.fail:
+            raise RuntimeError("500 Server Error")
+
+    def fetch_card_data(self, card_id):
+        self.calls.append(("get", card_id))
+        return {'id': card_id, 'idLabels': ["id-Old"]}
+
+    def comment_on_card(self, card_id, message):
+        self.calls.append(("comment", card_id, message))
+
+@pytest.fixture
+def trello(monkeypatch):
+    fake = FakeTrello(card_labels={"card1": ["id-Dungeon"]})
+    monkeypatch.setattr(trello_writer, "TRELLO_WRITE_BEHIND", True)
+    monkeypatch.setattr(trello_writer, "TRELLO_WRITE_DELAY", 0.05)
+    monkeypatch.setattr(trello_writer, "update_card", fake.update_card)
+    monkeypatch.setattr(trello_writer, "comment_on_card", fake.comment_on_card)
+    monkeypatch.setattr(trello_writer, "label_ids_for", lambda names: [f"id-{name}" for name in names])
+    monkeypatch.setattr(trello_writer, "update_cached_card", lambda card_id, **fields: None)
+    monkeypatch.setattr(trello_utils, "get_cached_label_ids", lambda card_id: fake.card_labels.get(card_id))
+    monkeypatch.setattr(trello_utils, "fetch_card_data", fake.fetch_card_data)
+    yield fake
+    assert flush_trello_writes(timeout=5)
+
+def test_writes_to_a_card_are_merged(trello):
+    queue_description_update("card1", "first")
+    queue_labels("card1", ["Dungeon", "Loot"])
+    queue_description_update("card1", "second")
+    queue_labels("card1", ["Loot"])
+    queue_comment("card1", "[🤖 AI Reply]\nDo this")
+    assert flush_trello_writes(timeout=5)
+    assert trello.calls == [
+        ("put", "card1", "second", ["id-Dungeon", "id-Loot"]),  # Dungeon is already on the card
+        ("comment", "card1", "[🤖 AI Reply]\nDo this"),
+    ]
+
+def test_labels_keep_the_current_labels_of_the_card(trello):
+    queue_labels("card2", ["UI"])  # Not in the snapshot
+    assert flush_trello_writes(timeout=5)
+    assert trello.calls == [("get", "card2"), ("put", "card2", None, ["id-Old", "id-UI"])]
+
+def test_labels_the_card_already_has_are_not_written(trello):
+    queue_labels("card1", ["Dungeon"])
+    queue_comment("card1", "reply")
+    assert flush_trello_writes(timeout=5)
+    assert trello.calls == [("comment", "card1", "reply")]
+
+def test_callback_runs_after_the_writes_are_sent(trello):
+    results = []
+    queue_comment("card1", "reply")
+    after_card_writes("card1", results.append)
+    assert results == []
+    assert flush_trello_writes(timeout=5)
+    assert results == [True]
+
+def test_failed_write_is_reported_to_the_callback(trello):
+    trello.fail = True
+    failed_before = trello_writer.get_write_stats()['failed_cards']
+    results = []
+    queue_description_update("card1", "desc")
+    queue_comment("card1", "reply")
+    after_card_writes("card1", results.append)
+    assert flush_trello_writes(timeout=5)
+    assert results == [False]
+    assert ("comment", "card1", "reply") not in trello.calls
+    assert trello_writer.get_write_stats()['failed_cards'] == failed_before + 1
+
+def test_callback_runs_right_away_without_pending_writes(trello):
+    results = []
+    after_card_writes("card3", results.append)
+    assert results == [True]
@@ -0,0 +1,216 @@
+"""
+Opt-in request tracing: which part of handling a card (Trello, Ollama, OpenAI, Slack) took the time.
+
+A trace id is created when a webhook is accepted and travels with it through the queue. The
+worker opens the trace with trace(); span() blocks inside it (HTTP calls, AI requests, ...)
+are recorded with their parent, duration and attributes, and the finished trace is appended
+to TRACE_FILE as one JSON object per span. With TRACE_PROFILER=true the worker thread is also
+sampled while the trace is open and the hottest stacks are written as a "profile" record.
+
+Disabled (the default), span() and trace() return a shared no-op object after one check.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import threading
+from collections import Counter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))           # Share of webhooks that are traced
+TRACE_PROFILER = os.getenv("TRACE_PROFILER", "false").lower() == "true"  # Sample the stacks of traced threads
+TRACE_PROFILER_INTERVAL = float(os.getenv("TRACE_PROFILER_INTERVAL", "0.005"))  # Seconds between samples
+TRACE_PROFILE_TOP = 30  # Stacks kept per profile record
+
+_local = threading.local()
+_export_lock = threading.Lock()
+_export_file = None
+
+class _NoopSpan:
+    """Stand-in when nothing is traced"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+_NOOP = _NoopSpan()
+
+class _Span:
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = None
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = self.trace.stack
+        self.parent_id = stack[-1].span_id if stack else None
+        stack.append(self)
+        self.start = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        self.trace.stack.pop()
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc}"[:300]
+        self.trace.records.append({
+            'type': 'span',
+            'trace_id': self.trace.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': round(self.start, 6),
+            'duration_ms': round(duration * 1000, 3),
+            'thread': threading.current_thread().name,
+            'attrs': self.attrs,
+            'error': self.error,
+        })
+        return False
+
+class _Trace:
+    """Spans of one trace collected on the current thread, written out when its root span ends"""
+
+    def __init__(self, trace_id, name, attrs):
+        self.trace_id = trace_id
+        self.stack = []
+        self.records = []
+        self.root = _Span(self, name, attrs)
+        self.samples = None
+
+    def __enter__(self):
+        _local.trace = self
+        if TRACE_PROFILER:
+            self.samples = _profiler.watch(threading.get_ident())
+        return self.root.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.root.__exit__(exc_type, exc, tb)
+        _local.trace = None
+        if self.samples is not None:
+            _profiler.unwatch(threading.get_ident())
+            self.records.append({
+                'type': 'profile',
+                'trace_id': self.trace_id,
+                'interval_ms': TRACE_PROFILER_INTERVAL * 1000,
+                'samples': sum(self.samples.values()),
+                'stacks': dict(self.samples.most_common(TRACE_PROFILE_TOP)),
+            })
+        _export(self.records)
+        return False
+
+def new_trace_id():
+    """A fresh trace id for an incoming webhook, or None when this one is not traced"""
+    if not TRACING_ENABLED or random.random() >= TRACE_SAMPLE_RATE:
+        return None
+    return uuid.uuid4().hex
+
+def current_trace_id():
+    """Trace id of the trace open on this thread (to hand work to another thread), or None"""
+    if not TRACING_ENABLED:
+        return None
+    trace = getattr(_local, 'trace', None)
+    return trace.trace_id if trace is not None else None
+
+def trace(name, trace_id, **attrs):
+    """Open a trace (root span) on this thread; a no-op without a trace id or when one is already open"""
+    if not TRACING_ENABLED or trace_id is None or getattr(_local, 'trace', None) is not None:
+        return _NOOP
+    return _Trace(trace_id, name, attrs)
+
+def span(name, **attrs):
+    """Time a block as a child span of the current trace; a no-op outside of a trace"""
+    if not TRACING_ENABLED:
+        return _NOOP
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        return _NOOP
+    return _Span(trace, name, attrs)
+
+def record_span(trace_id, name, start, end, **attrs):
+    """Write a span measured elsewhere (e.g. the time a webhook spent in the queue)"""
+    if not TRACING_ENABLED or trace_id is None:
+        return
+    _export([{
+        'type': 'span',
+        'trace_id': trace_id,
+        'span_id': uuid.uuid4().hex[:16],
+        'parent_id': None,
+        'name': name,
+        'start': round(start, 6),
+        'duration_ms': round((end - start) * 1000, 3),
+        'thread': threading.current_thread().name,
+        'attrs': attrs,
+        'error': None,
+    }])
+
+def _export(records):
+    """Append records to TRACE_FILE, one JSON object per line"""
+    global _export_file
+    lines = "".join(json.dumps(record, default=str) + "\n" for record in records)
+    with _export_lock:
+        try:
+            if _export_file is None:
+                _export_file = open(TRACE_FILE, "a", encoding="utf-8")
+            _export_file.write(lines)
+            _export_file.flush()
+        except OSError as e:
+            print(f"⚠️ Could not write traces to {TRACE_FILE}: {e}")
+
+class _Profiler:
+    """Samples the stacks of watched threads from one background thread"""
+
+    def __init__(self):
+        self._watched = {}  # thread ident -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, ident):
+        samples = Counter()
+        with self._lock:
+            self._watched[ident] = samples
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-profiler", daemon=True)
+                self._thread.start()
+        return samples
+
+    def unwatch(self, ident):
+        with self._lock:
+            self._watched.pop(ident, None)
+
+    def _run(self):
+        while True:
+            time.sleep(TRACE_PROFILER_INTERVAL)
+            with self._lock:  # Held while sampling, so nothing is counted after unwatch()
+                if not self._watched:
+                    continue
+                frames = sys._current_frames()
+                for ident, samples in self._watched.items():
+                    frame = frames.get(ident)
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                        frame = frame.f_back
+                    if stack:
+                        samples[";".join(reversed(stack))] += 1
+
+_profiler = _Profiler()
@@ -1,7 +1,11 @@
 import os
 import json
-import requests
 from dotenv import load_dotenv
+from http_utils import http_request, TRELLO_API_URL
+from board_snapshot import BOARD_SNAPSHOT_ENABLED, get_card, get_cached_label_ids, put_card, update_cached_card
+from label_index import resolve_label_ids
+from message_utils import split_large_message, PART_HEADER_RESERVE
+from metrics import stage_timer
 
 load_dotenv()
 
@@ -10,7 +14,6 @@ TRELLO_TOKEN = os.getenv("TRELLO_TOKEN")
 TRELLO_BOARD_ID = os.getenv("TRELLO_BOARD_ID")
 MOCK_TRELLO = os.getenv("MOCK_TRELLO", "false").lower() == "true"
 
-LABEL_MAP_FILE = "label_map.json"
 MOCK_CARDS = {
     "abc123": "mock_card_dungeon.json",
     "def456": "mock_card_battle.json",
@@ -18,14 +21,6 @@ MOCK_CARDS = {
     "foo123": "mock_card_character_rotation.json"
 }
 
-# Load label map if available
-LABELS_BY_NAME = {}
-try:
-    with open(LABEL_MAP_FILE, "r") as f:
-        LABELS_BY_NAME = json.load(f)
-except FileNotFoundError:
-    print("⚠️ Warning: label_map.json not found. Run sync_labels.py first.")
-
 def fetch_card_data(card_id):
     if MOCK_TRELLO:
         file = MOCK_CARDS.get(card_id)
@@ -34,41 +29,62 @@ def fetch_card_data(card_id):
         with open(f"mock_data/{file}", "r") as f:
             return json.load(f)
 
-    url = f"https://api.trello.com/1/cards/{card_id}"
-    params = {
-        "key": TRELLO_KEY,
-        "token": TRELLO_TOKEN,
-        "fields": "name,desc,url,idList"
-    }
-    response = requests.get(url, params=params)
-    response.raise_for_status()
-    return response.json()
+    with stage_timer("fetch_card_data", provider="trello") as stage:
+        # Served from the board snapshot when possible, a GET per card otherwise
+        if BOARD_SNAPSHOT_ENABLED:
+            card = get_card(card_id)
+            if card is not None:
+                stage['outcome'] = "cached"
+                return card
 
-def fetch_cards_from_list(list_id):
+        url = f"{TRELLO_API_URL}/cards/{card_id}"
+        params = {
+            "key": TRELLO_KEY,
+            "token": TRELLO_TOKEN,
+            "fields": "name,desc,url,idList,idLabels"
+        }
+        response = http_request("trello", "GET", url, params=params)
+        response.raise_for_status()
+        card = response.json()
+        if BOARD_SNAPSHOT_ENABLED:
+            put_card(card)
+        return card
+
+def fetch_cards_from_list(list_id, fields=None, comments_limit=0):
+    """
+    Fetch the cards of a list. `fields` limits the card fields returned (comma separated),
+    `comments_limit` > 0 nests the newest comments as card["actions"].
+    """
     if MOCK_TRELLO:
         with open("mock_data/mock_list_cards.json", "r") as f:
             return json.load(f)
 
-    url = f"https://api.trello.com/1/lists/{list_id}/cards"
+    url = f"{TRELLO_API_URL}/lists/{list_id}/cards"
     params = {
         "key": TRELLO_KEY,
         "token": TRELLO_TOKEN
     }
-    response = requests.get(url, params=params)
+    if fields:
+        params["fields"] = fields
+    if comments_limit:
+        params["actions"] = "commentCard"
+        params["actions_limit"] = comments_limit
+    response = http_request("trello", "GET", url, params=params)
     response.raise_for_status()
     return response.json()
 
 def comment_on_card(card_id, message):
-    url = f"https://api.trello.com/1/cards/{card_id}/actions/comments"
+    url = f"{TRELLO_API_URL}/cards/{card_id}/actions/comments"
     
-    # Check message length - if it's very large, split into multiple comments
-    if len(message) > 8000:  # Trello has limits around 10k characters
-        split_comments = split_large_message(message)
-        for i, comment_part in enumerate(split_comments, 1):
-            comment_text = f"[Part {i}/{len(split_comments)}]\n{comment_part}"
-            _post_single_comment(url, comment_text)
-    else:
-        _post_single_comment(url, message)
+    with stage_timer("comment_on_card", provider="trello"):
+        # Check message length - if it's very large, split into multiple comments
+        if len(message) > 8000:  # Trello has limits around 10k characters
+            split_comments = split_large_message(message, reserve=PART_HEADER_RESERVE)
+            for i, comment_part in enumerate(split_comments, 1):
+                comment_text = f"[Part {i}/{len(split_comments)}]\n{comment_part}"
+                _post_single_comment(url, comment_text)
+        else:
+            _post_single_comment(url, message)
 
 def _post_single_comment(url, message):
     """Helper function to post a single comment"""
@@ -81,7 +97,7 @@ def _post_single_comment(url, message):
         data = {
             "text": message
         }
-        response = requests.post(url, params=params, data=data)
+        response = http_request("trello", "POST", url, params=params, data=data)
     else:
         # For smaller messages, use query params (more efficient)
         params = {
@@ -89,74 +105,49 @@ def _post_single_comment(url, message):
             "token": TRELLO_TOKEN,
             "text": message
         }
-        response = requests.post(url, params=params)
+        response = http_request("trello", "POST", url, params=params)
     
     response.raise_for_status()
 
-def split_large_message(message, max_length=7000):
-    """Split a large message into smaller chunks"""
-    if len(message) <= max_length:
-        return [message]
-    
-    # Try to split on paragraph breaks first
-    paragraphs = message.split('\n\n')
-    chunks = []
-    current_chunk = ""
-    
-    for paragraph in paragraphs:
-        if len(current_chunk) + len(paragraph) + 2 <= max_length:
-            current_chunk += (paragraph + '\n\n')
-        else:
-            if current_chunk:
-                chunks.append(current_chunk.strip())
-            current_chunk = paragraph + '\n\n'
-    
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-    
-    # If still too large, split on sentences
-    if any(len(chunk) > max_length for chunk in chunks):
-        new_chunks = []
-        for chunk in chunks:
-            if len(chunk) <= max_length:
-                new_chunks.append(chunk)
-            else:
-                sentences = chunk.split('. ')
-                current_sentence_chunk = ""
-                for sentence in sentences:
-                    if len(current_sentence_chunk) + len(sentence) + 2 <= max_length:
-                        current_sentence_chunk += sentence + '. '
-                    else:
-                        if current_sentence_chunk:
-                            new_chunks.append(current_sentence_chunk.strip())
-                        current_sentence_chunk = sentence + '. '
-                if current_sentence_chunk:
-                    new_chunks.append(current_sentence_chunk.strip())
-        chunks = new_chunks
-    
-    return chunks
-
 def update_card_description(card_id, new_desc):
-    url = f"https://api.trello.com/1/cards/{card_id}"
+    update_card(card_id, desc=new_desc)
+
+def update_card(card_id, desc=None, label_ids=None):
+    """Write the description and/or the full label set of a card with a single PUT"""
+    url = f"{TRELLO_API_URL}/cards/{card_id}"
     params = {
         "key": TRELLO_KEY,
         "token": TRELLO_TOKEN
     }
-    data = {
-        "desc": new_desc
-    }
-    response = requests.put(url, params=params, data=data)
-    response.raise_for_status()
+    data = {}
+    if desc is not None:
+        data["desc"] = desc
+    if label_ids is not None:
+        data["idLabels"] = ",".join(label_ids)
+    # A combined write is counted as a description update
+    with stage_timer("update_card_description" if desc is not None else "set_card_labels", provider="trello"):
+        response = http_request("trello", "PUT", url, params=params, data=data)
+        response.raise_for_status()
+    # Our own write is filtered out before the queue, so keep the snapshot in step here
+    changes = {"desc": desc, "idLabels": label_ids}
+    update_cached_card(card_id, **{field: value for field, value in changes.items() if value is not None})
+
+def label_ids_for(label_names):
+    """Trello label IDs for AI-produced tags (fuzzy matched, missing labels are created)"""
+    return resolve_label_ids(label_names)
+
+def merge_card_label_ids(card_id, label_ids):
+    """
+    The card's current label IDs followed by those of label_ids it does not have yet, for a
+    single idLabels write that keeps its labels. None when the card already has all of them.
+    """
+    current = get_cached_label_ids(card_id)
+    if current is None:
+        current = fetch_card_data(card_id).get("idLabels", [])
+    new_ids = [label_id for label_id in label_ids if label_id not in current]
+    return current + new_ids if new_ids else None
 
 def set_card_labels(card_id, labels_to_add):
-    url = f"https://api.trello.com/1/cards/{card_id}/idLabels"
-    for label_name in labels_to_add:
-        label_id = LABELS_BY_NAME.get(label_name)
-        if label_id:
-            response = requests.post(url, params={
-                "key": TRELLO_KEY,
-                "token": TRELLO_TOKEN,
-                "value": label_id
-            })
-            if response.status_code != 200:
-                print(f"⚠️ Failed to apply label: {label_name}")
+    label_ids = merge_card_label_ids(card_id, label_ids_for(labels_to_add))
+    if label_ids is not None:
+        update_card(card_id, label_ids=label_ids)
@@ -0,0 +1,165 @@
+import os
+import time
+import atexit
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from trello_utils import update_card, merge_card_label_ids, label_ids_for, comment_on_card
+from board_snapshot import update_cached_card
+from slack_utils import log_to_slack
+from tracing import current_trace_id, trace
+
+load_dotenv()
+
+# Write-behind queue for Trello mutations - workers hand off writes and move on to the next card
+TRELLO_WRITE_BEHIND = os.getenv("TRELLO_WRITE_BEHIND", "true").lower() == "true"
+TRELLO_WRITE_DELAY = float(os.getenv("TRELLO_WRITE_DELAY", "0.5"))  # Seconds to collect writes per card
+TRELLO_FLUSH_TIMEOUT = float(os.getenv("TRELLO_FLUSH_TIMEOUT", "30"))  # Max seconds to flush on shutdown
+
+_pending = OrderedDict()  # card_id -> {'desc', 'labels', 'comments', 'since', 'trace_id', 'callbacks'}, oldest first
+_in_flight = 0
+_in_flight_cards = {}     # card_id -> writes being sent right now
+_flush_now = False
+_write_condition = threading.Condition()
+_write_thread = None
+_write_stats = {
+    'queued': 0,
+    'merged': 0,
+    'flushed_cards': 0,
+    'failed_cards': 0,
+}
+
+def _new_writes():
+    # The flusher continues the trace of the webhook that produced the writes
+    return {'desc': None, 'labels': [], 'comments': [], 'since': time.monotonic(), 'trace_id': current_trace_id(),
+            'callbacks': []}
+
+def _apply_writes(card_id, writes):
+    """Send the collected writes of one card: the description and labels in one PUT, then the comments"""
+    # The label set is the card's current labels (kept current by label webhooks) plus the new ones
+    label_ids = merge_card_label_ids(card_id, label_ids_for(writes['labels'])) if writes['labels'] else None
+    if writes['desc'] is not None or label_ids is not None:
+        update_card(card_id, desc=writes['desc'], label_ids=label_ids)
+    for message in writes['comments']:
+        comment_on_card(card_id, message)
+
+def _apply_safely(card_id, writes):
+    try:
+        with trace("trello_write_behind", writes['trace_id'], card_id=card_id):
+            _apply_writes(card_id, writes)
+        ok = True
+    except Exception as e:
+        ok = False
+        log_to_slack(f"❌ Trello write failed for card {card_id}: {e}")
+    with _write_condition:
+        _write_stats['flushed_cards' if ok else 'failed_cards'] += 1
+    for callback in writes['callbacks']:
+        callback(ok)
+
+def _write_flusher():
+    """Background thread that sends the writes of each card once its collection delay is over"""
+    global _in_flight
+    while True:
+        with _write_condition:
+            while True:
+                if _pending:
+                    card_id, writes = next(iter(_pending.items()))
+                    remaining = 0 if _flush_now else writes['since'] + TRELLO_WRITE_DELAY - time.monotonic()
+                    if remaining <= 0:
+                        del _pending[card_id]
+                        _in_flight_cards[card_id] = writes
+                        _in_flight += 1
+                        break
+                    _write_condition.wait(remaining)
+                else:
+                    _write_condition.wait()
+        try:
+            _apply_safely(card_id, writes)
+        finally:
+            with _write_condition:
+                del _in_flight_cards[card_id]
+                _in_flight -= 1
+                _write_condition.notify_all()
+
+def _ensure_write_thread():
+    """Start the background flusher on first use"""
+    global _write_thread
+    if _write_thread is None:
+        with _write_condition:
+            if _write_thread is None:
+                _write_thread = threading.Thread(target=_write_flusher, name="trello-writer", daemon=True)
+                _write_thread.start()
+
+def _queue_write(card_id, desc=None, labels=(), comment=None):
+    """Merge a write into the pending writes of a card, or send it right away without write-behind"""
+    if not TRELLO_WRITE_BEHIND:
+        writes = _new_writes()
+        writes.update(desc=desc, labels=list(labels), comments=[comment] if comment else [])
+        _apply_writes(card_id, writes)
+        return
+
+    _ensure_write_thread()
+    with _write_condition:
+        writes = _pending.get(card_id)
+        if writes is None:
+            writes = _pending[card_id] = _new_writes()
+        elif desc is not None and writes['desc'] is not None:
+            _write_stats['merged'] += 1  # Saved a PUT (repeated description)
+        if desc is not None:
+            writes['desc'] = desc
+        writes['labels'].extend(label for label in labels if label not in writes['labels'])
+        if comment:
+            writes['comments'].append(comment)
+        _write_stats['queued'] += 1
+        _write_condition.notify_all()
+
+def queue_description_update(card_id, new_desc):
+    """Set the card description (repeated writes to the same card collapse into the last one)"""
+    update_cached_card(card_id, desc=new_desc)  # The next webhook for this card must already see it
+    _queue_write(card_id, desc=new_desc)
+
+def queue_labels(card_id, label_names):
+    """Add labels to the card (labels it already has or that are already queued are skipped)"""
+    _queue_write(card_id, labels=label_names)
+
+def queue_comment(card_id, message):
+    """Post a comment after the card's description and labels are written"""
+    _queue_write(card_id, comment=message)
+
+def after_card_writes(card_id, callback):
+    """
+    Call callback(ok) once the writes queued so far for a card are sent, ok=False if any failed.
+    Runs right away (ok=True) when nothing is pending, e.g. without write-behind.
+    """
+    with _write_condition:
+        writes = _pending.get(card_id) or _in_flight_cards.get(card_id)
+        if writes is not None:
+            writes['callbacks'].append(callback)
+            return
+    callback(True)
+
+def flush_trello_writes(timeout=TRELLO_FLUSH_TIMEOUT):
+    """Send every pending write now and wait until they are done (used on shutdown)"""
+    global _flush_now
+    if _write_thread is None:
+        return True
+    deadline = time.monotonic() + timeout
+    with _write_condition:
+        _flush_now = True
+        _write_condition.notify_all()
+        try:
+            while _pending or _in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                _write_condition.wait(remaining)
+            return True
+        finally:
+            _flush_now = False
+
+def get_write_stats():
+    """Counters of the Trello write-behind queue"""
+    with _write_condition:
+        return dict(_write_stats, enabled=TRELLO_WRITE_BEHIND, pending_cards=len(_pending), in_flight=_in_flight)
+
+atexit.register(flush_trello_writes)